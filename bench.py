@@ -0,0 +1,376 @@
+import gzip, json, os, platform, random, shutil, tarfile, tempfile, time, zipfile
+from config.settings import BENCH_SCALE_MB, BENCH_REPEAT, BENCH_TOLERANCE
+from utils.standin import serve_http, serve_ftp
+
+# Synthetic sources, named like the real ones so the same code paths (primary
+# assembly handling, *.gtf patterns, goldenPath layout) are taken.
+GENOME = "Bench_genome.BENCH.dna.primary_assembly.fa.gz"
+GTF = "Bench_genome.BENCH.110.gtf.gz"
+LNC_ZIP = "BENCH_lncRNA.gtf.zip"
+TRNA_TAR = "benchAsm-tRNAs.tar.gz"
+ASSEMBLY = "benchAsm"
+TABLES = ["gap", "cytoBand", "rmsk"]
+CHAIN = "liftover.chain"
+BED = "enhancers.bed"
+
+_BASES = bytes.maketrans(bytes(range(256)), b"ACGT" * 64)
+
+# ---- synthetic data ----
+
+def make_genome(path, size_mb, nchrom=5, seed=1):
+    """Gzipped Ensembl-style FASTA with about `size_mb` MB of sequence; returns the chromosome length."""
+    rng = random.Random(seed)
+    length = size_mb * 1_000_000 // nchrom
+    block = 60 * 16384
+    with gzip.open(path, "wb", compresslevel=6) as out:
+        for c in range(1, nchrom + 1):
+            out.write(f">{c} dna:primary_assembly primary_assembly:BENCH:{c}:1:{length}:1 REF\n".encode())
+            for offset in range(0, length, block):
+                seq = rng.randbytes(min(block, length - offset)).translate(_BASES)
+                out.write(b"\n".join(seq[i:i + 60] for i in range(0, len(seq), 60)) + b"\n")
+    return length
+
+def make_gtf(path, n_genes, nchrom=5, length=1_000_000, seed=2):
+    """GTF with a gene, a transcript and two exons per gene (gzipped if `path` ends in .gz)."""
+    rng = random.Random(seed)
+    with (gzip.open(path, "wt") if path.endswith(".gz") else open(path, "w")) as out:
+        for g in range(n_genes):
+            chrom, start = rng.randint(1, nchrom), rng.randint(1, max(1, length - 20000))
+            end = start + rng.randint(2000, 19000)
+            gene = f'gene_id "BENCHG{g:08d}"; gene_name "bench{g}"; gene_biotype "protein_coding";'
+            tx = gene + f' transcript_id "BENCHT{g:08d}";'
+            mid = (start + end) // 2
+            out.write(f"{chrom}\tbench\tgene\t{start}\t{end}\t.\t+\t.\t{gene}\n")
+            out.write(f"{chrom}\tbench\ttranscript\t{start}\t{end}\t.\t+\t.\t{tx}\n")
+            out.write(f"{chrom}\tbench\texon\t{start}\t{mid - 500}\t.\t+\t.\t{tx} exon_number \"1\";\n")
+            out.write(f"{chrom}\tbench\texon\t{mid + 500}\t{end}\t.\t+\t.\t{tx} exon_number \"2\";\n")
+
+def make_table(path, table, n_rows, nchrom=5, length=1_000_000, seed=3):
+    """Gzipped UCSC database table in the column layout of `table` (gap, cytoBand or rmsk)."""
+    rng = random.Random(seed)
+    with gzip.open(path, "wt") as out:
+        for i in range(n_rows):
+            chrom, start = f"chr{rng.randint(1, nchrom)}", rng.randint(0, length - 5000)
+            end, bin_ = start + rng.randint(10, 5000), rng.randint(585, 4680)
+            if table == "cytoBand":  # chrom, chromStart, chromEnd, name, gieStain
+                out.write(f"{chrom}\t{start}\t{end}\tp{i}\tgneg\n")
+            elif table == "rmsk":  # bin, swScore, milliDiv/Del/Ins, genoName, genoStart, genoEnd, genoLeft, strand, rep*...
+                out.write(f"{bin_}\t{rng.randint(200, 5000)}\t{rng.randint(0, 300)}\t0\t0\t{chrom}\t{start}\t{end}"
+                          f"\t-{length - end}\t{rng.choice('+-')}\t(CA)n\tSimple_repeat\tSimple_repeat\t1\t{end - start}\t0\t{i}\n")
+            else:  # gap: bin, chrom, chromStart, chromEnd, ix, n, size, type, bridge
+                out.write(f"{bin_}\t{chrom}\t{start}\t{end}\t{i}\tN\t{end - start}\tscaffold\tyes\n")
+
+def make_chain(path, bed_path, n_bed, nchrom=5, length=1_000_000, seed=4):
+    """A chain file with a few chains per chromosome and a BED of `n_bed` intervals to lift through it."""
+    rng = random.Random(seed)
+    chain_id = 1
+    with open(path, "w") as f:
+        for c in range(1, nchrom + 1):
+            for _ in range(3):
+                t_size = length + 50000
+                s0, t0 = rng.randint(0, length // 2), rng.randint(0, 20000)
+                blocks, s, t = [], s0, t0
+                for _ in range(rng.randint(50, 200)):
+                    size, s_gap, t_gap = rng.randint(100, 3000), rng.randint(0, 500), rng.randint(0, 500)
+                    if s + size + s_gap >= length or t + size + t_gap >= t_size:
+                        break
+                    blocks.append((size, s_gap, t_gap))
+                    s, t = s + size + s_gap, t + size + t_gap
+                s_end = s0 + sum(b + sg for b, sg, _ in blocks[:-1]) + blocks[-1][0]
+                t_end = t0 + sum(b + tg for b, _, tg in blocks[:-1]) + blocks[-1][0]
+                f.write(f"chain {rng.randint(1000, 100000)} chr{c} {length} + {s0} {s_end} "
+                        f"chr{rng.randint(1, nchrom)} {t_size} {rng.choice('+-')} {t0} {t_end} {chain_id}\n")
+                chain_id += 1
+                f.writelines(f"{b}\t{sg}\t{tg}\n" for b, sg, tg in blocks[:-1])
+                f.write(f"{blocks[-1][0]}\n\n")
+    with open(bed_path, "w") as f:
+        for i in range(n_bed):
+            start = rng.randint(0, length - 5000)
+            f.write(f"chr{rng.randint(1, nchrom)}\t{start}\t{start + rng.randint(1, 3000)}\tpeak{i}\t{rng.random():.3f}\n")
+
+def make_sources(root, scale_mb):
+    """
+    Write every synthetic source under `root`: `www/` (served over HTTP) holds
+    the genome, GTF, lncRNA zip and tRNA tarball, `ftp/` the goldenPath tables,
+    and `local/` the chain file and BED.
+    """
+    www, ftp, local = (os.path.join(root, d) for d in ("www", "ftp", "local"))
+    database = os.path.join(ftp, "goldenPath", ASSEMBLY, "database")
+    for d in (www, database, local):
+        os.makedirs(d, exist_ok=True)
+
+    length = make_genome(os.path.join(www, GENOME), scale_mb)
+    make_gtf(os.path.join(www, GTF), scale_mb * 1000, length=length)
+
+    lnc_gtf = os.path.join(local, "BENCH_lncRNA.gtf")
+    make_gtf(lnc_gtf, scale_mb * 1000, length=length, seed=5)
+    with zipfile.ZipFile(os.path.join(www, LNC_ZIP), "w", zipfile.ZIP_DEFLATED) as z:
+        z.write(lnc_gtf, "BENCH_lncRNA.gtf")
+        z.writestr("README.txt", "synthetic lncRNA annotation\n")
+
+    make_chain(os.path.join(local, CHAIN), os.path.join(local, BED), scale_mb * 5000, length=length)
+    with tarfile.open(os.path.join(www, TRNA_TAR), "w:gz") as tar:
+        tar.add(os.path.join(local, BED), "benchAsm-tRNAs.bed")
+        tar.add(lnc_gtf, "benchAsm-tRNAs.gtf")
+
+    for k, table in enumerate(TABLES):
+        make_table(os.path.join(database, table + ".txt.gz"), table, scale_mb * (20000 if table == "rmsk" else 500),
+                   length=length, seed=10 + k)
+    return www, ftp, local
+
+# ---- stages ----
+# Each stage is (unit, prepare, run): prepare(ctx) sets up untimed inputs and
+# returns what run(ctx, prepared) needs; run returns the bytes (MB/s) or
+# lines (lines/s) it processed. Every repeat starts from an empty data/.
+
+def _size(path):
+    return os.path.getsize(path)
+
+def _copy(ctx, name, dest_dir):
+    os.makedirs(dest_dir, exist_ok=True)
+    return shutil.copy(os.path.join(ctx["www"], name), dest_dir)
+
+def _ensembl_download(ctx, _):
+    from utils.dwnld import fetch_segmented
+    os.makedirs(os.path.join("data", "ensembl"), exist_ok=True)
+    dest = os.path.join("data", "ensembl", GENOME)
+    if not fetch_segmented(ctx["http"] + GENOME, dest):
+        raise IOError(f"download of {GENOME} failed")
+    return _size(dest)
+
+def _ensembl_stream_fasta(ctx, _):
+    from scripts.ensembl import stream_fasta_with_chr_prefix
+    os.makedirs(os.path.join("data", "ensembl"), exist_ok=True)
+    dest = stream_fasta_with_chr_prefix(ctx["http"] + GENOME, os.path.join("data", "ensembl", GENOME[:-3]))
+    if not dest:
+        raise IOError(f"streaming {GENOME} failed")
+    return _size(dest)
+
+def _ensembl_gtf(ctx, _):
+    from scripts.ensembl import download_one
+    os.makedirs(os.path.join("data", "ensembl"), exist_ok=True)
+    if not download_one(GTF, ctx["http"] + GTF, os.path.join("data", "ensembl")):
+        raise IOError(f"download of {GTF} failed")
+    return _size(os.path.join(ctx["www"], GTF))
+
+def _ensembl_extract(ctx, path):
+    from scripts.ensembl import extract_and_delete_gzip
+    extracted = extract_and_delete_gzip(path)
+    if not extracted:
+        raise IOError(f"extracting {path} failed")
+    return _size(extracted)
+
+def _gunzipped_genome(ctx):
+    path = _copy(ctx, GENOME, os.path.join("data", "ensembl"))
+    with gzip.open(path, "rb") as f_in, open(path[:-3], "wb") as f_out:
+        shutil.copyfileobj(f_in, f_out, 1 << 20)
+    os.remove(path)
+    return path[:-3]
+
+def _regzipped_genome(layout):
+    """Prepare a copy of the genome as a `layout` ("plain", "bgzf" or "multi" member) gzip file."""
+    def prepare(ctx):
+        path = _copy(ctx, GENOME, "data")
+        if layout == "plain":
+            return path
+        from utils.bgzf import BgzfWriter
+        with gzip.open(path, "rb") as f_in, open(path + ".tmp", "wb") as f_out:
+            if layout == "bgzf":
+                writer = BgzfWriter(f_out)
+                for block in iter(lambda: f_in.read(1 << 20), b""):
+                    writer.write(block)
+                writer.close()
+            else:  # e.g. pigz --independent or concatenated dumps: a member per 4 MB
+                for block in iter(lambda: f_in.read(4 << 20), b""):
+                    f_out.write(gzip.compress(block, 6))
+        os.replace(path + ".tmp", path)
+        return path
+    return prepare
+
+def _gunzip_stdlib(ctx, path):
+    """The single-threaded gzip.open + copyfileobj path utils.gunzip replaced, for reference."""
+    with gzip.open(path, "rb") as f_in, open(path[:-3], "wb") as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    return _size(path[:-3])
+
+def _gunzip(ctx, path):
+    from utils.gunzip import gunzip
+    return _size(gunzip(path))
+
+def _ensembl_chr_prefix(ctx, path):
+    from scripts.ensembl import add_chr_prefix_to_fasta
+    add_chr_prefix_to_fasta(path)
+    with open(path) as f:
+        if not f.readline().startswith(">chr"):
+            raise IOError("headers were not prefixed")
+    return _size(path)
+
+def _rna_download(ctx, _):
+    from scripts.rna_files import download_file
+    return _size(download_file(ctx["http"] + LNC_ZIP, os.path.join("data", "rna_files")))
+
+def _rna_extract(ctx, path):
+    from scripts.rna_files import extract_file
+    extracted = extract_file(path, os.path.dirname(path), ["*.gtf"])
+    if not extracted:
+        raise IOError(f"nothing extracted from {path}")
+    return sum(_size(p) for p in extracted)
+
+def _rna_stream_tarball(ctx, _):
+    from scripts.rna_files import stream_tarball
+    stream_tarball(ctx["http"] + TRNA_TAR, os.path.join("data", "rna_files"))
+    return _size(os.path.join(ctx["www"], TRNA_TAR))
+
+def _gaps_ftp_download(ctx, _):
+    from scripts.gaps_ftp import download_ucsc_tables
+    download_ucsc_tables(ASSEMBLY, TABLES, os.path.join("data", "ucsc_gap"), host=ctx["ftp"][0], port=ctx["ftp"][1])
+    database = os.path.join(ctx["ftp_root"], "goldenPath", ASSEMBLY, "database")
+    return sum(_size(os.path.join(database, t + ".txt.gz")) for t in TABLES)
+
+def _liftover_inputs(ctx):
+    os.makedirs("data", exist_ok=True)
+    shutil.copy(os.path.join(ctx["local"], CHAIN), os.path.join("data", CHAIN))  # picked up as CHAIN_FILE
+    return os.path.join(ctx["local"], BED)
+
+def _liftover_run(ctx, bed):
+    from scripts.liftover import run_many
+    run_many([(bed, os.path.join("data", "output_lifted.bed"), os.path.join("data", "unmapped.txt"))])
+    with open(bed) as f:
+        return sum(1 for _ in f)
+
+def _tabix_index(ctx, bed):
+    from utils.tabix import index_bed
+    os.makedirs("data", exist_ok=True)
+    index_bed(bed, dest=os.path.join("data", BED + ".gz"))
+    with open(bed) as f:
+        return sum(1 for _ in f)
+
+STAGES = {
+    "ensembl.download": ("MB/s", None, _ensembl_download),
+    "ensembl.stream_fasta": ("MB/s", None, _ensembl_stream_fasta),
+    "ensembl.gtf": ("MB/s", None, _ensembl_gtf),
+    "ensembl.extract": ("MB/s", lambda ctx: _copy(ctx, GENOME, os.path.join("data", "ensembl")), _ensembl_extract),
+    "ensembl.chr_prefix": ("MB/s", _gunzipped_genome, _ensembl_chr_prefix),
+    "gunzip.stdlib": ("MB/s", _regzipped_genome("plain"), _gunzip_stdlib),
+    "gunzip.plain": ("MB/s", _regzipped_genome("plain"), _gunzip),
+    "gunzip.bgzf": ("MB/s", _regzipped_genome("bgzf"), _gunzip),
+    "gunzip.multi": ("MB/s", _regzipped_genome("multi"), _gunzip),
+    "rna_files.download": ("MB/s", None, _rna_download),
+    "rna_files.extract": ("MB/s", lambda ctx: _copy(ctx, LNC_ZIP, os.path.join("data", "rna_files")), _rna_extract),
+    "rna_files.stream_tarball": ("MB/s", None, _rna_stream_tarball),
+    "gaps_ftp.download": ("MB/s", None, _gaps_ftp_download),
+    "liftover.run": ("lines/s", _liftover_inputs, _liftover_run),
+    "tabix.index_bed": ("lines/s", lambda ctx: os.path.join(ctx["local"], BED), _tabix_index),
+}
+
+def _rate(unit, amount, seconds):
+    return amount / seconds / (1e6 if unit == "MB/s" else 1)
+
+def run(stages=None, scale_mb=BENCH_SCALE_MB, repeat=BENCH_REPEAT, workdir=None):
+    """
+    Generate the synthetic sources, serve them from local HTTP (with Range
+    support) and FTP stand-ins, and time each stage `repeat` times in a scratch
+    working directory (so data/ there is the pipeline's data/). The best rate of
+    the repeats is reported. Returns the results as a JSON-ready dict.
+    """
+    unknown = [s for s in stages or [] if s not in STAGES]
+    if unknown:
+        raise ValueError(f"Unknown stage(s): {', '.join(unknown)}. Choose from: {', '.join(STAGES)}")
+    from utils import shared_store
+    root = workdir or tempfile.mkdtemp(prefix="gsh_bench_")
+    cwd = os.getcwd()
+    print(f"[INFO] Generating {scale_mb} MB of synthetic data in {root} ...")
+    www, ftp_root, local = make_sources(root, scale_mb)
+    http_server, base_url = serve_http(www)
+    ftp_server, host, port = serve_ftp(ftp_root)
+    ctx = {"www": www, "ftp_root": ftp_root, "local": local, "http": base_url, "ftp": (host, port)}
+    metrics = {}
+    store_dir, shared_store.STORE_DIR = shared_store.STORE_DIR, None  # every repeat must do the real work
+    try:
+        work = os.path.join(root, "work")
+        for name in stages or STAGES:
+            unit, prepare, func = STAGES[name]
+            seconds, amount, error = [], 0, None
+            for _ in range(repeat):
+                shutil.rmtree(work, ignore_errors=True)
+                os.makedirs(work)
+                os.chdir(work)
+                try:
+                    prepared = prepare(ctx) if prepare else None
+                    started = time.perf_counter()
+                    amount = func(ctx, prepared)
+                    seconds.append(time.perf_counter() - started)
+                except Exception as e:
+                    error = str(e)
+                    break
+                finally:
+                    os.chdir(cwd)
+            if error:
+                print(f"❌ {name}: {error}")
+                metrics[name] = {"unit": unit, "value": None, "error": error}
+                continue
+            best = min(seconds)
+            metrics[name] = {"unit": unit, "value": round(_rate(unit, amount, best), 3), "amount": amount,
+                             "seconds": [round(s, 4) for s in seconds]}
+            print(f"⏱️ {name}: {metrics[name]['value']:,.1f} {unit}")
+    finally:
+        os.chdir(cwd)
+        shared_store.STORE_DIR = store_dir
+        http_server.shutdown()
+        ftp_server.shutdown()
+        if not workdir:
+            shutil.rmtree(root, ignore_errors=True)
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "host": platform.node(),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "scale_mb": scale_mb,
+        "repeat": repeat,
+        "metrics": metrics,
+    }
+
+# ---- baseline comparison ----
+
+def save(results, path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path + ".tmp", "w") as f:
+        json.dump(results, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+def load(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def compare(results, baseline, tolerance=BENCH_TOLERANCE):
+    """
+    [(stage, baseline value, current value, change, verdict)] for every stage
+    in `results`. Higher is better for every unit; a stage more than
+    `tolerance` (a fraction) below its baseline is a "regression", one that
+    failed is "failed", and one without a baseline value is "new".
+    """
+    rows = []
+    previous = (baseline or {}).get("metrics", {})
+    for name, m in results["metrics"].items():
+        base = previous.get(name, {}).get("value")
+        value = m.get("value")
+        if value is None:
+            rows.append((name, base, None, None, "failed"))
+        elif not base:
+            rows.append((name, None, value, None, "new"))
+        else:
+            change = value / base - 1
+            verdict = "regression" if change < -tolerance else "faster" if change > tolerance else "ok"
+            rows.append((name, base, value, change, verdict))
+    return rows
+
+def report(results, rows):
+    units = {name: m["unit"] for name, m in results["metrics"].items()}
+    print(f"\n{'stage':<26} {'baseline':>12} {'current':>12} {'change':>8}  verdict")
+    for name, base, value, change, verdict in rows:
+        fmt = lambda v: f"{v:,.1f}" if v is not None else "-"
+        pct = f"{change:+.1%}" if change is not None else "-"
+        print(f"{name:<26} {fmt(base):>12} {fmt(value):>12} {pct:>8}  {verdict} ({units[name]})")
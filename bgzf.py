@@ -0,0 +1,102 @@
+import struct, zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# BGZF (blocked gzip, as used by samtools/htslib): a series of small gzip members,
+# each holding at most 64 KiB, with the compressed block size stored in a "BC"
+# extra field so a reader can jump straight to any block.
+BLOCK_DATA_SIZE = 0xff00
+_HEADER = struct.Struct("<4BI2BH2BHH")
+_HEADER_SIZE = _HEADER.size  # 18
+EOF_BLOCK = bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")
+
+def compress_block(data, level=6):
+    """Compress up to BLOCK_DATA_SIZE bytes into one BGZF block."""
+    c = zlib.compressobj(level, zlib.DEFLATED, -15)
+    cdata = c.compress(data) + c.flush()
+    bsize = _HEADER_SIZE + len(cdata) + 8
+    header = _HEADER.pack(0x1f, 0x8b, 8, 4, 0, 0, 0xff, 6, ord("B"), ord("C"), 2, bsize - 1)
+    return header + cdata + struct.pack("<II", zlib.crc32(data), len(data))
+
+def read_block(buf, offset):
+    """Decompress the BGZF block starting at `offset` in `buf`; returns (data, block size)."""
+    if buf[offset:offset + 4] != b"\x1f\x8b\x08\x04":
+        raise ValueError(f"not a BGZF block at offset {offset}")
+    xlen = struct.unpack_from("<H", buf, offset + 10)[0]
+    bsize = None
+    pos = offset + 12
+    while pos < offset + 12 + xlen:
+        si1, si2, slen = struct.unpack_from("<BBH", buf, pos)
+        if si1 == ord("B") and si2 == ord("C"):
+            bsize = struct.unpack_from("<H", buf, pos + 4)[0] + 1
+        pos += 4 + slen
+    if bsize is None:
+        raise ValueError(f"missing BGZF size field at offset {offset}")
+    cdata = buf[offset + 12 + xlen:offset + bsize - 8]
+    return zlib.decompress(cdata, -15), bsize
+
+class BgzfWriter:
+    """
+    Write a BGZF file, compressing blocks on a thread pool (zlib releases the GIL).
+
+    Keeps the (compressed offset, uncompressed offset) of every block so a
+    `.gzi` index can be written alongside the data.
+    """
+
+    def __init__(self, fileobj, level=6, threads=4):
+        self.f = fileobj
+        self.level = level
+        self.buffer = bytearray()
+        self.coffset = 0
+        self.uoffset = 0
+        self.blocks = []  # (compressed offset, uncompressed offset) of each block
+        self.pool = ThreadPoolExecutor(max_workers=threads)
+        self.pending = deque()
+        self.max_pending = threads * 4
+
+    def write(self, data):
+        self.buffer += data
+        while len(self.buffer) >= BLOCK_DATA_SIZE:
+            self._submit(bytes(self.buffer[:BLOCK_DATA_SIZE]))
+            del self.buffer[:BLOCK_DATA_SIZE]
+
+    def _submit(self, data):
+        self.pending.append((self.pool.submit(compress_block, data, self.level), len(data)))
+        while len(self.pending) > self.max_pending:
+            self._drain_one()
+
+    def _drain_one(self):
+        future, n = self.pending.popleft()
+        block = future.result()
+        self.blocks.append((self.coffset, self.uoffset))
+        self.f.write(block)
+        self.coffset += len(block)
+        self.uoffset += n
+
+    def close(self):
+        if self.buffer:
+            self._submit(bytes(self.buffer))
+            self.buffer.clear()
+        while self.pending:
+            self._drain_one()
+        self.pool.shutdown()
+        self.f.write(EOF_BLOCK)
+
+    def write_gzi(self, path):
+        """Write a samtools-compatible .gzi index (the implicit first block is omitted)."""
+        entries = self.blocks[1:]
+        with open(path, "wb") as f:
+            f.write(struct.pack("<Q", len(entries)))
+            for coff, uoff in entries:
+                f.write(struct.pack("<QQ", coff, uoff))
+
+def load_gzi(path):
+    """Read a .gzi index; returns ([compressed offsets], [uncompressed offsets]) including block 0."""
+    coffsets, uoffsets = [0], [0]
+    with open(path, "rb") as f:
+        count = struct.unpack("<Q", f.read(8))[0]
+        for _ in range(count):
+            coff, uoff = struct.unpack("<QQ", f.read(16))
+            coffsets.append(coff)
+            uoffsets.append(uoff)
+    return coffsets, uoffsets
@@ -0,0 +1,98 @@
+import hashlib, json, os
+from threading import Lock
+from config.settings import DATA_DIR
+from utils.state_file import load_json, locked, save_json
+
+STATE_FILE = os.path.join(DATA_DIR, "build_state.json")
+_lock = Lock()
+
+def _load():
+    return load_json(STATE_FILE)
+
+def _save(state):
+    save_json(STATE_FILE, state)
+
+def _sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def _canonical(params):
+    return json.loads(json.dumps(params or {}, sort_keys=True))  # tuples -> lists, as stored
+
+def _same_input(path, seen):
+    """
+    True if `path` still has the content it had when `seen` was taken. The
+    file is only re-hashed when its size matches but its mtime moved, so a
+    re-download or re-extraction with the same bytes doesn't cause a rebuild.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return False
+    if st.st_size != seen["size"]:
+        return False
+    if st.st_mtime_ns == seen["mtime_ns"]:
+        return True
+    if _sha256(path) != seen["sha256"]:
+        return False
+    seen["mtime_ns"] = st.st_mtime_ns
+    return True
+
+def _same_output(path, seen):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return False
+    return st.st_size == seen["size"] and st.st_mtime_ns == seen["mtime_ns"]
+
+def up_to_date(step, inputs=(), params=None, outputs=None, adopt=False):
+    """
+    True if `step` last ran with the same `params` (anything JSON-serializable:
+    release, source checksum, patterns, ...) and the same input file
+    contents, and its outputs (`outputs`, else those recorded) are still
+    there unchanged since it wrote them. With `adopt`, a step that was never
+    recorded but whose outputs exist counts as current and is recorded now,
+    so files made before this tracking existed are not rebuilt.
+    """
+    inputs = [os.path.normpath(p) for p in inputs]
+    with _lock, locked(STATE_FILE):
+        state = _load()
+        entry = state.get(step)
+        if entry is None:
+            adopted = adopt and bool(outputs) and all(os.path.exists(p) for p in outputs)
+        else:
+            outputs = list(entry["outputs"]) if outputs is None else [os.path.normpath(p) for p in outputs]
+            current = (entry["params"] == _canonical(params)
+                       and sorted(entry["inputs"]) == sorted(inputs)
+                       and sorted(entry["outputs"]) == sorted(outputs)
+                       and all(_same_input(p, entry["inputs"][p]) for p in inputs)
+                       and all(_same_output(p, entry["outputs"][p]) for p in outputs))
+            if current:
+                _save(state)  # keeps mtimes of inputs that were only touched
+            return current
+    if adopted:
+        record(step, inputs, params, outputs)
+    return adopted
+
+def record(step, inputs=(), params=None, outputs=()):
+    """Note that `step` just produced `outputs` from `inputs` (hashed now) and `params`."""
+    def stat(path, content):
+        st = os.stat(path)
+        seen = {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+        if content:
+            seen["sha256"] = _sha256(path)
+        return seen
+    entry = {"params": _canonical(params),
+             "inputs": {os.path.normpath(p): stat(p, True) for p in inputs},
+             "outputs": {os.path.normpath(p): stat(p, False) for p in outputs}}
+    with _lock, locked(STATE_FILE):
+        state = _load()
+        state[step] = entry
+        _save(state)
+
+def outputs_of(step):
+    """Outputs recorded for `step` by its last run."""
+    return list(_load().get(step, {}).get("outputs", []))
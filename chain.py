@@ -0,0 +1,209 @@
+import gzip, hashlib, json, os, re
+import numpy as np
+
+class ChainIndex:
+    """
+    UCSC .over.chain file flattened into sorted NumPy arrays, one set per source
+    chromosome, for converting whole columns of positions at once.
+
+    Each source chromosome is cut into disjoint segments. Every segment records
+    the offset to add to a position, the target chromosome and strand. Where
+    chains overlap, the segment belongs to the highest-scoring chain, which is the
+    conversion pyliftover lists first.
+    """
+
+    def __init__(self, target_names, target_sizes, chroms):
+        self.target_names = np.asarray(target_names, dtype=object)
+        self.target_sizes = np.asarray(target_sizes, dtype=np.int64)
+        # source chrom -> (starts, ends, deltas, target ids, negative strand flags)
+        self.chroms = chroms
+
+    def convert(self, chrom, positions):
+        """
+        Convert 0-based `positions` on `chrom`.
+
+        Returns (target ids, target positions, mapped mask); entries where the
+        mask is False have no conversion. Target ids index `target_names`.
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        mapped = np.zeros(len(positions), dtype=bool)
+        tids = np.full(len(positions), -1, dtype=np.int32)
+        tpos = np.zeros(len(positions), dtype=np.int64)
+        if chrom not in self.chroms:
+            return tids, tpos, mapped
+
+        starts, ends, deltas, seg_tids, negs = self.chroms[chrom]
+        i = np.searchsorted(starts, positions, side="right") - 1
+        ok = i >= 0
+        i = np.where(ok, i, 0)
+        mapped = ok & (positions < ends[i]) & (seg_tids[i] >= 0)
+
+        tids = np.where(mapped, seg_tids[i], -1).astype(np.int32)
+        tpos = positions + deltas[i]
+        neg = mapped & negs[i]
+        tpos[neg] = self.target_sizes[tids[neg]] - 1 - tpos[neg]
+        return tids, np.where(mapped, tpos, 0), mapped
+
+def _flatten(blocks):
+    """
+    Turn the blocks of one source chromosome (rows of start, end, delta, target
+    id, negative, score, order) into disjoint segments, preferring higher-scoring
+    chains.
+    """
+    starts, ends = blocks[:, 0], blocks[:, 1]
+
+    order = np.argsort(starts, kind="stable")
+    if np.all(starts[order][1:] >= ends[order][:-1]):
+        b = blocks[order]  # no overlaps: the blocks are the segments
+        return b[:, 0], b[:, 1], b[:, 2], b[:, 3].astype(np.int32), b[:, 4].astype(bool)
+
+    # Overlapping chains: paint blocks onto elementary intervals from lowest to
+    # highest priority so the best chain wins, then merge runs of the same block.
+    bounds = np.unique(np.concatenate([starts, ends]))
+    owner = np.full(len(bounds) - 1, -1, dtype=np.int64)
+    lo = np.searchsorted(bounds, starts)
+    hi = np.searchsorted(bounds, ends)
+    priority = np.lexsort((-blocks[:, 6], blocks[:, 5]))  # score ascending, file order descending
+    for k in priority:
+        owner[lo[k]:hi[k]] = k
+
+    change = np.concatenate([[True], owner[1:] != owner[:-1]])
+    seg_starts = bounds[:-1][change]
+    seg_owner = owner[change]
+    seg_ends = np.append(seg_starts[1:], bounds[-1])
+    covered = seg_owner >= 0
+    src = blocks[np.where(covered, seg_owner, 0)]
+    deltas = np.where(covered, src[:, 2], 0)
+    tids = np.where(covered, src[:, 3], -1).astype(np.int32)
+    negs = covered & src[:, 4].astype(bool)
+    return seg_starts, seg_ends, deltas, tids, negs
+
+def load_chain(path):
+    """
+    Parse a (optionally gzipped) .over.chain file into a ChainIndex.
+
+    Header lines are read one by one, but the alignment block lines of all
+    chains are parsed in a single NumPy call and turned into coordinates with
+    cumulative sums.
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt") as f:
+        text = f.read()
+
+    headers, bodies, counts = [], [], []
+    for chunk in re.split(r"^chain", text, flags=re.M)[1:]:
+        header, _, body = chunk.partition("\n")
+        body = body.strip()
+        headers.append(header.split())
+        counts.append(body.count("\n") + 1)
+        bodies.append(body + " 0 0")  # the last block line has no gap columns
+
+    target_ids, target_sizes = {}, []
+    chain_cols = []  # score, sfrom, tfrom, target id, negative, source chrom id
+    source_ids = {}
+    for fields in headers:
+        tid = target_ids.setdefault(fields[6], len(target_ids))
+        if tid == len(target_sizes):
+            target_sizes.append(int(fields[7]))
+        sid = source_ids.setdefault(fields[1], len(source_ids))
+        chain_cols.append((int(fields[0]), int(fields[4]), int(fields[9]), tid, fields[8] == "-", sid))
+    chain_cols = np.array(chain_cols, dtype=np.int64).reshape(-1, 6)
+
+    nums = np.fromstring(" ".join(bodies), dtype=np.int64, sep=" ").reshape(-1, 3)
+    size, sgap, tgap = nums[:, 0], nums[:, 1], nums[:, 2]
+    counts = np.array(counts, dtype=np.int64)
+    chain_of = np.repeat(np.arange(len(counts)), counts)
+    first = np.concatenate([[0], np.cumsum(counts)[:-1]])
+
+    def offsets(step):
+        """Offset of each block from the start of its chain."""
+        before = np.cumsum(step) - step
+        return before - before[first][chain_of]
+
+    cols = chain_cols[chain_of]
+    sfrom = cols[:, 1] + offsets(size + sgap)
+    tfrom = cols[:, 2] + offsets(size + tgap)
+    blocks = np.column_stack([sfrom, sfrom + size, tfrom - sfrom, cols[:, 3], cols[:, 4], cols[:, 0], chain_of])
+
+    chroms = {}
+    for name, sid in source_ids.items():
+        chroms[name] = _flatten(blocks[cols[:, 5] == sid])
+    names = sorted(target_ids, key=target_ids.get)
+    return ChainIndex(names, target_sizes, chroms)
+
+_ARRAYS = ("starts", "ends", "deltas", "tids", "negs")
+
+def file_checksum(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def source_signature(path):
+    """Size, mtime and SHA-256 of a cache's source file, for the cache's meta.json."""
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": file_checksum(path)}
+
+def cache_is_current(cache_dir, path):
+    """
+    True if the cache in `cache_dir` (its meta.json "source" entry) was built
+    from the current content of `path`. A file that was only rewritten (e.g.
+    re-extracted) with the same bytes keeps its cache.
+    """
+    meta_path = os.path.join(cache_dir, "meta.json")
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        built = meta["source"]
+    except (OSError, ValueError, KeyError):
+        return False
+    st = os.stat(path)
+    if built["size"] != st.st_size:
+        return False
+    if built["mtime_ns"] == st.st_mtime_ns:
+        return True
+    if built["sha256"] != file_checksum(path):
+        return False
+    meta["source"]["mtime_ns"] = st.st_mtime_ns
+    with open(meta_path + ".tmp", "w") as f:
+        json.dump(meta, f)
+    os.replace(meta_path + ".tmp", meta_path)
+    return True
+
+def save_index(index, cache_dir):
+    """Store a ChainIndex as flat .npy arrays plus a small JSON table of contents."""
+    os.makedirs(cache_dir, exist_ok=True)
+    names = list(index.chroms)
+    bounds = np.cumsum([0] + [len(index.chroms[n][0]) for n in names]).tolist()
+    for k, key in enumerate(_ARRAYS):
+        arr = np.concatenate([index.chroms[n][k] for n in names]) if names else np.array([])
+        np.save(os.path.join(cache_dir, key + ".npy"), arr)
+    meta = {"target_names": list(index.target_names), "target_sizes": index.target_sizes.tolist(),
+            "chroms": {n: [bounds[i], bounds[i + 1]] for i, n in enumerate(names)}}
+    tmp = os.path.join(cache_dir, "meta.json.tmp")
+    with open(tmp, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp, os.path.join(cache_dir, "meta.json"))  # written last: marks the cache complete
+
+def load_index(cache_dir):
+    """
+    Load a cached ChainIndex with its arrays memory-mapped read-only, so several
+    worker processes share one copy through the page cache.
+    """
+    with open(os.path.join(cache_dir, "meta.json")) as f:
+        meta = json.load(f)
+    arrays = [np.load(os.path.join(cache_dir, key + ".npy"), mmap_mode="r") for key in _ARRAYS]
+    chroms = {name: tuple(a[lo:hi] for a in arrays) for name, (lo, hi) in meta["chroms"].items()}
+    return ChainIndex(meta["target_names"], meta["target_sizes"], chroms)
+
+def cached_chain(path, cache_root):
+    """
+    Return (ChainIndex, cache dir) for a chain file, parsing it only if no cache
+    exists yet for its SHA-256 checksum.
+    """
+    cache_dir = os.path.join(cache_root, file_checksum(path))
+    if not os.path.exists(os.path.join(cache_dir, "meta.json")):
+        print(f"Parsing chain file {path} into {cache_dir} ...")
+        save_index(load_chain(path), cache_dir)
+    return load_index(cache_dir), cache_dir
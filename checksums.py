@@ -0,0 +1,194 @@
+import hashlib, os, shutil, subprocess, time
+from threading import Lock
+from config.settings import DATA_DIR, CHECKSUM_FILES
+from utils.state_file import load_json, locked, save_json
+from utils.transport import get
+
+MANIFEST = os.path.join(DATA_DIR, "checksums.json")
+SUM = shutil.which("sum")  # coreutils / BSD sum, for Ensembl CHECKSUMS
+
+_lock = Lock()
+_listings = {}  # listing URL -> {file name: (algorithm, value)}, fetched once per run
+
+class ChecksumError(IOError):
+    pass
+
+class BsdSum:
+    """
+    BSD `sum` (16-bit rotating checksum plus size in 1 KiB blocks), the format
+    of Ensembl's CHECKSUMS files. The bytes are piped through the system `sum`,
+    since a per-byte Python loop manages only a few MB/s.
+    """
+
+    def __init__(self):
+        self._proc = subprocess.Popen([SUM], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        self.size = 0
+
+    def update(self, data):
+        self._proc.stdin.write(data)
+        self.size += len(data)
+
+    def hexdigest(self):
+        out, _ = self._proc.communicate()
+        return f"{int(out.split()[0])} {-(-self.size // 1024)}"
+
+    def close(self):
+        if self._proc.poll() is None:
+            self._proc.kill()
+            self._proc.wait()
+
+def _parse_listing(text, algorithm):
+    """{file name: value} from a CHECKSUMS (`sum blocks name`) or md5sum-style (`digest  name`) listing."""
+    sums = {}
+    for line in text.splitlines():
+        parts = line.split()
+        if algorithm == "sum" and len(parts) >= 3 and parts[0].isdigit() and parts[1].isdigit():
+            sums[parts[2]] = f"{int(parts[0])} {int(parts[1])}"
+        elif algorithm != "sum" and len(parts) >= 2:
+            sums[parts[-1].lstrip("*").removeprefix("./")] = parts[0].lower()
+    return sums
+
+def _listing(listing_url, algorithm):
+    with _lock:
+        if listing_url in _listings:
+            return _listings[listing_url]
+    try:
+        with get(listing_url, retries=2) as r:
+            sums = _parse_listing(r.text, algorithm) if r.status_code == 200 else {}
+    except Exception as e:
+        print(f"⚠️ Could not read {listing_url}: {e}")
+        sums = {}
+    with _lock:
+        _listings[listing_url] = sums
+    return sums
+
+def published(url):
+    """(algorithm, value, listing name) the source publishes for `url` (see CHECKSUM_FILES), or None."""
+    for prefix, listing, algorithm in CHECKSUM_FILES:
+        if url.startswith(prefix):
+            base, name = url.split("?")[0].rsplit("/", 1)
+            value = _listing(f"{base}/{listing}", algorithm).get(name)
+            if value:
+                return algorithm, value, listing
+    return None
+
+def _load():
+    return load_json(MANIFEST)
+
+def _save(manifest):
+    save_json(MANIFEST, manifest)
+
+def recorded(url, validator):
+    """SHA-256 recorded for an earlier download of `url` with the same validator, or None."""
+    if not validator:
+        return None
+    for entry in _load().values():
+        if entry.get("url") == url and entry.get("validator") == validator and entry.get("sha256"):
+            return entry["sha256"]
+    return None
+
+def intact(path):
+    """
+    False if `path` is in the manifest but its size or mtime changed since it
+    was verified (truncated or overwritten). Files never recorded count as
+    intact, so data from before the manifest existed is not re-downloaded.
+    """
+    entry = _load().get(os.path.normpath(path))
+    if entry is None:
+        return True
+    try:
+        st = os.stat(path)
+    except OSError:
+        return False
+    return st.st_size == entry["size"] and st.st_mtime_ns == entry["mtime_ns"]
+
+def _record(entries):
+    """Write {path: entry} to the manifest, adding each file's current size and mtime."""
+    with _lock, locked(MANIFEST):
+        manifest = _load()
+        for path, entry in entries.items():
+            st = os.stat(path)
+            manifest[os.path.normpath(path)] = {**entry, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+        _save(manifest)
+
+def adopt(url, validator, digests):
+    """
+    Record files that were not downloaded here but linked from the shared
+    store (utils.shared_store). `digests` maps each path to the SHA-256 of
+    its download, or None for files derived from one (gunzipped, extracted).
+    """
+    _record({path: {"url": url, "validator": validator, **({"sha256": sha256} if sha256 else {}),
+                    "verified": "shared store", "checked": time.time()} for path, sha256 in digests.items()})
+
+class StreamCheck:
+    """
+    Hashes one download while its bytes stream through (SHA-256 always, plus
+    the published algorithm when there is one), then verifies it against the
+    source's published checksum and our own recorded hash, and writes the
+    result to the manifest (data/checksums.json). For streams that are
+    gunzipped or extracted on the fly, the hashes are those of the bytes
+    received; the outputs are recorded by size and mtime.
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.name = url.split("?")[0].rsplit("/", 1)[-1]
+        self.expected = published(url)
+        self.validator = None
+        self.hexdigests = None
+        self._hashes = {"sha256": hashlib.sha256()}
+        if self.expected and self.expected[0] != "sha256":
+            algorithm = self.expected[0]
+            if algorithm != "sum":
+                self._hashes[algorithm] = hashlib.new(algorithm)
+            elif SUM:
+                self._hashes["sum"] = BsdSum()
+            else:
+                print(f"ℹ️ No `sum` command here; {self.name} is checked against its recorded SHA-256 only")
+                self.expected = None
+
+    def update(self, data):
+        for h in self._hashes.values():
+            h.update(data)
+
+    def update_from_file(self, path, length=None):
+        """Hash the first `length` bytes (all by default) of a local file, e.g. the part a resumed download already has."""
+        with open(path, "rb") as f:
+            remaining = os.path.getsize(path) if length is None else length
+            while remaining > 0:
+                block = f.read(min(1 << 20, remaining))
+                if not block:
+                    break
+                self.update(block)
+                remaining -= len(block)
+
+    def verify(self, validator=None):
+        """
+        Finish hashing and compare with the published checksum, and with the
+        hash recorded for the same source version (`validator`: ETag,
+        Last-Modified, ...). Raises ChecksumError on a mismatch.
+        """
+        self.validator = validator
+        self.hexdigests = {a: h.hexdigest() for a, h in self._hashes.items()}
+        checks = []
+        if self.expected:
+            checks.append(self.expected)
+        previous = recorded(self.url, validator)
+        if previous:
+            checks.append(("sha256", previous, "recorded hash"))
+        for algorithm, value, source in checks:
+            if self.hexdigests[algorithm] != value:
+                raise ChecksumError(f"{self.name}: {algorithm} {self.hexdigests[algorithm]} does not match {source} ({value})")
+        if checks:
+            print(f"🔒 {self.name} matches {' and '.join(source for _, _, source in checks)}")
+
+    def record(self, outputs):
+        """Store the verified hashes for each output file, keyed by path, with its size and mtime."""
+        entry = {"url": self.url, "validator": self.validator, **self.hexdigests,
+                 "verified": self.expected[2] if self.expected else "recorded", "checked": time.time()}
+        _record({path: entry for path in outputs})
+
+    def close(self):
+        for h in self._hashes.values():
+            if isinstance(h, BsdSum):
+                h.close()
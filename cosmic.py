@@ -1,15 +1,34 @@
 import os
-import requests
 import base64
 import tarfile
-from tqdm import tqdm
-from config.settings import DATA_DIR
+import time
+from config.settings import DATA_DIR, COSMIC_KEEP_ARCHIVE, DOWNLOAD_RETRIES
+from utils.dwnld import fetch_segmented
+from utils.extract import stream_extract
+from utils.logger import log_download_task, phase
+from utils.transport import backoff, get
 
 # Define these constants based on the file we wanna downloaaaad
 COSMIC_BUCKET = "downloads"
 COSMIC_PATH = "grch37/cosmic/v102/Cosmic_CancerGeneCensus_Tsv_v102_GRCh37.tar"
 COSMIC_API_URL = "https://cancer.sanger.ac.uk/api/mono/products/v1/downloads/scripted"
 
+def _signed_url(headers, params):
+    """Ask the COSMIC API for a pre-signed download URL."""
+    print("🔐 Requesting a secure download URL...")
+    try:
+        response = get(COSMIC_API_URL, headers=headers, params=params)
+        response.raise_for_status()
+        data = response.json()
+        download_url = data.get("url")
+        if not download_url:
+            print("Response:", data)
+            raise Exception("'download_url' not found in the response.")
+    except Exception as e:
+        raise Exception(f"❌ Failed to retrieve download URL: {e}") from e
+    return download_url
+
+@log_download_task(script_name="cosmic.py")
 def download():
     email = input("Enter your COSMIC email: ").strip()
     password = input("Enter your COSMIC password: ").strip()
@@ -27,45 +46,39 @@ def download():
         "bucket": COSMIC_BUCKET
     }
 
-    print("🔐 Requesting a secure download URL...")
-    try:
-        response = requests.get(COSMIC_API_URL, headers=headers, params=params)
-        response.raise_for_status()
-        data = response.json()
-        download_url = data.get("url")
-        if not download_url:
-            print("❌ 'download_url' not found in the response.")
-            print("Response:", data)
-            return
-    except Exception as e:
-        print(f"❌ Failed to retrieve download URL: {e}")
-        return
-
     # Step 3: Download from the secure URL
     filename = os.path.basename(COSMIC_PATH)
     output_dir = os.path.join(DATA_DIR, "cosmic")
     os.makedirs(output_dir, exist_ok=True)
     output_path = os.path.join(output_dir, filename)
 
-    print(f"⬇️ Downloading COSMIC file: {filename}")
-    try:
-        with requests.get(download_url, stream=True) as r:
-            r.raise_for_status()
-            total = int(r.headers.get('content-length', 0))
-            with open(output_path, "wb") as f, tqdm(total=total, unit="B", unit_scale=True) as bar:
-                for chunk in r.iter_content(chunk_size=8192):
-                    f.write(chunk)
-                    bar.update(len(chunk))
-        print(f"✅ COSMIC file downloaded successfully: {output_path}")
-    except Exception as e:
-        print(f"❌ Error downloading COSMIC file: {e}")
+    if not COSMIC_KEEP_ARCHIVE:
+        # Extract straight from the response. A pre-signed URL is meant for a single download,
+        # so every attempt asks for a fresh one instead of retrying the same URL.
+        print(f"⬇️ Streaming and extracting COSMIC file: {filename}")
+        for attempt in range(1, DOWNLOAD_RETRIES + 1):
+            download_url = _signed_url(headers, params)  # bad credentials fail straight away
+            try:
+                extracted = stream_extract(download_url, output_dir, ["*"], mode="r|", flatten=False, retries=1)
+                break
+            except Exception as e:
+                if attempt == DOWNLOAD_RETRIES:
+                    raise Exception(f"❌ Error downloading COSMIC file: {e}") from e
+                time.sleep(backoff(attempt))
+        print(f"✅ Extracted {len(extracted)} file(s) into: {output_dir}")
         return
 
+    download_url = _signed_url(headers, params)
+    print(f"⬇️ Downloading COSMIC file: {filename}")
+    if not fetch_segmented(download_url, output_path):
+        raise Exception("❌ Error downloading COSMIC file.")
+    print(f"✅ COSMIC file downloaded successfully: {output_path}")
+
     # Step 4: Extract the .tar file
     print("📦 Extracting the downloaded tar file...")
     try:
-        with tarfile.open(output_path, "r") as tar:
+        with phase("decompress"), tarfile.open(output_path, "r") as tar:
             tar.extractall(path=output_dir)
         print(f"✅ Extraction complete. Files are in: {output_dir}")
     except Exception as e:
-        print(f"❌ Error extracting tar file: {e}")
+        raise Exception(f"❌ Error extracting tar file: {e}") from e
@@ -0,0 +1,336 @@
+import os, json, re, time
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event, Lock
+from tqdm import tqdm
+from config.settings import DATA_DIR, HTTP_STATUS_CODES, DOWNLOAD_RETRIES, SEGMENT_CONNECTIONS, SEGMENTED_MIN_SIZE
+from utils.checksums import ChecksumError, StreamCheck
+from utils.http_cache import is_fresh, remember
+from utils.logger import add_bytes, phase
+from utils.shared_store import restore, save
+from utils.transport import backoff, get, iter_into, throttle
+
+def _load_state(meta_path):
+    try:
+        with open(meta_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_state(meta_path, state):
+    with open(meta_path, "w") as f:
+        json.dump(state, f)
+
+def _validator(state):
+    """Return a strong validator usable in If-Range, or None."""
+    etag = state.get("etag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return state.get("last_modified")
+
+def _discard(*paths):
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+def _finish(url, part, meta, dest, total, check):
+    """
+    Rename the .part file into place once its size matches the expected total
+    and its checksums (hashed while it streamed in) verify, and record the
+    source's validators for later freshness checks (and the file in the shared
+    store, if there is one). A file that fails the checksum is deleted so the
+    next attempt starts from scratch.
+    """
+    size = os.path.getsize(part)
+    if total and size != total:
+        raise IOError(f"incomplete download ({size} of {total} bytes)")
+    state = _load_state(meta)
+    try:
+        check.verify(_validator(state))
+    except ChecksumError:
+        _discard(part, meta)
+        raise
+    os.replace(part, dest)
+    remember(url, {"ETag": state.get("etag"), "Last-Modified": state.get("last_modified"),
+                   "Content-Length": str(total) if total else None})
+    check.record([dest])
+    save(url, state.get("etag") or state.get("last_modified"), [dest], os.path.dirname(dest),
+         digests={dest: check.hexdigests["sha256"]})
+    _discard(meta)
+    return dest
+
+def fetch(url, dest, headers=None, verify=None, retries=DOWNLOAD_RETRIES):
+    """
+    Download `url` to `dest`, resuming interrupted transfers.
+
+    Data is written to `dest + ".part"` with resume metadata (validators and
+    expected size) kept next to it in `dest + ".part.json"`. After a failure the
+    transfer continues with a Range/If-Range request; if the remote file changed
+    in the meantime the server sends it in full and we start over. The bytes
+    are hashed as they arrive (a resumed transfer re-reads its local prefix
+    once), and the file is only renamed to `dest` once its size and checksums
+    have been verified (see utils.checksums). When the shared store
+    (utils.shared_store) already holds this version of the file, it is linked
+    from there once the response headers arrive. Returns `dest`, or None if
+    every attempt failed.
+    """
+    part = dest + ".part"
+    meta = part + ".json"
+    name = os.path.basename(dest)
+
+    for attempt in range(1, retries + 1):
+        state = _load_state(meta) if os.path.exists(part) else {}
+        if "segments" in state:
+            state = {}  # left behind by fetch_segmented(); the .part file may have holes
+        offset = os.path.getsize(part) if state else 0
+        req_headers = dict(headers or {})
+        req_headers["Accept-Encoding"] = "identity"  # byte offsets must match the file on the server
+        if offset and _validator(state):
+            req_headers["Range"] = f"bytes={offset}-"
+            req_headers["If-Range"] = _validator(state)
+        else:
+            offset = 0
+
+        check = StreamCheck(url)
+        try:
+            with phase("connect"):
+                r = get(url, stream=True, headers=req_headers, verify=verify)
+            with r:
+                if r.status_code == 416 and offset and offset == state.get("total"):
+                    check.update_from_file(part)
+                    return _finish(url, part, meta, dest, state["total"], check)  # already have every byte
+                if r.status_code == 206:
+                    total = state.get("total", 0)
+                    mode = "ab"
+                    print(f"↪️ Resuming {name} from byte {offset}")
+                    check.update_from_file(part, offset)
+                elif r.status_code == 200:
+                    if restore(url, os.path.dirname(dest), outputs=[dest], headers=r.headers):
+                        _discard(part, meta)
+                        return dest
+                    offset = 0
+                    total = int(r.headers.get("content-length", 0))
+                    mode = "wb"
+                    _save_state(meta, {
+                        "url": url,
+                        "etag": r.headers.get("ETag"),
+                        "last_modified": r.headers.get("Last-Modified"),
+                        "total": total,
+                    })
+                else:
+                    msg = HTTP_STATUS_CODES.get(r.status_code, f"Unexpected status code {r.status_code}")
+                    raise Exception(msg)
+
+                with phase("transfer"), open(part, mode) as f, tqdm(total=total or None, initial=offset, unit='B', unit_scale=True, desc=name) as bar:
+                    for block in iter_into(r):
+                        f.write(block)
+                        check.update(block)
+                        bar.update(len(block))
+                        add_bytes(len(block))
+                        throttle(len(block))
+
+            return _finish(url, part, meta, dest, total, check)
+        except requests.exceptions.SSLError:
+            raise  # a certificate problem does not go away on retry
+        except Exception as e:
+            print(f"⚠️ Attempt {attempt}/{retries} for {name} failed: {e}")
+            if attempt < retries:
+                time.sleep(backoff(attempt))
+        finally:
+            check.close()
+
+    print(f"❌ Giving up on {name}" + (f"; partial data kept in {part}" if os.path.exists(part) else ""))
+    return None
+
+def _probe(url, headers, verify):
+    """
+    Ask for the first byte of `url` to learn whether the server honours Range
+    requests. Returns (total size, {"etag", "last_modified"}) for range-capable
+    servers, or (None, None) otherwise. A ranged GET is used instead of HEAD because
+    presigned URLs (COSMIC) are only signed for GET.
+    """
+    req_headers = dict(headers or {})
+    req_headers.update({"Range": "bytes=0-0", "Accept-Encoding": "identity"})
+    with get(url, stream=True, headers=req_headers, verify=verify) as r:
+        match = re.match(r"bytes 0-0/(\d+)", r.headers.get("Content-Range", ""))
+        if r.status_code != 206 or not match or r.headers.get("Accept-Ranges") == "none":
+            return None, None
+        return int(match.group(1)), {"etag": r.headers.get("ETag"), "last_modified": r.headers.get("Last-Modified")}
+
+def _split(total, connections):
+    """Split [0, total) into `connections` contiguous [start, end] byte ranges."""
+    size = -(-total // connections)
+    return [[start, min(start + size, total) - 1] for start in range(0, total, size)]
+
+def _frontier(segments):
+    """End of the contiguous downloaded prefix of a segmented .part file."""
+    for start, end, pos in segments:
+        if pos <= end:
+            return pos
+    return segments[-1][1] + 1
+
+def _hash_behind(check, part, segments, finished):
+    """
+    Feed a segmented download to `check` in file order, following the
+    contiguous prefix as the segments fill in. The bytes are read back right
+    after they were written (from the page cache), not in a second pass over
+    the finished file.
+    """
+    offset = 0
+    with open(part, "rb") as f:
+        while True:
+            done = finished.is_set()
+            frontier = _frontier(segments)
+            while offset < frontier:
+                block = f.read(min(1 << 20, frontier - offset))
+                check.update(block)
+                offset += len(block)
+            if done:
+                return offset
+            finished.wait(0.05)
+
+def fetch_segmented(url, dest, connections=SEGMENT_CONNECTIONS, headers=None, verify=None, retries=DOWNLOAD_RETRIES,
+                    min_size=SEGMENTED_MIN_SIZE):
+    """
+    Download `url` to `dest` over several parallel connections.
+
+    The file is split into byte ranges that are fetched concurrently and written
+    in place into a preallocated `dest + ".part"` file. Per-segment progress is
+    kept in `dest + ".part.json"`, so an interrupted run only re-fetches the
+    missing parts of each segment. Falls back to a single-stream fetch() when the
+    server does not support Range requests or the file is smaller than
+    `min_size`. The file is hashed in order behind the segments as they
+    complete and verified like fetch(). A copy in the shared store is linked
+    instead of downloading. Returns `dest`, or None on failure.
+    """
+    part = dest + ".part"
+    meta = part + ".json"
+    name = os.path.basename(dest)
+
+    try:
+        with phase("connect"):
+            total, validators = _probe(url, headers, verify)
+    except requests.exceptions.SSLError:
+        raise
+    except Exception as e:
+        print(f"⚠️ Could not probe {name} for Range support: {e}")
+        total, validators = None, None
+    if not total or total < min_size or connections < 2:
+        if total is None:
+            print(f"ℹ️ Server does not accept Range requests for {name}; using a single stream.")
+        return fetch(url, dest, headers=headers, verify=verify, retries=retries)
+    if restore(url, os.path.dirname(dest), outputs=[dest], verify=verify,
+               headers={"ETag": validators["etag"], "Last-Modified": validators["last_modified"]}):
+        _discard(part, meta)
+        return dest
+
+    validator = _validator(validators)
+    state = _load_state(meta) if os.path.exists(part) else {}
+    if state.get("segments") and state.get("total") == total and validator and state.get("validator") == validator:
+        print(f"↪️ Resuming {name} ({len(state['segments'])} segments)")
+    else:
+        state = {"url": url, "validator": validator, "total": total, **validators,
+                 "segments": [[start, end, start] for start, end in _split(total, connections)]}
+        with open(part, "wb") as f:
+            f.truncate(total)  # preallocate so every segment can be written in place
+    _save_state(meta, state)
+
+    lock = Lock()
+    done = sum(pos - start for start, _, pos in state["segments"])
+    bar = tqdm(total=total, initial=done, unit='B', unit_scale=True, desc=name)
+
+    def fetch_segment(segment):
+        start, end, pos = segment
+        for attempt in range(1, retries + 1):
+            if pos > end:
+                return
+            req_headers = dict(headers or {})
+            req_headers.update({"Range": f"bytes={pos}-{end}", "Accept-Encoding": "identity"})
+            if validator:
+                req_headers["If-Range"] = validator
+            try:
+                # unbuffered, so bytes below segment[2] are already in the file for _hash_behind
+                with get(url, stream=True, headers=req_headers, verify=verify) as r, open(part, "r+b", buffering=0) as f:
+                    if r.status_code != 206:
+                        raise Exception(f"expected a partial response, got status {r.status_code}")
+                    f.seek(pos)
+                    for block in iter_into(r):
+                        f.write(block)
+                        pos += len(block)
+                        segment[2] = pos
+                        bar.update(len(block))
+                        throttle(len(block))
+                if pos <= end:
+                    raise IOError(f"segment ended early at byte {pos}")
+                return
+            except requests.exceptions.SSLError:
+                raise
+            except Exception as e:
+                print(f"⚠️ Segment {start}-{end} of {name}, attempt {attempt}/{retries} failed: {e}")
+                if attempt < retries:
+                    time.sleep(backoff(attempt))
+            finally:
+                with lock:
+                    segment[2] = pos
+                    _save_state(meta, state)
+        raise IOError(f"segment {start}-{end} failed after {retries} attempts")
+
+    started = time.time()
+    check = StreamCheck(url)
+    finished = Event()
+    try:
+        with phase("transfer"), ThreadPoolExecutor(max_workers=connections + 1) as pool:
+            hashing = pool.submit(_hash_behind, check, part, state["segments"], finished)
+            try:
+                for future in [pool.submit(fetch_segment, seg) for seg in state["segments"]]:
+                    future.result()
+            finally:
+                finished.set()
+            hashing.result()
+        elapsed = max(time.time() - started, 1e-6)
+        fetched = total - done
+        print(f"✅ {name}: {fetched / elapsed / 1e6:.1f} MB/s over {len(state['segments'])} connections")
+        return _finish(url, part, meta, dest, total, check)
+    except ChecksumError as e:
+        print(f"❌ {e}; the download was discarded")
+        return None
+    except requests.exceptions.SSLError:
+        raise
+    except Exception as e:
+        print(f"❌ Segmented download of {name} failed: {e}; partial data kept in {part}")
+        return None
+    finally:
+        bar.close()
+        check.close()
+        add_bytes(sum(pos - start for start, _, pos in state["segments"]) - done)  # worker threads don't see the task record
+
+def benchmark_segmented(url, connections=SEGMENT_CONNECTIONS, workdir="."):
+    """Download `url` once as a single stream and once segmented; report MB/s and speedup."""
+    results = {}
+    for label, conns in (("single", 1), ("segmented", connections)):
+        dest = os.path.join(workdir, f".bench_{label}_{os.path.basename(url)}")
+        for leftover in (dest, dest + ".part", dest + ".part.json"):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        started = time.time()
+        ok = fetch(url, dest) if conns == 1 else fetch_segmented(url, dest, connections=conns, min_size=0)
+        elapsed = max(time.time() - started, 1e-6)
+        if ok:
+            results[label] = os.path.getsize(dest) / elapsed / 1e6
+            os.remove(dest)
+    if "single" in results and "segmented" in results:
+        print(f"single: {results['single']:.1f} MB/s, segmented x{connections}: "
+              f"{results['segmented']:.1f} MB/s ({results['segmented'] / results['single']:.2f}x)")
+    return results
+
+def download_file(url, filename, subdir, **kwargs):
+    """Download `url` into DATA_DIR/<subdir>/<filename> unless the local copy is up to date."""
+    target_dir = os.path.join(DATA_DIR, subdir)
+    os.makedirs(target_dir, exist_ok=True)
+    filepath = os.path.join(target_dir, filename)
+
+    if is_fresh(url, [filepath], headers=kwargs.get("headers"), verify=kwargs.get("verify")):
+        print(f"✅ File is up to date: {filepath}")
+        return filepath
+
+    return fetch(url, filepath, **kwargs)
@@ -1,23 +1,22 @@
-import os, tarfile, requests, shutil
+import os
 from config.settings import ENHANCERATLAS_URL, DATA_DIR
-from tqdm import tqdm
+from utils.extract import stream_extract
+from utils.http_cache import is_fresh
+from utils.logger import log_download_task
 
+@log_download_task(script_name="enhanceratlas.py")
 def download():
     target_dir = os.path.join(DATA_DIR, "enhanceratlas")
     os.makedirs(target_dir, exist_ok=True)
-    tar_path = os.path.join(target_dir, "species_enh_bed.tar.gz")
+    dr_bed = os.path.join(target_dir, "dr.bed")
 
-    with requests.get(ENHANCERATLAS_URL, stream=True) as r:
-        with open(tar_path, "wb") as f, tqdm(total=int(r.headers.get('content-length', 0)), unit='B', unit_scale=True) as bar:
-            for chunk in r.iter_content(chunk_size=8192):
-                f.write(chunk)
-                bar.update(len(chunk))
+    # Skip the multi-species tarball entirely if dr.bed came from the current version
+    if is_fresh(ENHANCERATLAS_URL, [dr_bed]):
+        print("EnhancerAtlas 'dr.bed' is up to date.")
+        return
 
-    print("Extracting and cleaning up enhancer BED files...")
-    with tarfile.open(tar_path, "r:gz") as tar:
-        tar.extractall(path=target_dir)
-
-    for file in os.listdir(target_dir):
-        if file.endswith(".bed") and file != "dr.bed":
-            os.remove(os.path.join(target_dir, file))
-    print("EnhancerAtlas 'dr.bed' retained.")
\ No newline at end of file
+    # Stream the tarball and write only dr.bed; the archive and other species never hit the disk
+    print("Streaming EnhancerAtlas archive and extracting 'dr.bed'...")
+    if not stream_extract(ENHANCERATLAS_URL, target_dir, ["dr.bed"]):
+        raise Exception("dr.bed not found in the EnhancerAtlas archive")
+    print("EnhancerAtlas 'dr.bed' retained.")
@@ -1,16 +1,25 @@
 import os
-import requests
-import gzip
-import shutil
-from config.settings import ENSEMBL_FTP_BASE, DATA_DIR
+import zlib
+from config.settings import DATA_DIR, DOWNLOAD_RETRIES, ENSEMBL_FASTA_STREAMING, ENSEMBL_FASTA_BGZF, ENSEMBL_RELEASE_TTL, GTF_CACHE_DIR, ENSEMBL_FILE_TYPES
+from utils.build_state import record, up_to_date
+from utils.checksums import StreamCheck, published
+from utils.dwnld import fetch_segmented
+from utils.http_cache import get_json, is_fresh, remember, remembered
+from utils.bgzf import BgzfWriter
+from utils.fasta_store import FaiBuilder
+from utils.gtf_store import cached_gtf
+from utils.gunzip import gunzip
+from utils.matrix import entries, fan_out
+from utils.shared_store import restore, save
+from utils.logger import log_download_task, phase, add_bytes
+from utils.transport import get, iter_into, throttle
 from tqdm import tqdm
 
 def get_latest_release():
     try:
-        response = requests.get("https://rest.ensembl.org/info/data?content-type=application/json")
-        if response.ok:
-            data = response.json()
-            return max(data.get("releases", []))
+        # cached for ENSEMBL_RELEASE_TTL seconds so repeated runs don't hit rest.ensembl.org
+        data = get_json("https://rest.ensembl.org/info/data?content-type=application/json", ENSEMBL_RELEASE_TTL)
+        return max(data.get("releases", []))
     except Exception as e:
         print(f"Failed to fetch Ensembl release: {e}")
     return None
@@ -19,9 +28,8 @@ def extract_and_delete_gzip(file_path):
     """Extract .gz file, delete archive, and return extracted filename."""
     extracted_path = file_path.rstrip('.gz')
     try:
-        with gzip.open(file_path, 'rb') as f_in:
-            with open(extracted_path, 'wb') as f_out:
-                shutil.copyfileobj(f_in, f_out)
+        with phase("decompress"):
+            gunzip(file_path, extracted_path)  # parallel for BGZF/multi-member archives
         os.remove(file_path)  # <--- Delete the .gz file after extraction
         print(f"Extracted and removed archive: {file_path}")
         return extracted_path
@@ -33,7 +41,7 @@ def add_chr_prefix_to_fasta(file_path):
     """Add 'chr' prefix to FASTA headers (lines starting with '>') in-place."""
     temp_file = file_path + ".tmp"
     try:
-        with open(file_path, 'r') as infile, open(temp_file, 'w') as outfile:
+        with phase("post_process"), open(file_path, 'r') as infile, open(temp_file, 'w') as outfile:
             for line in infile:
                 if line.startswith('>'):
                     line = line.replace('>', '>chr', 1)
@@ -45,57 +53,223 @@ def add_chr_prefix_to_fasta(file_path):
         if os.path.exists(temp_file):
             os.remove(temp_file)
 
-def download():
-    release = get_latest_release()
-    if not release:
-        print("Could not determine the latest release.")
-        return
+def _prefix_headers(block, at_line_start):
+    """Add 'chr' to every FASTA header in a binary block; returns (block, next_at_line_start)."""
+    if not block:
+        return block, at_line_start
+    out = block.replace(b"\n>", b"\n>chr")
+    if at_line_start and out.startswith(b">"):
+        out = b">chr" + out[1:]
+    return out, block.endswith(b"\n")
+
+def _gunzip_stream(url, name, check):
+    """
+    Yield the decompressed bytes of a gzipped HTTP resource as they arrive,
+    feeding the compressed bytes to `check`; the stream is verified before the
+    last block is handed over, so the caller never renames a corrupt output.
+    """
+    d = zlib.decompressobj(zlib.MAX_WBITS | 16)
+    with phase("connect"):
+        r = get(url, stream=True, headers={"Accept-Encoding": "identity"})
+    with r:
+        r.raise_for_status()
+        with tqdm(total=int(r.headers.get('content-length', 0)) or None, unit='B', unit_scale=True, desc=name) as bar:
+            blocks = iter_into(r)
+            while True:
+                # phases are timed per step: the consumer runs while this generator is suspended
+                with phase("transfer"):
+                    block = next(blocks, None)
+                if block is None:
+                    break
+                bar.update(len(block))
+                add_bytes(len(block))
+                throttle(len(block))
+                check.update(block)
+                with phase("decompress"):
+                    data = d.decompress(block)
+                    while d.eof and d.unused_data:  # next member of a multi-member gzip
+                        rest = d.unused_data
+                        d = zlib.decompressobj(zlib.MAX_WBITS | 16)
+                        data += d.decompress(rest)
+                if data:
+                    yield data
+        if not d.eof:
+            raise IOError("gzip stream ended early")
+        check.verify(r.headers.get("ETag") or r.headers.get("Last-Modified"))
+        remember(url, r.headers)
+
+def stream_fasta_with_chr_prefix(url, dest, retries=DOWNLOAD_RETRIES):
+    """
+    Download a gzipped FASTA and write it to `dest` decompressed, with 'chr'
+    added to the headers, in a single pass. No .gz or .tmp copy is written;
+    the output goes to `dest + ".part"` and is renamed once the gzip stream
+    (including its CRC trailer) has been read completely. A copy of the
+    rewritten FASTA in the shared store is linked instead.
+    """
+    if restore(url, os.path.dirname(dest), "chr", outputs=[dest]):
+        return dest
+    part = dest + ".part"
+    name = os.path.basename(dest)
+    for attempt in range(1, retries + 1):
+        check = StreamCheck(url)
+        try:
+            at_line_start = True
+            with open(part, "wb") as out:
+                for data in _gunzip_stream(url, name, check):
+                    with phase("post_process"):
+                        block, at_line_start = _prefix_headers(data, at_line_start)
+                        out.write(block)
+            os.replace(part, dest)
+            check.record([dest])
+            save(url, check.validator, [dest], os.path.dirname(dest), "chr")
+            print(f"Downloaded, extracted and added 'chr' prefix: {dest}")
+            return dest
+        except Exception as e:
+            print(f"Attempt {attempt}/{retries} for {name} failed: {e}")
+        finally:
+            check.close()
+    if os.path.exists(part):
+        os.remove(part)
+    return None
 
-    urls = {
-        f"Danio_rerio.GRCz11.{release}.gtf.gz": f"{ENSEMBL_FTP_BASE}release-{release}/gtf/danio_rerio/Danio_rerio.GRCz11.{release}.gtf.gz",
-        f"Danio_rerio.GRCz11.dna.primary_assembly.fa.gz": f"{ENSEMBL_FTP_BASE}release-{release}/fasta/danio_rerio/dna/Danio_rerio.GRCz11.dna.primary_assembly.fa.gz",
+def stream_fasta_to_bgzf(url, dest, retries=DOWNLOAD_RETRIES):
+    """
+    Download a gzipped FASTA and re-block it as BGZF at `dest`, building the
+    `.fai` and `.gzi` indexes on the fly. Headers are left untouched; use
+    utils.fasta_store.FastaStore to read regions (it applies the 'chr' alias).
+    """
+    outputs = [dest, dest + ".fai", dest + ".gzi"]
+    if restore(url, os.path.dirname(dest), "bgzf", outputs=outputs):
+        return dest
+    part = dest + ".part"
+    name = os.path.basename(dest)
+    for attempt in range(1, retries + 1):
+        check = StreamCheck(url)
+        try:
+            fai = FaiBuilder()
+            with open(part, "wb") as out:
+                writer = BgzfWriter(out)
+                try:
+                    for data in _gunzip_stream(url, name, check):
+                        with phase("post_process"):
+                            writer.write(data)
+                            fai.feed(data)
+                finally:
+                    writer.close()
+            fai.write(dest + ".fai")
+            writer.write_gzi(dest + ".gzi")
+            os.replace(part, dest)
+            check.record([dest])
+            save(url, check.validator, outputs, os.path.dirname(dest), "bgzf")
+            print(f"Downloaded as indexed BGZF: {dest}")
+            return dest
+        except Exception as e:
+            print(f"Attempt {attempt}/{retries} for {name} failed: {e}")
+        finally:
+            check.close()
+    if os.path.exists(part):
+        os.remove(part)
+    return None
+
+def _source(url):
+    """
+    What an Ensembl output is built from: the checksum the release publishes
+    for the file (the same across releases while the file doesn't change),
+    or the URL itself when there is no CHECKSUMS entry.
+    """
+    listed = published(url)
+    return f"{listed[0]}:{listed[1]}" if listed else url
 
-        # f"Homo_sapiens.GRCh38.dna.primary_assembly.fa.gz": f"{ENSEMBL_FTP_BASE}release-{release}/fasta/homo_sapiens/dna/Homo_sapiens.GRCh38.dna.primary_assembly.fa.gz",
-        # f"Homo_sapiens.GRCh38.{release}.gtf.gz": f"{ENSEMBL_FTP_BASE}release-{release}/gtf/homo_sapiens/Homo_sapiens.GRCh38.{release}.gtf.gz"
-    }
+def download_one(filename, url, target_dir):
+    """
+    Download, extract and post-process one Ensembl file; returns the local
+    path or None. The output is rebuilt only when its source changed: a new
+    release whose CHECKSUMS entry for the file is unchanged reuses it.
+    """
+    dest = os.path.join(target_dir, filename)
+    extracted_dest = dest.rstrip('.gz')
+    primary = "primary_assembly.fa" in filename
+    bgzf = ENSEMBL_FASTA_BGZF and primary
+    outputs = [dest + ext for ext in ("", ".fai", ".gzi")] if bgzf else [extracted_dest]
+    step = f"ensembl {outputs[0]}"
+    params = {"source": _source(url), "layout": "bgzf" if bgzf else "chr" if primary else "plain"}
+
+    # same published checksum: unchanged whatever the URL; otherwise ask the server
+    if up_to_date(step, params=params, outputs=outputs, adopt=remembered(url)) and \
+            (params["source"] != url or is_fresh(url, outputs)):
+        print(f"{'Indexed BGZF' if bgzf else 'Extracted'} file is up to date: {outputs[0]}")
+        return outputs[0]
+    result = _build_one(filename, url, dest, extracted_dest, primary, bgzf)
+    if result:
+        record(step, params=params, outputs=outputs)
+    return result
+
+def _build_one(filename, url, dest, extracted_dest, primary, bgzf):
+    """Download and post-process one Ensembl file (see download_one)."""
+    # --- Primary assembly kept as indexed BGZF (read it with utils.fasta_store.FastaStore) ---
+    if bgzf:
+        return stream_fasta_to_bgzf(url, dest)
+    try:
+        # --- Primary assembly: download, extract and prefix headers in one pass ---
+        if ENSEMBL_FASTA_STREAMING and primary:
+            return stream_fasta_with_chr_prefix(url, extracted_dest)
+
+        if not fetch_segmented(url, dest):  # large files use parallel ranged connections
+            print(f"Failed to download {filename}")
+            return None
+        print(f"Downloaded: {filename}")
+
+        # --- EXTRACT and DELETE .gz file ---
+        extracted = extract_and_delete_gzip(dest)
+
+        # --- MODIFY FASTA HEADER if it's the primary assembly ---
+        if extracted and "primary_assembly.fa" in extracted:
+            add_chr_prefix_to_fasta(extracted)
+        return extracted
+
+    except Exception as e:
+        print(f"Failed to download {filename}: {e}")
+        return None
+
+@log_download_task(script_name="ensembl.py")
+def download(species=None, file_types=ENSEMBL_FILE_TYPES):
+    """
+    Download every species x file type cell of the matrix (ENABLED_SPECIES x
+    ENSEMBL_FILE_TYPES by default) for the latest Ensembl release. Files are
+    fetched concurrently: annotation first, at most MATRIX_LARGE_SLOTS genomes
+    at a time, all within the MAX_BANDWIDTH budget.
+    """
+    release = get_latest_release()
+    if not release:
+        raise Exception("Could not determine the latest release.")
 
     target_dir = os.path.join(DATA_DIR, "ensemblData")
     os.makedirs(target_dir, exist_ok=True)
 
-    extracted_files = []
-
-    for filename, url in urls.items():
-        dest = os.path.join(target_dir, filename)
-        extracted_dest = dest.rstrip('.gz')
-        if os.path.exists(extracted_dest):
-            print(f"Extracted file already exists: {extracted_dest}")
-            extracted_files.append(extracted_dest)
-            continue
-        try:
-            with requests.get(url, stream=True) as r:
-                r.raise_for_status()
-                with open(dest, 'wb') as f, tqdm(total=int(r.headers.get('content-length', 0)), unit='B', unit_scale=True) as bar:
-                    for chunk in r.iter_content(chunk_size=8192):
-                        f.write(chunk)
-                        bar.update(len(chunk))
-            print(f"Downloaded: {filename}")
-
-            # --- EXTRACT and DELETE .gz file ---
-            extracted = extract_and_delete_gzip(dest)
-            if extracted:
-                extracted_files.append(extracted)
-
-                # --- MODIFY FASTA HEADER if it's the primary assembly ---
-                if "primary_assembly.fa" in extracted:
-                    add_chr_prefix_to_fasta(extracted)
+    jobs = entries(file_types, species, release)
+    results = fan_out(jobs, lambda job: download_one(job["filename"], job["url"], target_dir))
+    extracted_files = [path for path in results if path]
+    failed = [job["filename"] for job, path in zip(jobs, results) if not path]
 
-        except Exception as e:
-            print(f"Failed to download {filename}: {e}")
+    # --- CONVERT GTFs to the columnar cache (no-op while the GTF is unchanged) ---
+    for f in extracted_files:
+        if f.endswith(".gtf"):
+            with phase("post_process"):
+                cached_gtf(f, GTF_CACHE_DIR)
 
-    # --- SAVE extracted filenames for reference ---
+    # --- SAVE extracted filenames for reference (rewritten only when the list changes) ---
     if extracted_files:
         reference_file = os.path.join(target_dir, "extracted_files.txt")
-        with open(reference_file, 'w') as ref:
-            for f in extracted_files:
-                ref.write(f + '\n')
-        print(f"Saved extracted file list to: {reference_file}")
+        params = {"release": release, "files": extracted_files}
+        if up_to_date(reference_file, params=params, outputs=[reference_file]):
+            print(f"Extracted file list is up to date: {reference_file}")
+        else:
+            with open(reference_file, 'w') as ref:
+                for f in extracted_files:
+                    ref.write(f + '\n')
+            record(reference_file, params=params, outputs=[reference_file])
+            print(f"Saved extracted file list to: {reference_file}")
+
+    # a partly failed refresh must fail the task (and `main.py run`'s exit status)
+    if failed:
+        raise Exception(f"Failed to download {len(failed)} of {len(jobs)} Ensembl file(s): {', '.join(failed)}")
@@ -0,0 +1,126 @@
+import os, tarfile, time, zipfile
+from fnmatch import fnmatch
+from tqdm import tqdm
+from config.settings import DOWNLOAD_RETRIES
+from utils.checksums import StreamCheck
+from utils.http_cache import remember
+from utils.logger import add_bytes, phase
+from utils.shared_store import restore, save
+from utils.transport import Body, backoff, get, throttle
+
+def wanted(name, patterns):
+    """True if an archive member matches any pattern, by full path or by file name."""
+    base = name.rsplit("/", 1)[-1]
+    return any(fnmatch(name, p) or fnmatch(base, p) for p in patterns)
+
+def _target(dest_dir, name, flatten):
+    """Where to write a member, refusing paths that would escape dest_dir."""
+    rel = name.rsplit("/", 1)[-1] if flatten else name
+    target = os.path.realpath(os.path.join(dest_dir, rel))
+    if not target.startswith(os.path.realpath(dest_dir) + os.sep):
+        raise ValueError(f"Unsafe path in archive: {name}")
+    return target
+
+def _write_member(src, target):
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    part = target + ".part"
+    with open(part, "wb") as out:
+        while True:
+            buf = src.read(1 << 20)
+            if not buf:
+                break
+            out.write(buf)
+    os.replace(part, target)
+
+class _CountingReader:
+    """File-like wrapper over an HTTP body that feeds the progress bar, byte counter and checksums."""
+
+    def __init__(self, body, bar, check):
+        self.raw = body
+        self.bar = bar
+        self.check = check
+
+    def read(self, n=-1):
+        data = self.raw.read(n)
+        self.check.update(data)
+        self.bar.update(len(data))
+        add_bytes(len(data))
+        throttle(len(data))
+        return data
+
+def stream_extract(url, dest_dir, patterns, mode="r|*", flatten=True, headers=None, verify=None, retries=DOWNLOAD_RETRIES):
+    """
+    Extract matching members of a tar archive straight from an HTTP response.
+
+    The archive is read as a stream (`r|gz`, `r|`, ... ; `r|*` detects the
+    compression), so neither the archive nor the members we don't want ever
+    touch the disk. `patterns` are glob patterns matched against the member path
+    or file name. With `flatten`, members are written directly into `dest_dir`.
+    The archive bytes are hashed on the way through and verified (see
+    utils.checksums) before the call succeeds. If the shared store holds the
+    members extracted from this version of the archive, they are linked from
+    there and the body is never read. Returns the list of extracted paths.
+    """
+    os.makedirs(dest_dir, exist_ok=True)
+    req_headers = dict(headers or {})
+    req_headers["Accept-Encoding"] = "identity"
+    name = url.split("/")[-1].split("?")[0]
+    variant = f"extract {int(flatten)} {'|'.join(patterns)}"
+
+    for attempt in range(1, retries + 1):
+        extracted = []
+        check = StreamCheck(url)
+        try:
+            with phase("connect"):
+                r = get(url, stream=True, headers=req_headers, verify=verify)
+            with r:
+                r.raise_for_status()
+                restored = restore(url, dest_dir, variant, headers=r.headers)
+                if restored is not None:
+                    return restored
+                with tqdm(total=int(r.headers.get("content-length", 0)) or None, unit='B', unit_scale=True, desc=name) as bar, \
+                     phase("transfer"):
+                    reader = _CountingReader(Body(r), bar, check)
+                    # 1 MiB reads instead of tarfile's 10 KiB records
+                    with tarfile.open(fileobj=reader, mode=mode, bufsize=1 << 20) as tar:
+                        for member in tar:
+                            if member.isfile() and wanted(member.name, patterns):
+                                target = _target(dest_dir, member.name, flatten)
+                                _write_member(tar.extractfile(member), target)
+                                extracted.append(target)
+                    while reader.read(1 << 20):  # tar padding after the end marker: the checksum covers the whole file
+                        pass
+                check.verify(r.headers.get("ETag") or r.headers.get("Last-Modified"))
+                remember(url, r.headers, outputs=extracted)
+                check.record(extracted)
+                save(url, check.validator, extracted, dest_dir, variant)
+            return extracted
+        except Exception as e:
+            print(f"⚠️ Attempt {attempt}/{retries} to stream-extract {name} failed: {e}")
+            if attempt < retries:
+                time.sleep(backoff(attempt))
+        finally:
+            check.close()
+    raise Exception(f"Failed to stream-extract {url}")
+
+def extract_members(filepath, dest_dir, patterns, flatten=False):
+    """Extract only the members matching `patterns` from a local .zip or .tar(.gz) file."""
+    os.makedirs(dest_dir, exist_ok=True)
+    extracted = []
+    with phase("decompress"):
+        if filepath.endswith(".zip"):
+            with zipfile.ZipFile(filepath) as zf:
+                for info in zf.infolist():
+                    if not info.is_dir() and wanted(info.filename, patterns):
+                        target = _target(dest_dir, info.filename, flatten)
+                        with zf.open(info) as src:
+                            _write_member(src, target)
+                        extracted.append(target)
+        else:
+            with tarfile.open(filepath, "r|*") as tar:
+                for member in tar:
+                    if member.isfile() and wanted(member.name, patterns):
+                        target = _target(dest_dir, member.name, flatten)
+                        _write_member(tar.extractfile(member), target)
+                        extracted.append(target)
+    return extracted
@@ -0,0 +1,149 @@
+import mmap
+from bisect import bisect_right
+from utils.bgzf import read_block, load_gzi
+
+class FaiBuilder:
+    """
+    Build a samtools-style .fai index incrementally from uncompressed FASTA bytes.
+
+    Bytes are fed in arbitrary blocks as they come off the network; only header
+    lines and the first sequence line of each record are ever buffered.
+    """
+
+    def __init__(self):
+        self.records = []  # [name, length, offset, linebases, linewidth]
+        self.pos = 0
+        self.header = None
+        self.first_line = None
+        self.raw = self.newlines = self.returns = 0
+
+    def _close_record(self):
+        if self.records:
+            self.records[-1][1] = self.raw - self.newlines - self.returns
+
+    def feed(self, data):
+        i, n = 0, len(data)
+        while i < n:
+            if self.header is not None:
+                j = data.find(b"\n", i)
+                if j < 0:
+                    self.header += data[i:]
+                    break
+                self.header += data[i:j]
+                name = self.header[1:].split()[0].decode() if self.header[1:].strip() else ""
+                self.records.append([name, 0, self.pos + j + 1, 0, 0])
+                self.header = None
+                self.first_line = bytearray()
+                self.raw = self.newlines = self.returns = 0
+                i = j + 1
+                continue
+
+            j = data.find(b">", i)
+            end = n if j < 0 else j
+            seq = data[i:end]
+            if self.first_line is not None and seq:
+                k = seq.find(b"\n")
+                self.first_line += seq if k < 0 else seq[:k]
+                if k >= 0:
+                    self.records[-1][3] = len(self.first_line.rstrip(b"\r"))
+                    self.records[-1][4] = len(self.first_line) + 1
+                    self.first_line = None
+            self.raw += len(seq)
+            self.newlines += seq.count(b"\n")
+            self.returns += seq.count(b"\r")
+            if j >= 0:
+                self._close_record()
+                self.header = bytearray(b">")
+                i = j + 1
+            else:
+                i = n
+        self.pos += n
+
+    def write(self, path):
+        self._close_record()
+        with open(path, "w") as f:
+            for name, length, offset, linebases, linewidth in self.records:
+                if not linebases:  # single-line (or empty) sequence
+                    linebases, linewidth = length, length + 1
+                f.write(f"{name}\t{length}\t{offset}\t{linebases}\t{linewidth}\n")
+
+def load_fai(path):
+    index = {}
+    with open(path) as f:
+        for line in f:
+            name, length, offset, linebases, linewidth = line.rstrip("\n").split("\t")[:5]
+            index[name] = (int(length), int(offset), int(linebases), int(linewidth))
+    return index
+
+class FastaStore:
+    """
+    Random access to a BGZF-compressed FASTA through its .fai and .gzi indexes.
+
+    The compressed file is memory-mapped; a region lookup binary-searches the
+    .gzi for the right block and decompresses only the blocks it spans.
+    Sequence names are matched with or without the 'chr' prefix, so the
+    Ensembl file ('1') answers UCSC-style queries ('chr1') without rewriting
+    its headers.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.index = load_fai(path + ".fai")
+        self.coffsets, self.uoffsets = load_gzi(path + ".gzi")
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._cache = {}
+
+    def close(self):
+        self._mm.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def resolve(self, chrom):
+        """Map a requested name to the one in the index, applying the 'chr' alias."""
+        if chrom in self.index:
+            return chrom
+        alias = chrom[3:] if chrom.startswith("chr") else "chr" + chrom
+        if alias in self.index:
+            return alias
+        raise KeyError(f"Sequence not found: {chrom}")
+
+    def lengths(self):
+        return {name: rec[0] for name, rec in self.index.items()}
+
+    def _block(self, i):
+        if i not in self._cache:
+            if len(self._cache) > 64:
+                self._cache.clear()
+            self._cache[i] = read_block(self._mm, self.coffsets[i])[0]
+        return self._cache[i]
+
+    def _read(self, start, end):
+        """Read uncompressed bytes [start, end) of the FASTA file."""
+        i = bisect_right(self.uoffsets, start) - 1
+        out = bytearray()
+        while start < end and i < len(self.uoffsets):
+            block = self._block(i)
+            lo = start - self.uoffsets[i]
+            chunk = block[lo:lo + (end - start)]
+            out += chunk
+            start += len(chunk)
+            i += 1
+        return bytes(out)
+
+    def fetch(self, chrom, start=0, end=None):
+        """Return the sequence of `chrom` in the 0-based half-open range [start, end)."""
+        length, offset, linebases, linewidth = self.index[self.resolve(chrom)]
+        end = length if end is None else min(end, length)
+        start = max(start, 0)
+        if start >= end:
+            return ""
+        byte_start = offset + (start // linebases) * linewidth + start % linebases
+        last = end - 1
+        byte_end = offset + (last // linebases) * linewidth + last % linebases + 1
+        return self._read(byte_start, byte_end).replace(b"\n", b"").replace(b"\r", b"").decode()
@@ -0,0 +1,193 @@
+import ftplib, os, queue, threading, time, zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from config.settings import DOWNLOAD_RETRIES, FTP_SESSIONS, FTP_TIMEOUT
+from utils.checksums import StreamCheck, intact
+from utils.state_file import load_json, save_json
+from utils.transport import backoff, throttle
+
+class FtpPool:
+    """
+    A small pool of logged-in FTP control connections shared by worker threads,
+    so fetching many files costs one login per session instead of one per file.
+    A session that fails mid-command is dropped and replaced on next use.
+    """
+
+    def __init__(self, host, port=21, size=FTP_SESSIONS, user="anonymous", passwd="", timeout=FTP_TIMEOUT):
+        self.host, self.port, self.user, self.passwd, self.timeout = host, port, user, passwd, timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _connect(self):
+        ftp = ftplib.FTP(timeout=self.timeout)
+        ftp.connect(self.host, self.port)
+        ftp.login(self.user, self.passwd)
+        ftp.voidcmd("TYPE I")  # binary mode: SIZE and REST count real bytes
+        return ftp
+
+    @contextmanager
+    def session(self):
+        self._slots.acquire()
+        ftp = None
+        try:
+            try:
+                ftp = self._idle.get_nowait()
+            except queue.Empty:
+                ftp = self._connect()
+            yield ftp
+        except Exception:
+            if ftp is not None:
+                ftp.close()
+                ftp = None
+            raise
+        finally:
+            if ftp is not None:
+                self._idle.put(ftp)
+            self._slots.release()
+
+    def close(self):
+        while True:
+            try:
+                ftp = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                ftp.quit()
+            except Exception:
+                ftp.close()
+
+def remote_stat(ftp, path):
+    """{"size", "mdtm"} of a remote file, used to spot changes and restarted uploads."""
+    return {"size": ftp.size(path), "mdtm": ftp.voidcmd(f"MDTM {path}").split()[-1]}
+
+def _inflate(d, data):
+    """Decompress `data` with gzip decompressor `d`, following multi-member streams; returns (d, output)."""
+    out = d.decompress(data)
+    while d.eof and d.unused_data:
+        rest = d.unused_data
+        d = zlib.decompressobj(zlib.MAX_WBITS | 16)
+        out += d.decompress(rest)
+    return d, out
+
+def fetch_gz(ftp, remote_path, dest, info, counted=None):
+    """
+    RETR a gzipped file and write it decompressed to `dest` as it arrives.
+
+    The compressed bytes are also kept in `dest + ".gz.part"` until the transfer
+    is complete, so a broken transfer resumes with REST from where it stopped;
+    the decompressor is rebuilt from that local prefix first. If `info` (the
+    remote size/MDTM) differs from the one the partial file was started with,
+    the transfer starts over. The compressed bytes are hashed along the way and
+    checked against the hash recorded for the same SIZE/MDTM, if any. Returns
+    the number of bytes transferred; `counted(n)`, if given, is called as
+    they arrive, so an attempt that fails still has its bytes counted.
+    """
+    gz_part, out_part, meta = dest + ".gz.part", dest + ".part", dest + ".gz.part.json"
+    if load_json(meta) != info or not os.path.exists(gz_part):
+        open(gz_part, "wb").close()
+        save_json(meta, info)
+    offset = os.path.getsize(gz_part)
+
+    d = zlib.decompressobj(zlib.MAX_WBITS | 16)
+    transferred = 0
+    check = StreamCheck(f"ftp://{ftp.host}{remote_path}")
+    try:
+        with open(out_part, "wb") as out:
+            with open(gz_part, "rb") as prefix:
+                for block in iter(lambda: prefix.read(1 << 20), b""):
+                    check.update(block)
+                    d, data = _inflate(d, block)
+                    out.write(data)
+            with open(gz_part, "ab") as raw:
+                def sink(block):
+                    nonlocal d, transferred
+                    raw.write(block)
+                    check.update(block)
+                    transferred += len(block)
+                    if counted is not None:
+                        counted(len(block))
+                    throttle(len(block))
+                    d, data = _inflate(d, block)
+                    out.write(data)
+                if offset < info["size"]:
+                    ftp.retrbinary(f"RETR {remote_path}", sink, blocksize=1 << 16, rest=offset or None)
+
+        size = os.path.getsize(gz_part)
+        if size != info["size"]:
+            raise IOError(f"incomplete transfer ({size} of {info['size']} bytes)")
+        if not d.eof:
+            raise IOError("gzip stream ended early")
+        try:
+            check.verify(f"{info['size']}-{info['mdtm']}")
+        except IOError:
+            os.remove(gz_part)  # corrupt: start over on the next attempt
+            raise
+        os.replace(out_part, dest)
+        check.record([dest])
+    finally:
+        check.close()
+    os.remove(gz_part)
+    os.remove(meta)
+    return transferred
+
+def fetch_tables(host, directory, names, out_dir, port=21, sessions=FTP_SESSIONS, retries=DOWNLOAD_RETRIES,
+                 suffix=".txt.gz", ext=".tsv"):
+    """
+    Fetch `directory/<name><suffix>` for every name over a pool of `sessions`
+    reused FTP logins, decompressing each into `out_dir/<name><ext>`.
+
+    A file is skipped when the local copy exists and the remote SIZE and MDTM
+    match what was recorded in `out_dir/ftp_manifest.json` when it was fetched.
+    Broken transfers are retried with backoff and resumed with REST. Returns
+    {name: {"path", "bytes", "skipped"}}; raises if any file failed.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    manifest_path = os.path.join(out_dir, "ftp_manifest.json")
+    manifest = load_json(manifest_path)
+    lock = threading.Lock()
+    pool = FtpPool(host, port, size=sessions)
+
+    def fetch_one(name):
+        remote = f"{directory.rstrip('/')}/{name}{suffix}"
+        dest = os.path.join(out_dir, name + ext)
+        transferred = 0
+
+        def counted(n):  # every attempt's bytes, including those of broken transfers
+            nonlocal transferred
+            transferred += n
+
+        for attempt in range(1, retries + 1):
+            try:
+                with pool.session() as ftp:
+                    info = remote_stat(ftp, remote)
+                    if os.path.exists(dest) and manifest.get(name) == info and intact(dest):
+                        print(f"[✔] {name}{ext} is up to date")
+                        return {"path": dest, "bytes": 0, "skipped": True}
+                    print(f"[INFO] Fetching {remote} ...")
+                    fetch_gz(ftp, remote, dest, info, counted)
+                with lock:
+                    manifest[name] = info
+                    save_json(manifest_path, manifest)
+                return {"path": dest, "bytes": transferred, "skipped": False}
+            except ftplib.error_perm:
+                raise  # missing table / permission: retrying won't help
+            except Exception as e:
+                print(f"⚠️ {name}: attempt {attempt}/{retries} failed: {e}")
+                if attempt < retries:
+                    time.sleep(backoff(attempt))
+        raise IOError(f"{name}: failed after {retries} attempts")
+
+    results, errors = {}, {}
+    try:
+        with ThreadPoolExecutor(max_workers=sessions) as ex:
+            futures = {name: ex.submit(fetch_one, name) for name in names}
+            for name, future in futures.items():
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    errors[name] = e
+    finally:
+        pool.close()
+    if errors:
+        raise Exception("; ".join(f"{name}: {e}" for name, e in errors.items()))
+    return results
@@ -1,30 +1,50 @@
-import ftplib
-import gzip
-import shutil
 import os
+from config.settings import UCSC_FTP_HOST, UCSC_TABLES, FTP_SESSIONS, SPECIES, DEFAULT_SPECIES, ENABLED_SPECIES, TABIX_OUTPUTS
+from utils.ftp_pool import fetch_tables
+from utils.intervals import TABLE_COLUMNS, UCSC_TABLE_COLUMNS
+from utils.logger import log_download_task, phase, add_bytes, cache_event
+from utils.tabix import index_bed
 
-def download_ucsc_gap_data(assembly="danRer11", table_name="gap", out_dir="data/ucsc_gap"):
-    ftp_host = "hgdownload.soe.ucsc.edu"
+@log_download_task(script_name="gaps_ftp.py")
+def download_ucsc_tables(assembly="danRer11", tables=UCSC_TABLES, out_dir="data/ucsc_gap", host=UCSC_FTP_HOST, port=21):
+    """
+    Fetch goldenPath/{assembly}/database tables (gap, cytoBand, rmsk, ...) as
+    <table>.tsv over a few reused FTP sessions, gunzipping while they download.
+    Tables unchanged on the server (same SIZE and MDTM) are not fetched again.
+    """
     ftp_path = f"/goldenPath/{assembly}/database"
-    filename_gz = f"{table_name}.txt.gz"
-    filename_tsv = f"{table_name}.tsv"
-
-    os.makedirs(out_dir, exist_ok=True)
-    local_gz_path = os.path.join(out_dir, filename_gz)
-    local_tsv_path = os.path.join(out_dir, filename_tsv)
+    print(f"Connecting to UCSC FTP: {host} ({len(tables)} table(s), {FTP_SESSIONS} session(s)) .....")
+    with phase("transfer"):
+        results = fetch_tables(host, ftp_path, tables, out_dir, port=port)
+    for table, res in results.items():
+        add_bytes(res["bytes"])  # counted here: the worker threads don't see the task record
+        cache_event(res["skipped"])
+    if TABIX_OUTPUTS:
+        with phase("post_process"):
+            for table, res in results.items():
+                columns = TABLE_COLUMNS.get(table, UCSC_TABLE_COLUMNS)
+                if columns is None:
+                    continue  # not positional
+                try:
+                    index_bed(res["path"], columns)
+                except (ValueError, IndexError) as e:
+                    print(f"⚠️ {table}: no tabix index ({e}); add its columns to intervals.TABLE_COLUMNS")
+    print(f"[DONE] UCSC tables saved to: {out_dir}")
+    return {table: res["path"] for table, res in results.items()}
 
-    print(f"Connecting to UCSC FTP: {ftp_host} .....")
-    with ftplib.FTP(ftp_host) as ftp:
-        ftp.login()
-        ftp.cwd(ftp_path)
-        print(f"[INFO] Downloading {filename_gz} ...")
-        with open(local_gz_path, "wb") as f:
-            ftp.retrbinary(f"RETR {filename_gz}", f.write)
+@log_download_task(script_name="gaps_ftp.py")
+def download_all(tables=UCSC_TABLES):
+    """
+    UCSC tables for every species in ENABLED_SPECIES; the default species keeps
+    data/ucsc_gap, the others go to data/ucsc_gap/<assembly>.
+    """
+    paths = {}
+    for species in ENABLED_SPECIES:
+        assembly = SPECIES[species]["ucsc"]
+        out_dir = "data/ucsc_gap" if species == DEFAULT_SPECIES else os.path.join("data/ucsc_gap", assembly)
+        paths[assembly] = download_ucsc_tables(assembly, tables, out_dir)
+    return paths
 
-    print(f"Extracting to {filename_tsv} ...")
-    with gzip.open(local_gz_path, "rb") as f_in:
-        with open(local_tsv_path, "wb") as f_out:
-            shutil.copyfileobj(f_in, f_out)
-
-    os.remove(local_gz_path)
-    print(f"[DONE] Gap track data saved to: {local_tsv_path}")
\ No newline at end of file
+def download_ucsc_gap_data(assembly="danRer11", table_name="gap", out_dir="data/ucsc_gap"):
+    """Gap track only, saved as <out_dir>/gap.tsv."""
+    return download_ucsc_tables(assembly, [table_name], out_dir)[table_name]
@@ -0,0 +1,256 @@
+import json, os, re, shutil
+from array import array
+import numpy as np
+from utils.chain import cache_is_current, source_signature
+from utils.intervals import overlap_pairs
+
+_ATTR = re.compile(r'(\S+)\s+(?:"([^"]*)"|([^;\s]+))\s*;?')
+_COLUMNS = ("starts", "ends", "maxends", "features", "sources", "scores", "strands", "frames")
+INDEXED_ATTRS = ("gene_id", "gene_name", "transcript_id")
+
+class GtfStore:
+    """
+    Columnar, memory-mapped copy of a GTF file built by build_gtf_cache().
+
+    Rows are sorted by chromosome and start. Coordinates are 0-based half-open
+    (GTF start - 1, GTF end). Every attribute is a column of int32 codes into
+    its own vocabulary (-1 where a row lacks it). Each chromosome also keeps a
+    running maximum of ends, which turns overlap queries into two binary searches.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        with open(os.path.join(cache_dir, "meta.json")) as f:
+            self.meta = json.load(f)
+        for key in _COLUMNS:
+            setattr(self, key, np.load(os.path.join(cache_dir, key + ".npy"), mmap_mode="r"))
+        self.chroms = {name: tuple(bounds) for name, bounds in self.meta["chroms"].items()}
+        self._chrom_names = list(self.chroms)
+        self._chrom_starts = np.array([lo for lo, _ in self.chroms.values()], dtype=np.int64)
+        self._attrs, self._vocabs, self._codes = {}, {}, {}
+
+    def __len__(self):
+        return self.meta["rows"]
+
+    @property
+    def attribute_names(self):
+        return list(self.meta["attributes"])
+
+    def attr_codes(self, key):
+        if key not in self._attrs:
+            self._attrs[key] = np.load(os.path.join(self.cache_dir, "attrs", key + ".npy"), mmap_mode="r")
+        return self._attrs[key]
+
+    def vocab(self, key):
+        """Distinct values of an attribute, indexed by code."""
+        if key not in self._vocabs:
+            with open(os.path.join(self.cache_dir, "attrs", key + ".txt"), encoding="utf-8") as f:
+                self._vocabs[key] = f.read().split("\n")[:-1]
+        return self._vocabs[key]
+
+    def code(self, key, value):
+        """Code of `value` in attribute `key`, or -1 if it never occurs."""
+        if key not in self._codes:
+            self._codes[key] = {v: i for i, v in enumerate(self.vocab(key))}
+        return self._codes[key].get(value, -1)
+
+    def attr(self, key, rows):
+        """Decoded values of attribute `key` for `rows` (None where missing)."""
+        if key not in self.meta["attributes"]:
+            return [None] * len(rows)
+        vocab = self.vocab(key)
+        return [vocab[c] if c >= 0 else None for c in self.attr_codes(key)[rows].tolist()]
+
+    def rows(self, key, value):
+        """Row ids whose attribute `key` equals `value` (indexed attributes are O(1))."""
+        c = self.code(key, value)
+        if c < 0:
+            return np.array([], dtype=np.int64)
+        if key in self.meta["indexed"]:
+            ptr = np.load(os.path.join(self.cache_dir, "attrs", key + ".ptr.npy"), mmap_mode="r")
+            order = np.load(os.path.join(self.cache_dir, "attrs", key + ".order.npy"), mmap_mode="r")
+            return np.sort(order[ptr[c]:ptr[c + 1]])
+        return np.flatnonzero(self.attr_codes(key) == c)
+
+    def chrom_of(self, rows):
+        idx = np.searchsorted(self._chrom_starts, np.asarray(rows), side="right") - 1
+        return [self._chrom_names[i] for i in np.atleast_1d(idx)]
+
+    def record(self, row):
+        """One row as a dict of the GTF columns plus its attributes."""
+        row = int(row)
+        rec = {
+            "seqname": self.chrom_of([row])[0],
+            "source": self.meta["sources"][self.sources[row]],
+            "feature": self.meta["features"][self.features[row]],
+            "start": int(self.starts[row]),
+            "end": int(self.ends[row]),
+            "score": None if np.isnan(self.scores[row]) else float(self.scores[row]),
+            "strand": {1: "+", -1: "-"}.get(int(self.strands[row]), "."),
+            "frame": None if self.frames[row] < 0 else int(self.frames[row]),
+        }
+        for key in self.meta["attributes"]:
+            c = int(self.attr_codes(key)[row])
+            if c >= 0:
+                rec[key] = self.vocab(key)[c]
+        return rec
+
+    def _feature_rows(self, rows, feature):
+        if feature is None:
+            return rows
+        if feature not in self.meta["features"]:
+            return rows[:0]
+        return rows[self.features[rows] == self.meta["features"].index(feature)]
+
+    def gene(self, name):
+        """The 'gene' record for a gene_id or gene_name, or None."""
+        for key in ("gene_id", "gene_name"):
+            rows = self._feature_rows(self.rows(key, name), "gene")
+            if len(rows):
+                return self.record(rows[0])
+        return None
+
+    def transcripts(self, gene_id):
+        """'transcript' records of a gene."""
+        return [self.record(r) for r in self._feature_rows(self.rows("gene_id", gene_id), "transcript")]
+
+    def overlap(self, chrom, start, end, feature=None):
+        """Row ids on `chrom` overlapping [start, end), optionally of one feature type."""
+        if chrom not in self.chroms:
+            return np.array([], dtype=np.int64)
+        lo, hi = self.chroms[chrom]
+        first = lo + np.searchsorted(self.maxends[lo:hi], start, side="right")
+        last = lo + np.searchsorted(self.starts[lo:hi], end, side="left")
+        rows = np.arange(first, max(first, last))
+        rows = rows[self.ends[rows] > start]
+        return self._feature_rows(rows, feature)
+
+    def overlap_batch(self, chrom, starts, ends, feature=None):
+        """
+        Overlaps for many [start, end) queries on one chromosome at once.
+        Returns (query index, row id) arrays.
+        """
+        starts, ends = np.asarray(starts, dtype=np.int64), np.asarray(ends, dtype=np.int64)
+        empty = np.array([], dtype=np.int64)
+        if chrom not in self.chroms or not len(starts):
+            return empty, empty
+        lo, hi = self.chroms[chrom]
+        query, rows = overlap_pairs(self.starts[lo:hi], self.ends[lo:hi], self.maxends[lo:hi], starts, ends)
+        rows = rows + lo
+        if feature is not None:
+            fid = self.meta["features"].index(feature) if feature in self.meta["features"] else -1
+            keep = self.features[rows] == fid
+            query, rows = query[keep], rows[keep]
+        return query, rows
+
+def _parse(path):
+    """Read a GTF into column arrays, dictionary-encoding the attributes as it goes."""
+    chrom_ids, feature_ids, source_ids = {}, {}, {}
+    cols = {k: array("q") for k in ("chrom", "start", "end")}
+    small = {k: array("b") for k in ("strand", "frame")}
+    feats, srcs, scores = array("i"), array("i"), array("f")
+    attr_codes, attr_vocab = {}, {}
+    n = 0
+
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("#") or not line.strip():
+                continue
+            fields = line.rstrip("\r\n").split("\t", 8)
+            if len(fields) < 8:
+                continue
+            cols["chrom"].append(chrom_ids.setdefault(fields[0], len(chrom_ids)))
+            srcs.append(source_ids.setdefault(fields[1], len(source_ids)))
+            feats.append(feature_ids.setdefault(fields[2], len(feature_ids)))
+            cols["start"].append(int(fields[3]) - 1)
+            cols["end"].append(int(fields[4]))
+            scores.append(float("nan") if fields[5] == "." else float(fields[5]))
+            small["strand"].append(1 if fields[6] == "+" else -1 if fields[6] == "-" else 0)
+            small["frame"].append(-1 if fields[7] == "." else int(fields[7]))
+
+            values = {}
+            for key, quoted, bare in _ATTR.findall(fields[8] if len(fields) > 8 else ""):
+                value = quoted if quoted or not bare else bare
+                values[key] = values[key] + "," + value if key in values else value  # repeated keys (tag, ...)
+            for key, value in values.items():
+                if key not in attr_codes:
+                    attr_codes[key] = array("i", [-1]) * n
+                    attr_vocab[key] = {}
+                codes = attr_codes[key]
+                codes.extend([-1] * (n - len(codes)))
+                vocab = attr_vocab[key]
+                codes.append(vocab.setdefault(value, len(vocab)))
+            n += 1
+
+    for codes in attr_codes.values():
+        codes.extend([-1] * (n - len(codes)))
+    arrays = {
+        "chrom": np.frombuffer(cols["chrom"], dtype=np.int64),
+        "starts": np.frombuffer(cols["start"], dtype=np.int64),
+        "ends": np.frombuffer(cols["end"], dtype=np.int64),
+        "features": np.frombuffer(feats, dtype=np.int32).astype(np.int16),
+        "sources": np.frombuffer(srcs, dtype=np.int32).astype(np.int16),
+        "scores": np.frombuffer(scores, dtype=np.float32),
+        "strands": np.frombuffer(small["strand"], dtype=np.int8),
+        "frames": np.frombuffer(small["frame"], dtype=np.int8),
+    }
+    attrs = {key: np.frombuffer(codes, dtype=np.int32) for key, codes in attr_codes.items()}
+    names = lambda ids: sorted(ids, key=ids.get)
+    vocabs = {key: names(vocab) for key, vocab in attr_vocab.items()}
+    return arrays, attrs, vocabs, names(chrom_ids), names(feature_ids), names(source_ids)
+
+def build_gtf_cache(path, cache_dir):
+    """Convert a GTF file into a GtfStore directory (written aside, then swapped in)."""
+    arrays, attrs, vocabs, chrom_names, feature_names, source_names = _parse(path)
+    order = np.lexsort((arrays["starts"], arrays["chrom"]))
+    chrom = arrays.pop("chrom")[order]
+
+    tmp = cache_dir + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(os.path.join(tmp, "attrs"))
+
+    for key, arr in arrays.items():
+        arrays[key] = arr[order]
+    bounds = np.searchsorted(chrom, np.arange(len(chrom_names) + 1))
+    maxends = np.empty_like(arrays["ends"])
+    for k in range(len(chrom_names)):
+        lo, hi = bounds[k], bounds[k + 1]
+        maxends[lo:hi] = np.maximum.accumulate(arrays["ends"][lo:hi])
+    arrays["maxends"] = maxends
+    for key in _COLUMNS:
+        np.save(os.path.join(tmp, key + ".npy"), arrays[key])
+
+    indexed = []
+    for key, codes in attrs.items():
+        codes = codes[order]
+        np.save(os.path.join(tmp, "attrs", key + ".npy"), codes)
+        with open(os.path.join(tmp, "attrs", key + ".txt"), "w", encoding="utf-8") as f:
+            f.writelines(v + "\n" for v in vocabs[key])
+        if key in INDEXED_ATTRS:  # CSR: rows with code c are order[ptr[c]:ptr[c+1]]
+            present = np.flatnonzero(codes >= 0)
+            by_code = present[np.argsort(codes[present], kind="stable")]
+            ptr = np.concatenate([[0], np.cumsum(np.bincount(codes[present], minlength=len(vocabs[key])))])
+            np.save(os.path.join(tmp, "attrs", key + ".order.npy"), by_code)
+            np.save(os.path.join(tmp, "attrs", key + ".ptr.npy"), ptr)
+            indexed.append(key)
+
+    meta = {"source": source_signature(path), "rows": int(len(chrom)),
+            "chroms": {name: [int(bounds[k]), int(bounds[k + 1])] for k, name in enumerate(chrom_names)},
+            "features": feature_names, "sources": source_names,
+            "attributes": list(attrs), "indexed": indexed}
+    with open(os.path.join(tmp, "meta.json"), "w") as f:
+        json.dump(meta, f)  # written last: marks the cache complete
+
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    os.replace(tmp, cache_dir)
+
+def cached_gtf(path, cache_root):
+    """
+    Return a GtfStore for a GTF file, converting it only if there is no cache
+    yet or the content of the source file changed since it was built.
+    """
+    cache_dir = os.path.join(cache_root, os.path.basename(path))
+    if not cache_is_current(cache_dir, path):
+        print(f"Converting GTF {path} into {cache_dir} ...")
+        build_gtf_cache(path, cache_dir)
+    return GtfStore(cache_dir)
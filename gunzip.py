@@ -0,0 +1,293 @@
+import mmap, os, queue, struct, threading, zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from config.settings import GUNZIP_WORKERS, GUNZIP_CHUNK_BYTES
+
+MAGIC = b"\x1f\x8b\x08"
+FHCRC, FEXTRA, FNAME, FCOMMENT = 2, 4, 8, 16
+PIPELINE_BLOCK = 1 << 20
+
+def _header(buf, pos):
+    """
+    Parse the gzip member header at `pos` of `buf`. Returns (offset of the
+    deflate data, BGZF block size or None), or None if there is no complete,
+    plausible header there.
+    """
+    if buf[pos:pos + 3] != MAGIC or len(buf) < pos + 10:
+        return None
+    flags = buf[pos + 3]
+    if flags & 0xe0:  # reserved bits
+        return None
+    p, bsize = pos + 10, None
+    if flags & FEXTRA:
+        if len(buf) < p + 2:
+            return None
+        end = p + 2 + struct.unpack_from("<H", buf, p)[0]
+        if len(buf) < end:
+            return None
+        q = p + 2
+        while q + 4 <= end:
+            si1, si2, slen = struct.unpack_from("<BBH", buf, q)
+            if si1 == ord("B") and si2 == ord("C") and slen == 2 and q + 6 <= end:
+                bsize = struct.unpack_from("<H", buf, q + 4)[0] + 1
+            q += 4 + slen
+        p = end
+    for flag in (FNAME, FCOMMENT):
+        if flags & flag:
+            p = buf.find(b"\0", p) + 1
+            if not p:
+                return None
+    if flags & FHCRC:
+        p += 2
+    return (p, bsize) if p <= len(buf) else None
+
+def _padding(view, pos):
+    """True if everything from `pos` on is NUL padding (which gzip readers ignore)."""
+    return all(not bytes(view[p:p + (1 << 20)]).strip(b"\0") for p in range(pos, len(view), 1 << 20))
+
+def _members(view, pos, stop, write, limit=None):
+    """
+    Decompress the gzip members of `view` that start before `stop`, passing
+    the output to `write`; returns the offset after the last one. With
+    `limit`, a member still running at that offset is left alone and its
+    start returned (it began at a split that was not a member boundary).
+    """
+    while pos < stop:
+        if view[pos:pos + 3] != MAGIC:
+            if _padding(view, pos):
+                return len(view)
+            raise IOError(f"not a gzip member at offset {pos}")
+        start, d, step = pos, zlib.decompressobj(zlib.MAX_WBITS | 16), 1 << 16
+        pieces = []  # held back while the member may still be abandoned at `limit`
+        emit = write if limit is None else pieces.append
+        while not d.eof:
+            if limit is not None and pos >= limit:
+                return start
+            piece = view[pos:pos + step]
+            if not piece:
+                raise EOFError(f"gzip member at offset {start} is truncated")
+            emit(d.decompress(piece))
+            pos, step = pos + len(piece), 1 << 20  # the first piece holds a whole BGZF block
+        pos -= len(d.unused_data)
+        for data in pieces:
+            write(data)
+    return pos
+
+def _inflate_range(view, start, end):
+    """Decompress the members starting in [start, end); returns (output, offset after the last complete one)."""
+    out = []
+    pos = _members(view, start, end, out.append, limit=end)
+    return b"".join(out), pos
+
+def _plausible(buf, pos):
+    """True if a gzip member header at `pos` parses and its first 64 KiB inflate cleanly."""
+    if _header(buf, pos) is None:
+        return False
+    try:
+        zlib.decompressobj(zlib.MAX_WBITS | 16).decompress(buf[pos:pos + (1 << 16)])
+        return True
+    except zlib.error:
+        return False
+
+def _splits(buf, chunk_bytes, probe):
+    """
+    Offsets to cut `buf` at, about `chunk_bytes` apart, so every range starts
+    a gzip member. BGZF headers give each block's size, so blocks are walked
+    exactly. Other files are searched for member headers (only if `probe`);
+    a match can be a false positive inside compressed data, which
+    _inflate_range() detects. A single-member file gives [0].
+    """
+    first = _header(buf, 0)
+    if first is None:
+        raise IOError("not a gzip file")
+    splits = [0]
+    if first[1]:
+        pos, bsize = 0, first[1]
+        while bsize and pos + bsize < len(buf):
+            pos += bsize
+            if pos - splits[-1] >= chunk_bytes:
+                splits.append(pos)
+            header = _header(buf, pos)
+            bsize = header and header[1]
+        return splits
+    if not probe:
+        return splits
+    for target in range(chunk_bytes, len(buf), chunk_bytes):
+        pos = buf.find(MAGIC, max(target, splits[-1] + 1))
+        while 0 <= pos < target + chunk_bytes and not _plausible(buf, pos):
+            pos = buf.find(MAGIC, pos + 1)
+        if 0 <= pos < target + chunk_bytes:
+            splits.append(pos)
+    return splits
+
+def _parallel(view, splits, out, workers):
+    """
+    Inflate the ranges between `splits` on a thread pool (zlib releases the
+    GIL) and write them in order. A range whose start turned out not to be a
+    member boundary is redone here, streaming from where the previous one ended.
+    """
+    ranges = deque(zip(splits, splits[1:] + [len(view)]))
+    pending = deque()
+    pos = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while ranges or pending:
+            while ranges and len(pending) < workers * 2:
+                start, end = ranges.popleft()
+                pending.append((start, pool.submit(_inflate_range, view, start, end)))
+            start, future = pending.popleft()
+            try:
+                data, end = future.result()
+            except (zlib.error, EOFError, IOError):
+                data = None
+            if start > pos:
+                pos = _members(view, pos, start, out.write)
+            if start == pos and data is not None:
+                out.write(data)
+                pos = end
+    if pos < len(view):
+        _members(view, pos, len(view), out.write)
+
+class _Stopped(Exception):
+    """Raised in a pipeline stage when another stage failed."""
+
+def _pipeline(src, out, block_size=PIPELINE_BLOCK):
+    """
+    Decompress a plain (single- or few-member) gzip file in three stages: a
+    reader thread reads compressed blocks, this thread inflates the raw
+    deflate data, and a writer thread checks each member's CRC32 and size
+    and writes the output.
+    """
+    blocks, results, stop = queue.Queue(8), queue.Queue(8), threading.Event()
+
+    def put(q, item):
+        while True:
+            if stop.is_set():
+                raise _Stopped()
+            try:
+                return q.put(item, timeout=0.1)
+            except queue.Full:
+                pass
+
+    def get(q):
+        while True:
+            if stop.is_set():
+                raise _Stopped()
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+    def stage(func):
+        def run():
+            try:
+                func()
+            except BaseException:
+                stop.set()
+                raise
+        return run
+
+    @stage
+    def reader():
+        with open(src, "rb") as f:
+            for block in iter(lambda: f.read(block_size), b""):
+                put(blocks, block)
+        put(blocks, None)
+
+    @stage
+    def writer():
+        crc = size = 0
+        while True:
+            item = get(results)
+            if item is None:
+                return
+            if isinstance(item, tuple):  # end of a member: (CRC32, size mod 2**32) from its trailer
+                if item != (crc, size & 0xffffffff):
+                    raise IOError("CRC check failed")
+                crc = size = 0
+                continue
+            crc = zlib.crc32(item, crc)
+            size += len(item)
+            out.write(item)
+
+    def fill(pending, n):
+        """Append blocks to `pending` until it holds `n` bytes; returns (pending, True at end of file)."""
+        while len(pending) < n:
+            block = get(blocks)
+            if block is None:
+                return pending, True
+            pending += block
+        return pending, False
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        stages = [pool.submit(writer), pool.submit(reader)]
+        try:
+            pending, eof, first = b"", False, True
+            while True:
+                if not eof:
+                    pending, eof = fill(pending, 1 << 16)  # a whole header, whatever FNAME/FEXTRA it carries
+                if eof and not first and not pending.strip(b"\0"):
+                    break
+                header = _header(pending, 0)
+                if header is None:
+                    raise IOError("not a gzip file" if first else "trailing garbage after the last gzip member")
+                d, data, first = zlib.decompressobj(-zlib.MAX_WBITS), pending[header[0]:], False
+                while True:
+                    put(results, d.decompress(data))
+                    if d.eof:
+                        break
+                    data = None if eof else get(blocks)
+                    if data is None:
+                        raise EOFError("gzip stream ended early")
+                pending = d.unused_data
+                if not eof:
+                    pending, eof = fill(pending, 8)
+                if len(pending) < 8:
+                    raise EOFError("gzip stream ended early")
+                put(results, struct.unpack("<II", pending[:8]))
+                pending = pending[8:]
+            put(results, None)
+        except BaseException as e:
+            stop.set()
+            errors = [f.exception() for f in stages]  # waits for both stages to stop
+            cause = next((x for x in errors if x and not isinstance(x, _Stopped)), None)
+            if cause and isinstance(e, _Stopped):
+                raise cause
+            raise
+        for f in stages:
+            f.result()
+
+def gunzip(src, dest=None, workers=GUNZIP_WORKERS, chunk_bytes=GUNZIP_CHUNK_BYTES):
+    """
+    Decompress gzip file `src` to `dest` (default: `src` without .gz), using
+    every core where the format allows it. BGZF and multi-member files are
+    cut at member boundaries into ranges of about `chunk_bytes` compressed
+    bytes that `workers` threads inflate in parallel; a single-member file
+    can only be inflated serially, so reading, inflating and CRC/writing are
+    pipelined on three threads instead. The output is written to
+    `dest + ".part"` and renamed when complete. Returns `dest`.
+    """
+    dest = dest or (src[:-3] if src.endswith(".gz") else src + ".out")
+    part = dest + ".part"
+    try:
+        with open(src, "rb") as f, open(part, "wb") as out:
+            plain = False
+            if os.fstat(f.fileno()).st_size:  # an empty file decompresses to nothing, like gzip.open()
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                try:
+                    splits = _splits(buf, chunk_bytes, probe=workers > 1)
+                    plain = len(splits) == 1 and not _header(buf, 0)[1]
+                    if not plain:
+                        _parallel(memoryview(buf), splits, out, workers)
+                finally:
+                    try:
+                        buf.close()
+                    except BufferError:  # a traceback still holds a slice; the map is freed with it
+                        pass
+            if plain:
+                _pipeline(src, out)
+        os.replace(part, dest)
+    except BaseException:
+        if os.path.exists(part):
+            os.remove(part)
+        raise
+    return dest
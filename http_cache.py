@@ -0,0 +1,101 @@
+import os, time
+from threading import Lock
+from config.settings import DATA_DIR
+from utils.checksums import intact
+from utils.logger import cache_event, phase
+from utils.state_file import load_json, locked, save_json
+from utils.transport import get
+
+CACHE_FILE = os.path.join(DATA_DIR, "http_cache.json")
+_lock = Lock()
+
+def _load():
+    return load_json(CACHE_FILE)
+
+def _update(url, entry):
+    with _lock, locked(CACHE_FILE):
+        cache = _load()
+        cache.setdefault(url, {}).update(entry)
+        save_json(CACHE_FILE, cache)
+
+def remember(url, headers, outputs=None):
+    """
+    Store the validators from a successful download's response headers, and
+    optionally the local files produced from it (e.g. extracted archive members).
+    """
+    entry = {
+        "etag": headers.get("ETag"),
+        "last_modified": headers.get("Last-Modified"),
+        "content_length": headers.get("Content-Length"),
+        "checked": time.time(),
+    }
+    if outputs is not None:
+        entry["outputs"] = list(outputs)
+    _update(url, entry)
+
+def remembered(url):
+    """True if a download of `url` has been recorded here (by remember() or an adopting is_fresh())."""
+    return url in _load()
+
+def is_fresh(url, outputs=None, headers=None, verify=None):
+    """
+    Return True if every local file in `outputs` exists, is unchanged since its
+    checksums were verified (by size and mtime, without re-hashing), and the
+    source at `url` has not changed since it was downloaded. Without
+    `outputs`, the files recorded by remember() for this URL are checked.
+
+    Sends one conditional GET (If-None-Match / If-Modified-Since) and closes it
+    straight away; a 304, or a 200 carrying the same validators, means unchanged.
+    Files downloaded before this cache existed are adopted: their source's
+    current validators are recorded and they count as fresh.
+    """
+    entry = _load().get(url, {})
+    if outputs is None:
+        outputs = entry.get("outputs")
+    if not outputs or not all(os.path.exists(p) and intact(p) for p in outputs):
+        cache_event(False)
+        return False
+
+    req_headers = dict(headers or {})
+    req_headers["Accept-Encoding"] = "identity"
+    if entry.get("etag"):
+        req_headers["If-None-Match"] = entry["etag"]
+    if entry.get("last_modified"):
+        req_headers["If-Modified-Since"] = entry["last_modified"]
+
+    try:
+        with phase("connect"):
+            r = get(url, stream=True, headers=req_headers, verify=verify, retries=2)
+        with r:
+            if r.status_code == 304:
+                _update(url, {"checked": time.time()})
+                fresh = True
+            else:
+                r.raise_for_status()
+                if not entry:
+                    remember(url, r.headers)
+                    fresh = True
+                else:
+                    same = [entry.get(k) == r.headers.get(h) for k, h in
+                            (("etag", "ETag"), ("last_modified", "Last-Modified"), ("content_length", "Content-Length"))
+                            if entry.get(k)]
+                    fresh = bool(same) and all(same)
+    except Exception as e:
+        print(f"⚠️ Could not check {url} for updates ({e}); using local copy.")
+        fresh = True
+    cache_event(fresh)
+    return fresh
+
+def get_json(url, ttl):
+    """GET a JSON document, reusing the cached copy while it is younger than `ttl` seconds."""
+    entry = _load().get(url, {})
+    if "json" in entry and time.time() - entry.get("checked", 0) < ttl:
+        cache_event(True)
+        return entry["json"]
+    cache_event(False)
+    with phase("connect"):
+        response = get(url)
+    response.raise_for_status()
+    data = response.json()
+    _update(url, {"json": data, "checked": time.time()})
+    return data
@@ -0,0 +1,198 @@
+from itertools import islice
+import numpy as np
+
+BED_COLUMNS = (0, 1, 2)
+UCSC_TABLE_COLUMNS = (1, 2, 3)  # gap.tsv and other bin, chrom, start, end tables
+# chrom/start/end columns of UCSC tables that don't follow that layout (None: not positional)
+TABLE_COLUMNS = {"cytoBand": BED_COLUMNS, "rmsk": (5, 6, 7), "chromInfo": None}
+CHUNK_LINES = 500000
+
+# ---- array operations (one chromosome, 0-based half-open coordinates) ----
+
+def merge(starts, ends):
+    """Union of intervals as disjoint, sorted (starts, ends); touching intervals are joined."""
+    starts, ends = np.asarray(starts, dtype=np.int64), np.asarray(ends, dtype=np.int64)
+    if not len(starts):
+        return starts, ends
+    order = np.argsort(starts, kind="stable")
+    starts, ends = starts[order], np.maximum.accumulate(ends[order])
+    new = np.concatenate([[True], starts[1:] > ends[:-1]])
+    last = np.append(np.flatnonzero(new)[1:] - 1, len(starts) - 1)
+    return starts[new], ends[last]
+
+def overlap_pairs(ref_starts, ref_ends, ref_maxends, starts, ends):
+    """
+    All (query, ref) index pairs where query [start, end) overlaps a reference
+    interval. References are sorted by start and `ref_maxends` is the running
+    maximum of their ends, so each query's candidates are the slice between two
+    binary searches; no query is compared against the whole reference.
+    """
+    starts, ends = np.asarray(starts, dtype=np.int64), np.asarray(ends, dtype=np.int64)
+    first = np.searchsorted(ref_maxends, starts, side="right")
+    last = np.maximum(first, np.searchsorted(ref_starts, ends, side="left"))
+    counts = last - first
+    query = np.repeat(np.arange(len(starts)), counts)
+    refs = np.repeat(first - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+    keep = ref_ends[refs] > starts[query]
+    return query[keep], refs[keep]
+
+def subtract(starts, ends, mask_starts, mask_ends):
+    """
+    Remove merged (disjoint, sorted) mask intervals from each query interval.
+    Returns (owner, starts, ends) of the remaining pieces, where owner is the
+    index of the query a piece came from; fully masked queries disappear.
+    """
+    starts, ends = np.asarray(starts, dtype=np.int64), np.asarray(ends, dtype=np.int64)
+    first = np.searchsorted(mask_ends, starts, side="right")
+    last = np.maximum(first, np.searchsorted(mask_starts, ends, side="left"))
+    counts = last - first
+
+    # a query hit by k mask intervals leaves up to k + 1 pieces: the gaps around them
+    owner = np.repeat(np.arange(len(starts)), counts + 1)
+    k = np.arange(len(owner)) - np.repeat(np.cumsum(counts + 1) - counts - 1, counts + 1)
+    m = first[owner] + k
+    piece_starts = np.where(k == 0, starts[owner], mask_ends[np.maximum(m - 1, 0)] if len(mask_ends) else 0)
+    piece_ends = np.where(k == counts[owner], ends[owner], mask_starts[np.minimum(m, len(mask_starts) - 1)] if len(mask_starts) else 0)
+    piece_starts = np.maximum(piece_starts, starts[owner])
+    piece_ends = np.minimum(piece_ends, ends[owner])
+    keep = piece_starts < piece_ends
+    return owner[keep], piece_starts[keep], piece_ends[keep]
+
+def clip(starts, ends, size):
+    """Clip intervals to [0, size); returns (starts, ends, keep) where keep drops empty results."""
+    starts = np.clip(np.asarray(starts, dtype=np.int64), 0, size)
+    ends = np.clip(np.asarray(ends, dtype=np.int64), 0, size)
+    return starts, ends, starts < ends
+
+# ---- tracks loaded from files ----
+
+class Track:
+    """
+    A reference interval file indexed per chromosome: starts sorted, ends and
+    running-max ends aligned with them, and `rows` giving each interval's line
+    number in the file.
+    """
+
+    def __init__(self, chroms):
+        self.chroms = chroms  # chrom -> (starts, ends, maxends, rows)
+
+    def __len__(self):
+        return sum(len(v[0]) for v in self.chroms.values())
+
+    def sizes(self):
+        """Largest end per chromosome (the chromosome length for add_chrom.bed)."""
+        return {c: int(v[2][-1]) for c, v in self.chroms.items() if len(v[2])}
+
+    def merged(self, chrom):
+        """Disjoint (starts, ends) of this track on `chrom`."""
+        if chrom not in self.chroms:
+            empty = np.array([], dtype=np.int64)
+            return empty, empty
+        starts, ends, _, _ = self.chroms[chrom]
+        return merge(starts, ends)
+
+    def overlaps(self, chrom, starts, ends):
+        """(query, row) pairs of queries on `chrom` overlapping this track."""
+        if chrom not in self.chroms:
+            empty = np.array([], dtype=np.int64)
+            return empty, empty
+        ref_starts, ref_ends, maxends, rows = self.chroms[chrom]
+        query, refs = overlap_pairs(ref_starts, ref_ends, maxends, starts, ends)
+        return query, rows[refs]
+
+    def count_overlaps(self, chrom, starts, ends):
+        query, _ = self.overlaps(chrom, starts, ends)
+        return np.bincount(query, minlength=len(starts))
+
+def _parse_chunk(lines, columns):
+    """Split BED-like lines into (chrom codes, chrom names, starts, ends, kept lines)."""
+    c, s, e = columns
+    width = max(columns) + 1
+    records = [(line, line.rstrip("\r\n").split("\t", width)) for line in lines
+               if not line.startswith(("#", "track", "browser")) and line.strip()]
+    records = [(line, f) for line, f in records if len(f) >= width]
+    chrom_ids = {}
+    codes = np.array([chrom_ids.setdefault(f[c], len(chrom_ids)) for _, f in records], dtype=np.int64)
+    starts = np.array([int(f[s]) for _, f in records], dtype=np.int64)
+    ends = np.array([int(f[e]) for _, f in records], dtype=np.int64)
+    return codes, chrom_ids, starts, ends, records
+
+def read_chunks(path, columns=BED_COLUMNS, chunk_lines=CHUNK_LINES):
+    """Stream a BED-like file as parsed chunks of at most `chunk_lines` lines."""
+    with open(path) as f:
+        while True:
+            lines = list(islice(f, chunk_lines))
+            if not lines:
+                break
+            yield _parse_chunk(lines, columns)
+
+def load_track(path, columns=BED_COLUMNS):
+    """Read a whole BED-like file into a Track (reference files are small next to the queries)."""
+    parts, offset = {}, 0
+    for codes, chrom_ids, starts, ends, records in read_chunks(path, columns):
+        for chrom, k in chrom_ids.items():
+            rows = np.flatnonzero(codes == k)
+            parts.setdefault(chrom, []).append((starts[rows], ends[rows], rows + offset))
+        offset += len(records)
+    chroms = {}
+    for chrom, pieces in parts.items():
+        starts, ends, rows = (np.concatenate(col) for col in zip(*pieces))
+        order = np.argsort(starts, kind="stable")
+        starts, ends, rows = starts[order], ends[order], rows[order]
+        chroms[chrom] = (starts, ends, np.maximum.accumulate(ends), rows)
+    return Track(chroms)
+
+def mask_and_annotate(input_bed, output_bed, chrom_sizes=None, masks=(), annotations=None, chunk_lines=CHUNK_LINES):
+    """
+    One streaming pass over `input_bed`: clip every interval to its chromosome
+    (dropping unknown chromosomes when `chrom_sizes` is given), cut the `masks`
+    tracks out of it (e.g. assembly gaps), and append one column per entry in
+    `annotations` ({name: Track}) with the number of overlapping features.
+    Pieces keep the extra columns of the line they came from. Returns
+    (lines read, pieces written).
+    """
+    annotations = annotations or {}
+    n_in = n_out = 0
+    with open(output_bed, "w") as out:
+        for codes, chrom_ids, starts, ends, records in read_chunks(input_bed, BED_COLUMNS, chunk_lines):
+            n_in += len(records)
+            rows_out, starts_out, ends_out, chroms_out = [], [], [], []
+            for chrom, k in chrom_ids.items():
+                rows = np.flatnonzero(codes == k)
+                s, e = starts[rows], ends[rows]
+                if chrom_sizes is not None:
+                    if chrom not in chrom_sizes:
+                        continue
+                    s, e, keep = clip(s, e, chrom_sizes[chrom])
+                    rows, s, e = rows[keep], s[keep], e[keep]
+                for track in masks:
+                    mask_starts, mask_ends = track.merged(chrom)
+                    owner, s, e = subtract(s, e, mask_starts, mask_ends)
+                    rows = rows[owner]
+                rows_out.append(rows)
+                starts_out.append(s)
+                ends_out.append(e)
+                chroms_out.append(np.full(len(rows), k))
+
+            if not rows_out:
+                continue
+            rows, s, e, ks = (np.concatenate(a) for a in (rows_out, starts_out, ends_out, chroms_out))
+            order = np.argsort(rows, kind="stable")  # keep input order
+            rows, s, e, ks = rows[order], s[order], e[order], ks[order]
+            names = sorted(chrom_ids, key=chrom_ids.get)
+            counts = []
+            for track in annotations.values():
+                col = np.zeros(len(rows), dtype=np.int64)
+                for k, chrom in enumerate(names):
+                    sel = np.flatnonzero(ks == k)
+                    col[sel] = track.count_overlaps(chrom, s[sel], e[sel])
+                counts.append(col.tolist())
+
+            lines = []
+            for i, (row, a, b, k) in enumerate(zip(rows.tolist(), s.tolist(), e.tolist(), ks.tolist())):
+                fields = records[row][1]
+                rest = fields[3:] + [str(col[i]) for col in counts]
+                lines.append("\t".join([names[k], str(a), str(b)] + rest) + "\n")
+            out.writelines(lines)
+            n_out += len(lines)
+    return n_in, n_out
@@ -1,39 +1,220 @@
-import os, gzip, shutil, requests
+import os, tempfile, time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+import numpy as np
 from pyliftover import LiftOver
-from config.settings import DATA_DIR
+from config.settings import DATA_DIR, LIFTOVER_ENGINE, LIFTOVER_WORKERS, DEFAULT_SPECIES, TABIX_OUTPUTS
+from utils.build_state import record, up_to_date
+from utils.chain import cached_chain, load_index
+from utils.dwnld import fetch
+from utils.http_cache import is_fresh
+from utils.logger import log_download_task, phase
+from utils.tabix import index_bed
+from utils.matrix import url
 
-CHAIN_URL = "https://hgdownload.soe.ucsc.edu/goldenPath/danRer10/liftOver/danRer10ToDanRer11.over.chain.gz"
+CHAIN_URL = url(DEFAULT_SPECIES, "liftover_chain")  # danRer10 -> danRer11 for zebrafish
 CHAIN_GZ = os.path.join(DATA_DIR, "liftover.chain.gz")
 CHAIN_FILE = os.path.join(DATA_DIR, "liftover.chain")
+CHAIN_CACHE_DIR = os.path.join(DATA_DIR, "chain_cache")
 INPUT_BED = os.path.join(DATA_DIR, "enhanceratlas", "dr.bed")
 OUTPUT_BED = os.path.join(DATA_DIR, "output_lifted.bed")
 UNMAPPED_LOG = os.path.join(DATA_DIR, "unmapped.txt")
- 
-def run():
+CHUNK_LINES = 500000
+CHUNK_BYTES = 32 * 1024 * 1024
+
+def _ensure_chain():
+    """Return a local chain file, downloading the .gz once (it is read compressed, never gunzipped)."""
     os.makedirs(DATA_DIR, exist_ok=True)
-    if not os.path.exists(CHAIN_FILE):
-        with requests.get(CHAIN_URL, stream=True) as r:
-            with open(CHAIN_GZ, "wb") as f:
-                shutil.copyfileobj(r.raw, f)
-        with gzip.open(CHAIN_GZ, 'rb') as f_in, open(CHAIN_FILE, 'wb') as f_out:
-            shutil.copyfileobj(f_in, f_out)
-    lo = LiftOver(CHAIN_FILE)
-
-    with open(INPUT_BED, 'r') as infile, \
-         open(OUTPUT_BED, 'w') as out, \
-         open(UNMAPPED_LOG, 'w') as unmapped:
-        for line in infile:
-            if line.startswith("#") or line.strip() == "": continue
-            fields = line.strip().split('\t')
-            if len(fields) < 3: continue
-            chrom, start, end = fields[0], int(fields[1]), int(fields[2])
-            lifted_start = lo.convert_coordinate(chrom, start)
-            lifted_end = lo.convert_coordinate(chrom, end-1)
-            if lifted_start and lifted_end and lifted_start[0][0] == lifted_end[0][0]:
-                new_chrom = lifted_start[0][0]
-                new_start = int(lifted_start[0][1])
-                new_end = int(lifted_end[0][1]) + 1
-                out.write('\t'.join([new_chrom, str(new_start), str(new_end)] + fields[3:]) + '\n')
-            else:
-                unmapped.write(line)
-    print("Liftover complete. Output has been generated.")
+    if os.path.exists(CHAIN_FILE):  # uncompressed copy from older runs
+        return CHAIN_FILE
+    if not is_fresh(CHAIN_URL, [CHAIN_GZ]) and not fetch(CHAIN_URL, CHAIN_GZ):
+        raise Exception("Failed to download the liftover chain file")
+    return CHAIN_GZ
+
+def _bed_records(infile):
+    """Yield (original line, fields) for every usable BED line."""
+    for line in infile:
+        if line.startswith("#") or line.strip() == "": continue
+        fields = line.strip().split('\t')
+        if len(fields) < 3: continue
+        yield line, fields
+
+def _lift_pyliftover(chain_file, infile, out, unmapped):
+    """Reference path: two LiftOver.convert_coordinate calls per BED line."""
+    lo = LiftOver(chain_file)
+    for line, fields in _bed_records(infile):
+        chrom, start, end = fields[0], int(fields[1]), int(fields[2])
+        lifted_start = lo.convert_coordinate(chrom, start)
+        lifted_end = lo.convert_coordinate(chrom, end-1)
+        if lifted_start and lifted_end and lifted_start[0][0] == lifted_end[0][0]:
+            new_chrom = lifted_start[0][0]
+            new_start = int(lifted_start[0][1])
+            new_end = int(lifted_end[0][1]) + 1
+            out.write('\t'.join([new_chrom, str(new_start), str(new_end)] + fields[3:]) + '\n')
+        else:
+            unmapped.write(line)
+
+def _lift_chunk(index, lines, out, unmapped):
+    records = [(line, line.strip().split('\t', 3)) for line in lines if not line.startswith("#") and line.strip() != ""]
+    records = [(line, fields) for line, fields in records if len(fields) >= 3]
+    if not records:
+        return
+    codes, chrom_ids = [], {}
+    for _, fields in records:
+        codes.append(chrom_ids.setdefault(fields[0], len(chrom_ids)))
+    codes = np.array(codes)
+    starts = np.array([int(fields[1]) for _, fields in records], dtype=np.int64)
+    lasts = np.array([int(fields[2]) for _, fields in records], dtype=np.int64) - 1
+
+    n = len(records)
+    start_tid, end_tid = np.full(n, -1, dtype=np.int32), np.full(n, -1, dtype=np.int32)
+    new_start, new_end = np.zeros(n, dtype=np.int64), np.zeros(n, dtype=np.int64)
+    mapped = np.zeros(n, dtype=bool)
+    for chrom, k in chrom_ids.items():
+        rows = np.flatnonzero(codes == k)
+        s_tid, s_pos, s_ok = index.convert(chrom, starts[rows])
+        e_tid, e_pos, e_ok = index.convert(chrom, lasts[rows])
+        start_tid[rows], end_tid[rows] = s_tid, e_tid
+        new_start[rows], new_end[rows] = s_pos, e_pos + 1
+        mapped[rows] = s_ok & e_ok
+    mapped &= start_tid == end_tid
+
+    target = index.target_names
+    lifted, missed = [], []
+    for (line, fields), ok, tid, s, e in zip(records, mapped.tolist(), start_tid.tolist(), new_start.tolist(), new_end.tolist()):
+        if ok:
+            lifted.append(f"{target[tid]}\t{s}\t{e}\t{fields[3]}\n" if len(fields) > 3 else f"{target[tid]}\t{s}\t{e}\n")
+        else:
+            missed.append(line)
+    out.writelines(lifted)
+    unmapped.writelines(missed)
+
+def _lift_lines(index, lines, out, unmapped):
+    """Lift an iterable of BED lines in chunks of CHUNK_LINES."""
+    lines = iter(lines)
+    while True:
+        chunk = list(islice(lines, CHUNK_LINES))
+        if not chunk:
+            break
+        _lift_chunk(index, chunk, out, unmapped)
+
+def _lift_batch(chain_file, infile, out, unmapped):
+    """Vectorized path: convert whole columns of starts/ends per chromosome with searchsorted."""
+    index, _ = cached_chain(chain_file, CHAIN_CACHE_DIR)
+    _lift_lines(index, infile, out, unmapped)
+
+ENGINES = {"batch": _lift_batch, "pyliftover": _lift_pyliftover}
+
+_worker_index = None
+
+def _init_worker(cache_dir):
+    global _worker_index
+    _worker_index = load_index(cache_dir)
+
+def _lift_range(task):
+    """Worker: lift the lines in bytes [start, end) of a BED file into its own part files."""
+    input_bed, start, end, out_path, unmapped_path = task
+    with open(input_bed, 'rb') as f:
+        f.seek(start)
+        text = f.read(end - start).decode()
+    lines = text.replace('\r\n', '\n').splitlines(keepends=True)
+    with open(out_path, 'w') as out, open(unmapped_path, 'w') as unmapped:
+        _lift_lines(_worker_index, lines, out, unmapped)
+
+def _split_lines(path, chunk_bytes):
+    """Cut a file into [start, end) byte ranges of about chunk_bytes that end on line boundaries."""
+    size = os.path.getsize(path)
+    bounds = [0]
+    with open(path, 'rb') as f:
+        while bounds[-1] + chunk_bytes < size:
+            f.seek(bounds[-1] + chunk_bytes)
+            f.readline()
+            if f.tell() >= size:
+                break
+            bounds.append(f.tell())
+    return list(zip(bounds, bounds[1:] + [size]))
+
+def _concat(parts, dest):
+    with open(dest, 'wb') as out:
+        for part in parts:
+            with open(part, 'rb') as f:
+                while True:
+                    buf = f.read(1 << 20)
+                    if not buf:
+                        break
+                    out.write(buf)
+
+def _run_jobs(chain_file, jobs, engine, workers, chunk_bytes):
+    if engine != "batch" or workers <= 1:
+        for input_bed, output_bed, unmapped_log in jobs:
+            with open(input_bed, 'r') as infile, \
+                 open(output_bed, 'w') as out, \
+                 open(unmapped_log, 'w') as unmapped:
+                ENGINES[engine](chain_file, infile, out, unmapped)
+        return
+
+    _, cache_dir = cached_chain(chain_file, CHAIN_CACHE_DIR)
+    os.makedirs(DATA_DIR, exist_ok=True)  # chunk outputs stay on the data/ filesystem; chain_file may live elsewhere
+    with tempfile.TemporaryDirectory(dir=DATA_DIR) as tmp, \
+         ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(cache_dir,)) as pool:
+        tasks, parts = [], []
+        for j, (input_bed, output_bed, unmapped_log) in enumerate(jobs):
+            outs, misses = [], []
+            for k, (start, end) in enumerate(_split_lines(input_bed, chunk_bytes)):
+                out_path = os.path.join(tmp, f"{j}_{k}.bed")
+                unmapped_path = os.path.join(tmp, f"{j}_{k}.unmapped")
+                tasks.append((input_bed, start, end, out_path, unmapped_path))
+                outs.append(out_path)
+                misses.append(unmapped_path)
+            parts.append((outs, misses, output_bed, unmapped_log))
+        list(pool.map(_lift_range, tasks))
+        for outs, misses, output_bed, unmapped_log in parts:
+            _concat(outs, output_bed)
+            _concat(misses, unmapped_log)
+
+def run_many(jobs, engine=LIFTOVER_ENGINE, workers=LIFTOVER_WORKERS, chunk_bytes=CHUNK_BYTES, chain_file=None):
+    """
+    Lift several BED files. `jobs` is a list of (input_bed, output_bed, unmapped_log).
+
+    With the batch engine and workers > 1, every input is cut into line-aligned
+    chunks that are lifted on a process pool. Workers memory-map the cached chain
+    arrays read-only, and the per-chunk outputs are concatenated back in input
+    order.
+    """
+    chain_file = chain_file or _ensure_chain()
+    with phase("post_process"):
+        _run_jobs(chain_file, jobs, engine, workers, chunk_bytes)
+
+@log_download_task(script_name="liftover.py")
+def run(input_bed=INPUT_BED, output_bed=OUTPUT_BED, unmapped_log=UNMAPPED_LOG, engine=LIFTOVER_ENGINE, workers=LIFTOVER_WORKERS):
+    """Lift `input_bed`, unless it and the chain file are unchanged since `output_bed` was made."""
+    chain_file = _ensure_chain()
+    step, inputs, outputs = f"liftover {output_bed}", [input_bed, chain_file], [output_bed, unmapped_log]
+    if up_to_date(step, inputs, outputs=outputs):
+        print(f"[✔] {output_bed} is up to date ({input_bed} and the chain are unchanged).")
+    else:
+        run_many([(input_bed, output_bed, unmapped_log)], engine=engine, workers=workers, chain_file=chain_file)
+        record(step, inputs, outputs=outputs)
+        print("Liftover complete. Output has been generated.")
+    if TABIX_OUTPUTS:
+        with phase("post_process"):
+            index_bed(output_bed)  # sorted, bgzipped + .tbi copy for region queries
+
+def benchmark(input_bed=INPUT_BED, chain_file=CHAIN_GZ):
+    """Time both engines on `input_bed`, check they agree, and print lines/sec."""
+    with open(input_bed) as f:
+        n_lines = sum(1 for _ in _bed_records(f))
+    results, outputs = {}, {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, engine in ENGINES.items():
+            out_path, unmapped_path = os.path.join(tmp, name + ".bed"), os.path.join(tmp, name + ".unmapped")
+            started = time.time()
+            with open(input_bed) as infile, open(out_path, 'w') as out, open(unmapped_path, 'w') as unmapped:
+                engine(chain_file, infile, out, unmapped)
+            results[name] = n_lines / max(time.time() - started, 1e-9)
+            with open(out_path) as a, open(unmapped_path) as b:
+                outputs[name] = (a.read(), b.read())
+    for name, rate in results.items():
+        print(f"{name:<11} {rate:>12,.0f} lines/sec")
+    print(f"speedup: {results['batch'] / results['pyliftover']:.1f}x, outputs identical: {outputs['batch'] == outputs['pyliftover']}")
+    return results
@@ -0,0 +1,164 @@
+import os, json, time, sqlite3, functools
+from contextlib import contextmanager
+from threading import Lock, local
+from config.settings import RUN_MANIFEST, RUN_MANIFEST_DB, PROMETHEUS_TEXTFILE
+
+PHASES = ("connect", "transfer", "decompress", "post_process")
+RUN_ID = time.strftime("%Y%m%dT%H%M%S")
+
+_records = []  # finished task records not yet written to disk
+_lock = Lock()
+_counters = Lock()  # worker threads attached to one record (fan_out, pools) update it concurrently
+_state = local()  # the record of the task running on this thread
+
+def current():
+    """Record of the task running on this thread, or None outside a logged task."""
+    return getattr(_state, "record", None)
+
+@contextmanager
+def phase(name):
+    """
+    Add the time spent inside the block to the current task's `name` phase.
+    Phases are thread time: blocks running at once on attached worker threads
+    all count, so a phase can exceed the task's wall-clock duration.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record = current()
+        if record is not None:
+            with _counters:
+                record["phases"][name] += time.perf_counter() - start
+
+@contextmanager
+def attach(record):
+    """Make this thread count towards `record` (e.g. worker threads of a task)."""
+    previous = current()
+    _state.record = record
+    try:
+        yield
+    finally:
+        _state.record = previous
+
+def add_bytes(n):
+    """Count `n` bytes transferred by the current task."""
+    record = current()
+    if record is not None:
+        with _counters:
+            record["bytes"] += n
+
+def cache_event(hit):
+    """Count a cache hit (local copy reused) or miss (source refetched)."""
+    record = current()
+    if record is not None:
+        with _counters:
+            record["cache_hits" if hit else "cache_misses"] += 1
+
+def log_download_task(script_name, task=None):
+    """
+    Decorator recording size, timing and status of a pipeline task.
+
+    While the task runs, the download and processing helpers add bytes, cache
+    hits/misses and per-phase time to its record through add_bytes(),
+    cache_event() and phase(). Phase times are summed thread time (see
+    phase()), so with overlapping transfers throughput_bps is the rate per
+    transfer thread. Exceptions are recorded and re-raised. A task
+    called from inside another one (download_all -> download_ucsc_tables) is
+    rolled up into its caller's record instead of being written on its own.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            record = {
+                "run_id": RUN_ID,
+                "task": task or f"{script_name.rsplit('.', 1)[0]}.{func.__name__}",
+                "script": script_name,
+                "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "status": "running",
+                "error_message": None,
+                "bytes": 0,
+                "cache_hits": 0,
+                "cache_misses": 0,
+                "phases": {p: 0.0 for p in PHASES},
+            }
+            parent = current()
+            _state.record = record
+            start = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+                record["status"] = "success"
+                return result
+            except Exception as e:
+                record["status"] = "failed"
+                record["error_message"] = str(e)
+                raise
+            finally:
+                record["duration_sec"] = round(time.perf_counter() - start, 3)
+                record["phases"] = {p: round(t, 3) for p, t in record["phases"].items()}
+                transfer = record["phases"]["transfer"]
+                record["throughput_bps"] = round(record["bytes"] / transfer) if transfer else None
+                _state.record = parent
+                if parent is not None:  # nested task: roll its counters up into the caller only,
+                    with _counters:  # so manifest totals count them once
+                        for key in ("bytes", "cache_hits", "cache_misses"):
+                            parent[key] += record[key]
+                        for p in PHASES:
+                            parent["phases"][p] += record["phases"][p]
+                else:
+                    with _lock:
+                        _records.append(record)
+        return wrapper
+    return decorator
+
+def _write_sqlite(records):
+    with sqlite3.connect(RUN_MANIFEST_DB) as db:
+        db.execute("""CREATE TABLE IF NOT EXISTS tasks (
+            run_id TEXT, task TEXT, script TEXT, started TEXT, status TEXT, error_message TEXT,
+            duration_sec REAL, bytes INTEGER, throughput_bps REAL, cache_hits INTEGER, cache_misses INTEGER,
+            connect_sec REAL, transfer_sec REAL, decompress_sec REAL, post_process_sec REAL)""")
+        db.executemany("INSERT INTO tasks VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", [
+            (r["run_id"], r["task"], r["script"], r["started"], r["status"], r["error_message"],
+             r["duration_sec"], r["bytes"], r["throughput_bps"], r["cache_hits"], r["cache_misses"],
+             *(r["phases"][p] for p in PHASES))
+            for r in records])
+
+def _write_prometheus(records, path):
+    """Write the latest run in Prometheus textfile-collector format (atomically)."""
+    lines = []
+    metrics = [
+        ("gsh_task_duration_seconds", "gauge", "Wall time of the task", lambda r: r["duration_sec"]),
+        ("gsh_task_bytes", "gauge", "Bytes transferred by the task", lambda r: r["bytes"]),
+        ("gsh_task_throughput_bytes_per_second", "gauge", "Transfer throughput of the task", lambda r: r["throughput_bps"] or 0),
+        ("gsh_task_cache_hits", "gauge", "Sources reused from the local cache", lambda r: r["cache_hits"]),
+        ("gsh_task_cache_misses", "gauge", "Sources (re)fetched", lambda r: r["cache_misses"]),
+        ("gsh_task_success", "gauge", "1 if the task succeeded", lambda r: int(r["status"] == "success")),
+    ]
+    for name, kind, doc, value in metrics:
+        lines += [f"# HELP {name} {doc}", f"# TYPE {name} {kind}"]
+        lines += [f'{name}{{task="{r["task"]}"}} {value(r)}' for r in records]
+    lines += ["# HELP gsh_task_phase_seconds Time spent per task phase", "# TYPE gsh_task_phase_seconds gauge"]
+    lines += [f'gsh_task_phase_seconds{{task="{r["task"]}",phase="{p}"}} {r["phases"][p]}' for r in records for p in PHASES]
+
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp, path)
+
+def write_logs_to_disk():
+    """Append this run's task records to the JSONL and SQLite manifests (and the Prometheus textfile, if set)."""
+    with _lock:
+        records = list(_records)
+        _records.clear()
+    if not records:
+        return None
+
+    os.makedirs(os.path.dirname(RUN_MANIFEST) or ".", exist_ok=True)
+    with open(RUN_MANIFEST, "a") as f:
+        for r in records:
+            f.write(json.dumps(r) + "\n")
+    _write_sqlite(records)
+    if PROMETHEUS_TEXTFILE:
+        _write_prometheus(records, PROMETHEUS_TEXTFILE)
+    print(f"📝 Logged {len(records)} task(s) to {RUN_MANIFEST}")
+    return RUN_MANIFEST
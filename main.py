@@ -1,36 +1,160 @@
-from scripts import ensembl, cosmic, mirgene, orthologs, enhanceratlas, liftover, cosmic_env, rna_files, gaps_ftp, wget
+import argparse, importlib, sys
+from config.settings import MAX_WORKERS, BENCH_SCALE_MB, BENCH_REPEAT, BENCH_TOLERANCE, BENCH_BASELINE
 from utils.logger import write_logs_to_disk
+from utils.scheduler import run_tasks, print_report
+
+# Tasks for a full parallel refresh: name -> ("module:function", [tasks it depends on]).
+# Modules are imported only when their task runs, so a run only pays for what it uses.
+# COSMIC is left out because it prompts for credentials.
+PIPELINE = {
+    "ensembl": ("scripts.ensembl:download", []),
+    "mirgene": ("scripts.mirgene:download", []),
+    "orthologs": ("scripts.orthologs:download", []),
+    "enhanceratlas": ("scripts.enhanceratlas:download", []),
+    "liftover": ("scripts.liftover:run", ["enhanceratlas"]),  # needs enhanceratlas/dr.bed
+    "rna_files": ("scripts.rna_files:main", []),
+    "gaps_ftp": ("scripts.gaps_ftp:download_all", []),
+    "wget": ("scripts.wget:download_all", []),
+    "mask_enhancers": ("scripts.mask_enhancers:run", ["liftover", "mirgene", "gaps_ftp", "wget"]),
+}
+
+MENU = [
+    ("Download Ensembl data", "scripts.ensembl:download"),
+    ("Download miRGene data", "scripts.mirgene:download"),
+    ("Download Orthologs data", "scripts.orthologs:download"),
+    ("Download COSMIC data", "scripts.cosmic:download"),
+    ("Download EnhancerAtlas (retain dr.bed)", "scripts.enhanceratlas:download"),
+    ("Run Liftover on dr.bed file", "scripts.liftover:run"),
+    ("Download lncRNA and tRNA files", "scripts.rna_files:main"),
+    ("USCS_Gaps_FTP (gap, cytoBand, rmsk, ...)", "scripts.gaps_ftp:download_ucsc_tables"),
+    ("WGET", "scripts.wget:download_chrominfo"),
+    ("Mask gaps out of lifted enhancers (+ miRNA overlaps)", "scripts.mask_enhancers:run"),
+    # ("cosmic env", "scripts.cosmic_env:download_cosmic_file"),
+]
+
+def load(target):
+    """Import the module of a "module:function" target and return the function."""
+    module, func = target.split(":")
+    return getattr(importlib.import_module(module), func)
+
+def select(names=None, with_deps=True):
+    """
+    Pick tasks from PIPELINE (all of them if `names` is empty), adding what they
+    depend on unless `with_deps` is False, in which case dependencies outside
+    the selection are dropped.
+    """
+    unknown = [n for n in names or [] if n not in PIPELINE]
+    if unknown:
+        raise ValueError(f"Unknown task(s): {', '.join(unknown)}. Choose from: {', '.join(PIPELINE)}")
+    chosen = set(names or PIPELINE)
+    stack = list(chosen) if with_deps else []
+    while stack:
+        for dep in PIPELINE[stack.pop()][1]:
+            if dep not in chosen:
+                chosen.add(dep)
+                stack.append(dep)
+    return {n: (target, [d for d in deps if d in chosen])
+            for n, (target, deps) in PIPELINE.items() if n in chosen}
+
+def plan(tasks):
+    """Task names in an order where every task comes after its dependencies."""
+    order, done = [], set()
+    def visit(name):
+        if name not in done:
+            done.add(name)
+            for dep in tasks[name][1]:
+                visit(dep)
+            order.append(name)
+    for name in tasks:
+        visit(name)
+    return order
+
+def run_all(names=None, jobs=MAX_WORKERS, with_deps=True):
+    tasks = select(names, with_deps)
+    results = run_tasks({n: (lambda t=target: load(t)(), deps) for n, (target, deps) in tasks.items()}, max_workers=jobs)
+    print_report(results)
+    write_logs_to_disk()
+    return results
+
+def run_bench(args, parser):
+    """`bench` command: exit status 1 if any stage failed or fell below the baseline."""
+    from utils import bench
+    try:
+        results = bench.run(args.stages, scale_mb=args.scale, repeat=args.repeat)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.output:
+        bench.save(results, args.output)
+    rows = bench.compare(results, bench.load(args.baseline), args.tolerance)
+    bench.report(results, rows)
+    if args.save_baseline:
+        bench.save(results, args.baseline)
+        print(f"[INFO] Baseline saved to {args.baseline}")
+    bad = ("failed",) if args.save_baseline else ("regression", "failed")
+    return 1 if any(verdict in bad for *_, verdict in rows) else 0
 
 def menu():
     while True:
         print("\n==== Choose from the Menu ====")
-        print("1. Download Ensembl data")
-        print("2. Download miRGene data")
-        print("3. Download Orthologs data")
-        print("4. Download COSMIC data")
-        print("5. Download EnhancerAtlas (retain dr.bed)")
-        print("6. Run Liftover on dr.bed file")
-        print("7. Download lncRNA and tRNA files")
-        print("8. USCS_Gaps_FTP")
-        print("9. WGET")
-        #print("0. cosmic env")
-        print("10. Exit")
+        for i, (label, _) in enumerate(MENU, 1):
+            print(f"{i}. {label}")
+        print(f"{len(MENU) + 1}. Run all (parallel, except COSMIC)")
+        print(f"{len(MENU) + 2}. Exit")
 
         choice = input("Enter your choice: ").strip()
-        if choice == '1': ensembl.download()
-        elif choice == '2': mirgene.download()
-        elif choice == '3': orthologs.download()
-        elif choice == '4': cosmic.download()
-        elif choice == '5': enhanceratlas.download()
-        elif choice == '6': liftover.run()
-        elif choice == '7': rna_files.main()
-        elif choice == '8': gaps_ftp.download_ucsc_gap_data()
-        elif choice == '9': wget.download_chrominfo()
-        # elif choice == '0': cosmic_env.download_cosmic_file()
-        elif choice == '10': 
-            # write_logs_to_disk()
+        if choice.isdigit() and 1 <= int(choice) <= len(MENU):
+            try:
+                load(MENU[int(choice) - 1][1])()
+            except Exception as e:  # a failed download returns to the menu
+                print(f"[FAILED] {MENU[int(choice) - 1][0]}: {e}")
+        elif choice == str(len(MENU) + 1): run_all()
+        elif choice == str(len(MENU) + 2):
+            write_logs_to_disk()
             print("Exiting. Arigatooo User"); break
         else: print("Invalid option.")
 
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="GSH data pipeline. Without a command, opens the interactive menu.")
+    sub = parser.add_subparsers(dest="command")
+    run = sub.add_parser("run", help="run pipeline tasks without prompts (all tasks if none are named)")
+    run.add_argument("tasks", nargs="*", metavar="task", help=f"one of: {', '.join(PIPELINE)}")
+    run.add_argument("--jobs", "-j", type=int, default=MAX_WORKERS, help="tasks running at the same time")
+    run.add_argument("--no-deps", action="store_true", help="don't add the tasks the named ones depend on")
+    run.add_argument("--dry-run", action="store_true", help="print the plan without running anything")
+    sub.add_parser("list", help="list the pipeline tasks")
+    bench = sub.add_parser("bench", help="time the download/extract/liftover stages against local stand-in servers")
+    bench.add_argument("stages", nargs="*", metavar="stage", help="stages to time (all if none are named)")
+    bench.add_argument("--scale", type=int, default=BENCH_SCALE_MB, help="synthetic genome size in MB")
+    bench.add_argument("--repeat", type=int, default=BENCH_REPEAT, help="runs per stage (the best is kept)")
+    bench.add_argument("--output", "-o", help="also write the results as JSON to this file")
+    bench.add_argument("--baseline", default=BENCH_BASELINE, help="baseline JSON to compare against")
+    bench.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    bench.add_argument("--tolerance", type=float, default=BENCH_TOLERANCE, help="allowed slowdown (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    if args.command is None:
+        menu()
+        return 0
+    if args.command == "list":
+        for name, (target, deps) in PIPELINE.items():
+            print(f"{name:<15} {target:<45} {'after ' + ', '.join(deps) if deps else ''}".rstrip())
+        return 0
+    if args.command == "bench":
+        return run_bench(args, parser)
+
+    try:
+        tasks = select(args.tasks, with_deps=not args.no_deps)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.dry_run:
+        print(f"Plan ({len(tasks)} task(s), up to {args.jobs} at a time):")
+        for i, name in enumerate(plan(tasks), 1):
+            target, deps = tasks[name]
+            print(f"{i:>3}. {name:<15} {target:<45} {'after ' + ', '.join(deps) if deps else ''}".rstrip())
+        return 0
+
+    results = run_all(args.tasks, jobs=args.jobs, with_deps=not args.no_deps)
+    return 0 if all(r["status"] == "success" for r in results.values()) else 1
+
 if __name__ == "__main__":
-    menu()
+    sys.exit(main())
@@ -0,0 +1,35 @@
+import os
+from config.settings import DATA_DIR
+from utils.build_state import record, up_to_date
+from utils.intervals import UCSC_TABLE_COLUMNS, load_track, mask_and_annotate
+from utils.logger import log_download_task, phase
+
+LIFTED_BED = os.path.join(DATA_DIR, "output_lifted.bed")
+GAP_TABLE = os.path.join(DATA_DIR, "ucsc_gap", "gap.tsv")
+CHROM_BED = os.path.join(DATA_DIR, "ucsc_chrominfo", "add_chrom.bed")
+MIRGENE_BED = os.path.join(DATA_DIR, "mirgene", "dre-all.bed")
+OUTPUT_BED = os.path.join(DATA_DIR, "enhancers_masked.bed")
+
+@log_download_task(script_name="mask_enhancers.py")
+def run(input_bed=LIFTED_BED, output_bed=OUTPUT_BED):
+    """
+    Clip the lifted enhancers to chromosome bounds, remove assembly gaps from
+    them and count the miRNA loci each remaining piece overlaps (last column).
+    """
+    inputs = [input_bed, GAP_TABLE, CHROM_BED, MIRGENE_BED]
+    for path in inputs:
+        if not os.path.exists(path):
+            raise Exception(f"Missing input {path}; run its download step first")
+    if up_to_date(f"mask {output_bed}", inputs, outputs=[output_bed]):
+        print(f"[✔] {output_bed} is up to date (inputs unchanged).")
+        return output_bed
+
+    with phase("post_process"):
+        sizes = load_track(CHROM_BED).sizes()
+        gaps = load_track(GAP_TABLE, UCSC_TABLE_COLUMNS)
+        mirgene = load_track(MIRGENE_BED)
+        n_in, n_out = mask_and_annotate(input_bed, output_bed, chrom_sizes=sizes, masks=[gaps],
+                                        annotations={"mirgene": mirgene})
+    record(f"mask {output_bed}", inputs, outputs=[output_bed])
+    print(f"Masked {n_in} enhancers into {n_out} gap-free pieces: {output_bed}")
+    return output_bed
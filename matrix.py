@@ -0,0 +1,63 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from config.settings import (ENSEMBL_FTP_BASE, SPECIES, ENABLED_SPECIES, ENSEMBL_FILE_TYPES,
+                             MATRIX_WORKERS, MATRIX_LARGE_SLOTS)
+from utils.logger import attach, current
+
+UCSC_BASE = "https://hgdownload.soe.ucsc.edu/goldenPath/"
+
+# file type -> (URL template, large?). Templates are filled from a SPECIES entry
+# plus `species` (the key), `release` and the base URLs.
+FILE_TYPES = {
+    "gtf": ("{ensembl_base}release-{release}/gtf/{species}/{ensembl}.{assembly}.{release}.gtf.gz", False),
+    "dna_primary": ("{ensembl_base}release-{release}/fasta/{species}/dna/{ensembl}.{assembly}.dna.primary_assembly.fa.gz", True),
+    "dna_toplevel": ("{ensembl_base}release-{release}/fasta/{species}/dna/{ensembl}.{assembly}.dna.toplevel.fa.gz", True),
+    "cdna": ("{ensembl_base}release-{release}/fasta/{species}/cdna/{ensembl}.{assembly}.cdna.all.fa.gz", False),
+    "ncrna": ("{ensembl_base}release-{release}/fasta/{species}/ncrna/{ensembl}.{assembly}.ncrna.fa.gz", False),
+    "chrom_sizes": ("{ucsc_base}{ucsc}/bigZips/{ucsc}.chrom.sizes", False),
+    "liftover_chain": ("{ucsc_base}{ucsc_previous}/liftOver/{ucsc_previous}To{ucsc_cap}.over.chain.gz", False),
+}
+
+def url(species, file_type, release=None):
+    """URL of one cell of the species x file-type matrix."""
+    info = SPECIES[species]
+    template, _ = FILE_TYPES[file_type]
+    return template.format(species=species, release=release, ensembl_base=ENSEMBL_FTP_BASE, ucsc_base=UCSC_BASE,
+                           ucsc_cap=info["ucsc"][:1].upper() + info["ucsc"][1:], **info)
+
+def entries(file_types=ENSEMBL_FILE_TYPES, species=None, release=None):
+    """
+    Expand the matrix into download jobs: one dict (species, assembly,
+    file_type, url, filename, large) per enabled species and file type.
+    """
+    jobs = []
+    for sp in species or ENABLED_SPECIES:
+        for file_type in file_types:
+            link = url(sp, file_type, release)
+            jobs.append({"species": sp, "assembly": SPECIES[sp]["assembly"], "file_type": file_type,
+                         "url": link, "filename": link.rsplit("/", 1)[-1], "large": FILE_TYPES[file_type][1]})
+    return jobs
+
+def fan_out(jobs, func, workers=MATRIX_WORKERS, large_slots=MATRIX_LARGE_SLOTS):
+    """
+    Run func(job) for every job on `workers` threads and return the results in
+    job order. Small files go first, and at most `large_slots` large jobs
+    (genomes) run at once, so big pulls never hold every slot while annotation
+    files wait, and one server isn't hit by several genome downloads together.
+    Worker threads report bytes/phases to the calling task's log record.
+    """
+    record = current()
+    large = threading.BoundedSemaphore(max(1, large_slots))
+    order = sorted(range(len(jobs)), key=lambda i: jobs[i].get("large", False))  # small first, else matrix order
+
+    def run(i):
+        job = jobs[i]
+        with attach(record):
+            if job.get("large"):
+                with large:
+                    return func(job)
+            return func(job)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {i: pool.submit(run, i) for i in order}
+        return [futures[i].result() for i in range(len(jobs))]
@@ -0,0 +1,187 @@
+import json, os, shutil
+import numpy as np
+from config.settings import DATA_DIR, ORTHOLOG_CACHE_DIR
+from utils.chain import cache_is_current, source_signature
+
+# Columns of ZFIN's human_orthos.txt, matched by header name (positions are used when there is no header)
+COLUMNS = ("zfin_id", "zfin_symbol", "zfin_name", "human_symbol", "human_name", "omim_id", "entrez_id", "hgnc_id", "evidence")
+_HEADERS = {"zfin id": "zfin_id", "zfin symbol": "zfin_symbol", "zfin name": "zfin_name",
+            "human symbol": "human_symbol", "human name": "human_name", "omim id": "omim_id",
+            "gene id": "entrez_id", "entrez gene id": "entrez_id", "hgnc id": "hgnc_id", "evidence": "evidence"}
+# Columns with a lookup index, in the order map_genes(by=None) tries them
+KEYS = ("zfin_id", "zfin_symbol", "hgnc_id", "entrez_id", "omim_id", "human_symbol")
+_PREFIXES = ("HGNC:", "NCBIGENE:", "OMIM:", "MIM:", "ZFIN:")
+DEFAULT_SOURCE = os.path.join(DATA_DIR, "orthologs", "human_orthos.txt")
+
+def normalize(values):
+    """Lookup keys for identifiers: upper case, without HGNC:/NCBIGene:/OMIM:/ZFIN: prefixes."""
+    keys = np.char.upper(np.char.strip(np.asarray(values, dtype=str)))
+    prefixed = np.flatnonzero(np.char.find(keys, ":") >= 0)
+    for prefix in _PREFIXES:
+        if len(prefixed):
+            sub = keys[prefixed]
+            keys[prefixed] = np.where(np.char.startswith(sub, prefix), np.char.replace(sub, prefix, "", count=1), sub)
+    return keys
+
+class OrthologStore:
+    """
+    Memory-mapped ZFIN <-> human ortholog table built by build_ortholog_cache().
+
+    One row per zebrafish/human gene pair (the evidence codes of its source
+    lines joined). Every column is int32 codes into a sorted vocabulary; the
+    KEYS columns also have a sorted array of normalized keys and a CSR index
+    (pairs with key k are order[ptr[k]:ptr[k+1]]), so a batch of identifiers
+    is resolved with one searchsorted call per column.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        with open(os.path.join(cache_dir, "meta.json")) as f:
+            self.meta = json.load(f)
+        load = lambda name: np.load(os.path.join(cache_dir, name + ".npy"), mmap_mode="r")
+        self.codes = {col: load(col) for col in COLUMNS}
+        self.vocabs = {col: load(col + ".vocab") for col in COLUMNS}
+        self.index = {col: (load(col + ".keys"), load(col + ".ptr"), load(col + ".order")) for col in KEYS}
+
+    def __len__(self):
+        return self.meta["pairs"]
+
+    def column(self, name, rows):
+        """Values of column `name` for pair `rows` ("" where missing)."""
+        codes = np.asarray(self.codes[name][rows])
+        values = np.asarray(self.vocabs[name])[np.maximum(codes, 0)] if len(self.vocabs[name]) else np.full(len(codes), "")
+        return np.where(codes >= 0, values, "")
+
+    def lookup(self, keys, by):
+        """
+        Pairs matching already-normalized `keys` in key column `by`. Returns
+        (query index, pair row) arrays; a key with several orthologs gives
+        several entries, an unknown key none.
+        """
+        sorted_keys, ptr, order = self.index[by]
+        keys = np.asarray(keys, dtype=str)
+        empty = np.array([], dtype=np.int64)
+        if not len(keys) or not len(sorted_keys):
+            return empty, empty
+        pos = np.searchsorted(sorted_keys, keys)
+        pos_ok = np.minimum(pos, len(sorted_keys) - 1)
+        found = np.flatnonzero((pos < len(sorted_keys)) & (np.asarray(sorted_keys)[pos_ok] == keys))
+        starts = np.asarray(ptr)[pos_ok[found]]
+        counts = np.asarray(ptr)[pos_ok[found] + 1] - starts
+        query = np.repeat(found, counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return query, np.asarray(order)[np.repeat(starts, counts) + offsets]
+
+    def pairs(self, genes, by=None):
+        """
+        (query index, pair row) arrays for a batch of identifiers. With `by`
+        (one of KEYS) only that column is searched; otherwise each identifier
+        is looked up in the KEYS columns in turn and the first column that
+        knows it wins. Symbols match case-insensitively.
+        """
+        keys = normalize(genes)
+        if by is not None:
+            return self.lookup(keys, by)
+        queries, rows = [], []
+        pending = np.arange(len(keys))
+        for col in KEYS:
+            if not len(pending):
+                break
+            query, row = self.lookup(keys[pending], col)
+            queries.append(pending[query])
+            rows.append(row)
+            resolved = np.zeros(len(pending), dtype=bool)
+            resolved[query] = True
+            pending = pending[~resolved]
+        if not queries:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+        query, row = np.concatenate(queries), np.concatenate(rows)
+        order = np.argsort(query, kind="stable")
+        return query[order], row[order]
+
+    def map_genes(self, genes, to="human_symbol", by=None):
+        """
+        Map many genes at once, e.g. map_genes(["tp53", "ZDB-GENE-990415-270"])
+        or map_genes(hgnc_ids, to="zfin_id", by="hgnc_id"). Returns
+        {gene: [values of column `to`]} with one entry per input (an empty
+        list for genes without an ortholog); duplicate values are dropped.
+        """
+        genes = list(genes)
+        query, rows = self.pairs(genes, by)
+        values = self.column(to, rows).tolist()
+        result = {gene: [] for gene in genes}
+        for q, value in zip(query.tolist(), values):
+            found = result[genes[q]]
+            if value and value not in found:
+                found.append(value)
+        return result
+
+def _parse(path):
+    """Read human_orthos.txt into one {column: value} dict per gene pair, merging the evidence codes."""
+    pairs = {}
+    positions = {col: i for i, col in enumerate(COLUMNS)}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            fields = [v.strip() for v in line.rstrip("\r\n").split("\t")]
+            if line.startswith("#") or not fields[0]:
+                continue
+            if not fields[0].startswith("ZDB-"):  # header line
+                named = {_HEADERS[v.lower()]: i for i, v in enumerate(fields) if v.lower() in _HEADERS}
+                if "zfin_id" in named:
+                    positions = named
+                continue
+            row = {col: fields[i] if i < len(fields) else "" for col, i in positions.items()}
+            key = (row["zfin_id"], row.get("entrez_id") or row.get("hgnc_id") or row.get("human_symbol"))
+            if key in pairs:
+                evidence = pairs[key].get("evidence", "")
+                if row.get("evidence") and row["evidence"] not in evidence.split(","):
+                    pairs[key]["evidence"] = f"{evidence},{row['evidence']}" if evidence else row["evidence"]
+            else:
+                pairs[key] = row
+    return list(pairs.values())
+
+def build_ortholog_cache(path, cache_dir):
+    """Convert human_orthos.txt into an OrthologStore directory (written aside, then swapped in)."""
+    pairs = _parse(path)
+    tmp = cache_dir + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    save = lambda name, arr: np.save(os.path.join(tmp, name + ".npy"), arr)
+
+    for col in COLUMNS:
+        values = np.array([p.get(col, "") for p in pairs], dtype=str)
+        vocab, codes = np.unique(values, return_inverse=True)
+        codes = codes.astype(np.int32)
+        if len(vocab) and vocab[0] == "":  # np.unique sorts "" first: missing values get -1
+            vocab, codes = vocab[1:], codes - 1
+        save(col, codes)
+        save(col + ".vocab", vocab)
+        if col in KEYS:
+            present = np.flatnonzero(codes >= 0)
+            keys, key_codes = np.unique(normalize(values[present]), return_inverse=True)
+            order = present[np.argsort(key_codes, kind="stable")]
+            ptr = np.concatenate([[0], np.cumsum(np.bincount(key_codes, minlength=len(keys)))])
+            save(col + ".keys", keys)
+            save(col + ".ptr", ptr)
+            save(col + ".order", order)
+
+    with open(os.path.join(tmp, "meta.json"), "w") as f:
+        json.dump({"source": source_signature(path), "pairs": len(pairs), "columns": list(COLUMNS)}, f)  # written last
+
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    os.replace(tmp, cache_dir)
+
+def cached_orthologs(path=DEFAULT_SOURCE, cache_root=ORTHOLOG_CACHE_DIR):
+    """
+    Return an OrthologStore for human_orthos.txt, building it only if there is
+    no cache yet or the content of the source file changed since it was built.
+    """
+    cache_dir = os.path.join(cache_root, os.path.basename(path))
+    if not cache_is_current(cache_dir, path):
+        print(f"Indexing orthologs {path} into {cache_dir} ...")
+        build_ortholog_cache(path, cache_dir)
+    return OrthologStore(cache_dir)
+
+def map_genes(genes, to="human_symbol", by=None, path=DEFAULT_SOURCE):
+    """map_genes() on the ortholog store of the downloaded human_orthos.txt (see OrthologStore.map_genes)."""
+    return cached_orthologs(path).map_genes(genes, to, by)
@@ -1,34 +1,27 @@
-import os, requests
-from config.settings import HUMAN_ORTHO_URL, DATA_DIR, HTTP_STATUS_CODES
-from tqdm import tqdm
+import os
+from config.settings import HUMAN_ORTHO_URL, DATA_DIR, ORTHOLOG_CACHE_DIR
+from utils.dwnld import fetch
+from utils.http_cache import is_fresh
+from utils.logger import log_download_task, phase
+from utils.ortholog_store import cached_orthologs
 
+@log_download_task(script_name="orthologs.py")
 def download():
     target_dir = os.path.join(DATA_DIR, "orthologs")
     os.makedirs(target_dir, exist_ok=True)
     filepath = os.path.join(target_dir, "human_orthos.txt")
 
     # Skip download if the fileee already existzz
-    if os.path.exists(filepath):
-        print(f"Orthologs data already exists at {filepath}")
-        return filepath
+    if is_fresh(HUMAN_ORTHO_URL, [filepath]):
+        print(f"Orthologs data already up to date at {filepath}")
+    # Download (resumable) with progress bar
+    elif not fetch(HUMAN_ORTHO_URL, filepath):
+        raise Exception("❌ Failed to download Orthologs data")
+    else:
+        print("✅ Orthologs data downloaded.")
 
-    # Make request and check response
-    try:
-        response = requests.get(HUMAN_ORTHO_URL, stream=True)
-        status_code = response.status_code
-        if status_code != 200:
-            msg = HTTP_STATUS_CODES.get(status_code, f"Unexpected error with status code {status_code}")
-            raise Exception(f"❌ Failed to download Orthologs data: {msg}")
-    except Exception as e:
-        print(str(e))
-        return None
-
-    # Save file with progress bar
-    total_size = int(response.headers.get('content-length', 0))
-    with open(filepath, "wb") as f, tqdm(total=total_size, unit='B', unit_scale=True) as bar:
-        for chunk in response.iter_content(chunk_size=8192):
-            f.write(chunk)
-            bar.update(len(chunk))
-
-    print("✅ Orthologs data downloaded.")
+    # Indexed lookup for utils.ortholog_store.map_genes (no-op while the file is unchanged)
+    with phase("post_process"):
+        store = cached_orthologs(filepath, ORTHOLOG_CACHE_DIR)
+    print(f"[INFO] {len(store)} ortholog pairs indexed")
     return filepath
@@ -1,50 +1,64 @@
-import os, requests, tarfile, zipfile
-from tqdm import tqdm
-from config.settings import DATA_DIR, LNC_RNA_URL, T_RNA_URL
+import os
+from config.settings import DATA_DIR, LNC_RNA_URL, T_RNA_URL, GTF_CACHE_DIR
+from utils.build_state import outputs_of, record, up_to_date
+from utils.dwnld import fetch
+from utils.extract import extract_members, stream_extract
+from utils.http_cache import is_fresh
+from utils.gtf_store import cached_gtf
+from utils.logger import log_download_task, phase
 
 def download_file(url, output_dir):
     os.makedirs(output_dir, exist_ok=True)
     local_filename = os.path.join(output_dir, url.split('/')[-1])
     
-    # Checkingg if thee file already exists
-    if os.path.exists(local_filename):
-        print(f"✅ File already exists: {local_filename}")
+    # Checkingg if thee file is already downloaded and unchanged on the server
+    if is_fresh(url, [local_filename]):
+        print(f"✅ File is up to date: {local_filename}")
         return local_filename
     
     print(f"⬇️ Downloading {url.split('/')[-1]} ...")
-    with requests.get(url, stream=True, verify=False) as r:  # verify=False since certificate was throwing an error
-        r.raise_for_status()
-        total = int(r.headers.get('content-length', 0))
-        with open(local_filename, 'wb') as f, tqdm(total=total, unit='B', unit_scale=True) as bar:
-            for chunk in r.iter_content(chunk_size=8192):
-                f.write(chunk)
-                bar.update(len(chunk))
+    if not fetch(url, local_filename):  # SSLError: see HTTP_CA_BUNDLES in settings
+        raise Exception(f"Failed to download {url}")
     print(f"✅ Downloaded {local_filename}")
     return local_filename
 
-def extract_file(filepath, extract_to):
-    os.makedirs(extract_to, exist_ok=True)
-    if filepath.endswith(".zip"):
-        print(f"📦 Extracting ZIP {filepath} ...")
-        with zipfile.ZipFile(filepath, 'r') as zip_ref:
-            zip_ref.extractall(extract_to)
-    elif filepath.endswith((".tar.gz", ".tgz")):
-        print(f"📦 Extracting TAR.GZ {filepath} ...")
-        with tarfile.open(filepath, 'r:gz') as tar_ref:
-            tar_ref.extractall(extract_to)
-    else:
-        print(f"No extraction performed for {filepath} (unsupported format). Check again")
+def extract_file(filepath, extract_to, patterns=("*",)):
+    """Extract the members matching `patterns` from a local .zip / .tar.gz."""
+    if filepath.endswith((".zip", ".tar.gz", ".tgz")):
+        print(f"📦 Extracting {filepath} ...")
+        return extract_members(filepath, extract_to, patterns)
+    print(f"No extraction performed for {filepath} (unsupported format). Check again")
+    return []
+
+def stream_tarball(url, output_dir, patterns=("*",)):
+    """Extract a remote .tar.gz straight from the response; the archive itself is never saved."""
+    if is_fresh(url):
+        print(f"✅ Files from {url.split('/')[-1]} are up to date")
+        return
+    print(f"⬇️ Streaming {url.split('/')[-1]} ...")
+    extracted = stream_extract(url, output_dir, patterns, mode="r|gz", flatten=False)
+    print(f"✅ Extracted {len(extracted)} file(s) into {output_dir}")
 
+@log_download_task(script_name="rna_files.py")
 def main():
     output_dir = os.path.join(DATA_DIR, "rna_files")
 
-    # Download & extract lncRNA
+    # Download & extract lncRNA (zip needs its central directory, so it can't be streamed);
+    # the GTFs are extracted again only when the zip changed
     lnc_path = download_file(LNC_RNA_URL, output_dir)
-    extract_file(lnc_path, output_dir)
+    step, patterns = f"extract {lnc_path}", ["*.gtf"]
+    if up_to_date(step, [lnc_path], {"patterns": patterns}):
+        gtfs = outputs_of(step)
+        print(f"✅ Extracted GTFs are up to date: {', '.join(gtfs)}")
+    else:
+        gtfs = extract_file(lnc_path, output_dir, patterns)
+        record(step, [lnc_path], {"patterns": patterns}, gtfs)
+    for gtf in gtfs:
+        with phase("post_process"):
+            cached_gtf(gtf, GTF_CACHE_DIR)  # columnar copy for fast lookups/overlaps
 
-    # Download & extract tRNA
-    trna_path = download_file(T_RNA_URL, output_dir)
-    extract_file(trna_path, output_dir)
+    # Stream-extract tRNA
+    stream_tarball(T_RNA_URL, output_dir)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,79 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from config.settings import MAX_WORKERS
+
+def _check_graph(tasks):
+    """Make sure every dependency exists and the task graph has no cycles."""
+    for name, (_, deps) in tasks.items():
+        for dep in deps:
+            if dep not in tasks:
+                raise ValueError(f"Task '{name}' depends on unknown task '{dep}'")
+
+    visiting, done = set(), set()
+    def visit(name, path):
+        if name in done:
+            return
+        if name in visiting:
+            raise ValueError(f"Dependency cycle detected: {' -> '.join(path + [name])}")
+        visiting.add(name)
+        for dep in tasks[name][1]:
+            visit(dep, path + [name])
+        visiting.discard(name)
+        done.add(name)
+    for name in tasks:
+        visit(name, [])
+
+def run_tasks(tasks, max_workers=MAX_WORKERS):
+    """
+    Run tasks concurrently on a bounded thread pool, respecting dependencies.
+
+    `tasks` maps a task name to a `(callable, [dependency names])` tuple. A task
+    starts as soon as all of its dependencies have succeeded; if any dependency
+    fails, the task is skipped. Returns a dict of per-task result records.
+    """
+    _check_graph(tasks)
+    results = {}
+    pending = dict(tasks)
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while pending or running:
+            for name in list(pending):
+                func, deps = pending[name]
+                if any(results.get(d, {}).get("status") in ("failed", "skipped") for d in deps):
+                    failed = [d for d in deps if results.get(d, {}).get("status") in ("failed", "skipped")]
+                    results[name] = {"status": "skipped", "duration_sec": 0,
+                                     "result": None, "error_message": f"dependency failed: {', '.join(failed)}"}
+                    del pending[name]
+                elif all(results.get(d, {}).get("status") == "success" for d in deps):
+                    print(f"[START] {name}")
+                    running[pool.submit(func)] = (name, time.time())
+                    del pending[name]
+
+            if not running:
+                continue
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name, start = running.pop(future)
+                duration = round(time.time() - start, 2)
+                try:
+                    result = future.result()
+                    results[name] = {"status": "success", "duration_sec": duration,
+                                     "result": result, "error_message": None}
+                    print(f"[DONE] {name} ({duration}s)")
+                except Exception as e:
+                    results[name] = {"status": "failed", "duration_sec": duration,
+                                     "result": None, "error_message": str(e)}
+                    print(f"[FAILED] {name}: {e}")
+
+    return {name: results[name] for name in tasks}
+
+def print_report(results):
+    """Print a per-task summary table for a scheduler run."""
+    print("\n==== Run Summary ====")
+    for name, rec in results.items():
+        line = f"{name:<15} {rec['status']:<8} {rec['duration_sec']:>8}s"
+        if rec["error_message"]:
+            line += f"  {rec['error_message']}"
+        print(line)
@@ -28,4 +28,136 @@ HTTP_STATUS_CODES = {
     504: "Gateway Timeout - The server did not receive a timely response. Please try again later..."
 }
 
-DATA_DIR = "data"
\ No newline at end of file
+DATA_DIR = "data"
+
+# Number of pipeline tasks allowed to run at the same time when running everything in parallel
+MAX_WORKERS = 4
+
+# How many times a download is attempted (resuming from the .part file) before giving up
+DOWNLOAD_RETRIES = 5
+
+# Segmented downloads: parallel connections per file, and the size below which a single stream is used instead
+SEGMENT_CONNECTIONS = 4
+SEGMENTED_MIN_SIZE = 64 * 1024 * 1024
+
+# Stream the Ensembl primary assembly through gunzip + 'chr' header rewrite instead of
+# saving the .gz first (single pass, no intermediate files, but no segmented/resumed download)
+ENSEMBL_FASTA_STREAMING = True
+
+# Keep the primary assembly as BGZF with .fai/.gzi indexes (built during download) instead of
+# a plain FASTA; regions are read with utils.fasta_store.FastaStore, which applies the 'chr' alias
+ENSEMBL_FASTA_BGZF = False
+
+# How long (seconds) the latest Ensembl release number from rest.ensembl.org is reused
+ENSEMBL_RELEASE_TTL = 24 * 60 * 60
+
+# Per-task performance records (bytes, phase timings, throughput, cache hits) for each run
+RUN_MANIFEST = os.path.join(DATA_DIR, "run_manifest.jsonl")
+RUN_MANIFEST_DB = os.path.join(DATA_DIR, "run_manifest.sqlite")
+# Optional Prometheus textfile-collector output, e.g. "/var/lib/node_exporter/textfile/gsh.prom"
+PROMETHEUS_TEXTFILE = None
+
+# Liftover engine: "batch" (vectorized NumPy chain index) or "pyliftover" (original per-line path)
+LIFTOVER_ENGINE = "batch"
+# Processes used by the batch engine; large BED inputs are split into chunks across them
+LIFTOVER_WORKERS = max(1, (os.cpu_count() or 1) // 2)
+
+# By default COSMIC is extracted straight from the response, with a fresh pre-signed URL per
+# attempt. True opts in to the resumable, segmented download that keeps the .tar and extracts it after
+COSMIC_KEEP_ARCHIVE = False
+
+# Columnar GTF caches (utils.gtf_store), rebuilt when the source GTF changes
+GTF_CACHE_DIR = os.path.join(DATA_DIR, "gtf_cache")
+
+# Shared HTTP transport (utils.transport): attempts per request for connection errors,
+# timeouts and 5xx/429 responses, exponential backoff base/cap in seconds (with jitter;
+# a longer Retry-After from the server wins), (connect, read) timeouts, and pooled
+# connections per host (more requests to the same host wait for a free connection)
+HTTP_RETRIES = 4
+HTTP_BACKOFF = 1.0
+HTTP_BACKOFF_MAX = 60
+HTTP_TIMEOUT = (15, 120)
+HTTP_MAX_PER_HOST = 6
+# Certificate checks per host: a CA bundle (PEM path) for servers with an incomplete
+# chain, e.g. {"www.biochen.org": "certs/biochen_chain.pem"}; everything else is verified normally.
+# www.biochen.org (LNC_RNA_URL) needs one; README.md shows how to build it
+HTTP_CA_BUNDLES = {}
+
+# UCSC database tables fetched by gaps_ftp (goldenPath/<assembly>/database/<table>.txt.gz),
+# over this many reused FTP logins
+UCSC_FTP_HOST = "hgdownload.soe.ucsc.edu"
+UCSC_TABLES = ["gap", "cytoBand", "rmsk"]
+FTP_SESSIONS = 3
+FTP_TIMEOUT = 60
+
+# UCSC Table Browser exports (uscs_gaps). Sharded mode (opt-in) sends one query per main
+# chromosome (chr1..chr25, chrM from chromInfo_zg11.txt) plus one genome-wide query for the
+# small scaffolds, with this many in flight and at least this many seconds between query
+# starts. UCSC's policy for scripted access is one hit every 15 s and at most 5,000 a day.
+UCSC_SHARDED = False
+UCSC_SHARD_WORKERS = 1
+UCSC_SHARD_INTERVAL = 15.0
+
+# Species x assembly x file-type download matrix (utils.matrix). Each species gives its Ensembl
+# file prefix and assembly, its UCSC assembly and the previous one (for the liftover chain),
+# and the short label used in chromInfo_<label>.txt
+SPECIES = {
+    "danio_rerio": {"ensembl": "Danio_rerio", "assembly": "GRCz11", "ucsc": "danRer11", "ucsc_previous": "danRer10", "label": "zg11"},
+    "homo_sapiens": {"ensembl": "Homo_sapiens", "assembly": "GRCh38", "ucsc": "hg38", "ucsc_previous": "hg19", "label": "hg38"},
+}
+DEFAULT_SPECIES = "danio_rerio"
+ENABLED_SPECIES = ["danio_rerio"]  # add "homo_sapiens" to pull human alongside zebrafish
+ENSEMBL_FILE_TYPES = ["gtf", "dna_primary"]  # see utils.matrix.FILE_TYPES for the others
+# Downloads of one matrix run at the same time, and how many of them may be large (genomes)
+MATRIX_WORKERS = 4
+MATRIX_LARGE_SLOTS = 1
+# Global download budget in bytes/s shared by all transfers (None = unlimited), e.g. 50 * 1024 * 1024
+MAX_BANDWIDTH = None
+# Largest block an HTTP transfer reads from the socket at once (utils.transport.iter_into; blocks
+# grow towards it on fast links). Each running transfer holds one buffer of this size.
+TRANSFER_BUFFER_MAX = 8 * 1024 * 1024
+
+# Benchmark harness (python main.py bench): synthetic genome size in MB, runs per stage
+# (the best is kept), and how far below the stored baseline a stage may fall before it is
+# reported as a regression. Baselines are machine-specific; save one per host.
+BENCH_SCALE_MB = 32
+BENCH_REPEAT = 3
+BENCH_TOLERANCE = 0.2
+BENCH_BASELINE = os.path.join(DATA_DIR, "benchmark_baseline.json")
+
+# Published checksum listings (utils.checksums): a download whose URL starts with the prefix is
+# verified against the listing file in its own directory while it streams in. Algorithms:
+# "sum" (BSD sum, Ensembl CHECKSUMS), "md5" or "sha256" (md5sum-style "digest  name" lines).
+# Everything else is checked against the SHA-256 recorded for the same source version.
+CHECKSUM_FILES = [
+    (ENSEMBL_FTP_BASE, "CHECKSUMS", "sum"),
+    ("https://hgdownload.soe.ucsc.edu/goldenPath/", "md5sum.txt", "md5"),
+]
+
+# BED-like outputs (liftover, mirgene, gaps_ftp tables, wget add_chrom.bed) also get a
+# coordinate-sorted, BGZF-compressed copy <file>.gz with a tabix .tbi index, for region
+# queries with utils.tabix.TabixFile (or tabix/pysam). Inputs of more than SORT_CHUNK_LINES
+# lines are sorted in runs on disk and merged.
+TABIX_OUTPUTS = True
+SORT_CHUNK_LINES = 2_000_000
+
+# Optional content-addressed store shared by every checkout and user on a machine
+# (utils.shared_store), e.g. "/srv/gsh_store" (None = off). Downloads and the files made from
+# them are kept there under their SHA-256, looked up by source URL + ETag/Last-Modified, and
+# data/ is populated from it with the first link method that works (copies only across
+# filesystems). Least recently used objects are evicted beyond SHARED_STORE_MAX_BYTES.
+# For several users, make the directory group-writable (setgid) and run with umask 002.
+SHARED_STORE = None
+SHARED_STORE_MAX_BYTES = 200 * 1024 ** 3
+SHARED_STORE_LINK = ["reflink", "hardlink", "copy"]
+
+# Indexed copy of ZFIN's human_orthos.txt (utils.ortholog_store) for batch ZFIN <-> HGNC/Entrez/OMIM
+# mapping with map_genes(), rebuilt when the downloaded file changes
+ORTHOLOG_CACHE_DIR = os.path.join(DATA_DIR, "ortholog_cache")
+
+# Decompression of .gz archives on disk (utils.gunzip; FTP tables are inflated in-stream).
+# BGZF and multi-member gzip are cut at member boundaries into ranges of about
+# GUNZIP_CHUNK_BYTES compressed bytes, inflated on GUNZIP_WORKERS threads; single-member
+# files are read, inflated and written in a pipeline.
+GUNZIP_WORKERS = os.cpu_count() or 1
+GUNZIP_CHUNK_BYTES = 4 * 1024 * 1024
@@ -0,0 +1,209 @@
+import hashlib, os, shutil, sqlite3, time, uuid
+from contextlib import contextmanager
+from config.settings import SHARED_STORE, SHARED_STORE_MAX_BYTES, SHARED_STORE_LINK
+from utils.checksums import adopt
+from utils.http_cache import remember
+from utils.logger import phase
+from utils.transport import get
+
+try:
+    import fcntl
+except ImportError:  # Windows: no reflinks, hardlinks and copies still work
+    fcntl = None
+
+STORE_DIR = SHARED_STORE  # None turns the store off (the benchmark does this)
+FICLONE = 0x40049409  # linux/fs.h: clone the source's extents (btrfs, XFS with reflink=1, ...)
+
+def _validator(headers):
+    return headers.get("ETag") or headers.get("Last-Modified")
+
+def _key(url, validator, variant):
+    """
+    Store key for one version of a source. The query string is dropped, so
+    pre-signed URLs (COSMIC) that change on every request still match; the
+    validator tells versions apart.
+    """
+    return f"{url.split('?')[0]} {validator} {variant}"
+
+def _object(sha256):
+    return os.path.join(STORE_DIR, "objects", sha256[:2], sha256)
+
+def _sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+@contextmanager
+def _transaction():
+    """
+    Write transaction on the store index. BEGIN IMMEDIATE takes SQLite's write
+    lock, so concurrent pipeline runs (any user, any checkout) take turns.
+    """
+    os.makedirs(os.path.join(STORE_DIR, "objects"), exist_ok=True)
+    db = sqlite3.connect(os.path.join(STORE_DIR, "index.sqlite"), timeout=600, isolation_level=None)
+    try:
+        db.execute("BEGIN IMMEDIATE")
+        db.execute("CREATE TABLE IF NOT EXISTS objects (sha256 TEXT PRIMARY KEY, size INTEGER, last_used REAL)")
+        db.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, url TEXT, validator TEXT, variant TEXT, created REAL)")
+        db.execute("CREATE TABLE IF NOT EXISTS files (key TEXT, name TEXT, sha256 TEXT, PRIMARY KEY (key, name))")
+        db.execute("CREATE INDEX IF NOT EXISTS files_sha256 ON files (sha256)")
+        yield db
+        db.execute("COMMIT")
+    except BaseException:
+        if db.in_transaction:
+            db.execute("ROLLBACK")
+        raise
+    finally:
+        db.close()
+
+def _link(src, dst):
+    """
+    Make `dst` a reflink, hardlink or copy of `src`, trying the methods in
+    SHARED_STORE_LINK order, and return the one that worked. `dst` is
+    replaced atomically.
+    """
+    tmp = f"{dst}.{uuid.uuid4().hex[:8]}.tmp"
+    for method in SHARED_STORE_LINK:
+        try:
+            if method == "reflink":
+                if fcntl is None:
+                    continue
+                with open(src, "rb") as s, open(tmp, "wb") as d:
+                    fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+            elif method == "hardlink":
+                os.link(src, tmp)
+            else:
+                shutil.copyfile(src, tmp)
+            os.replace(tmp, dst)
+            return method
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+    raise OSError(f"could not link {src} to {dst} ({', '.join(SHARED_STORE_LINK)} all failed)")
+
+def _evict(db, keep):
+    """
+    Delete least recently used objects (and the entries that need them) until
+    the store is within SHARED_STORE_MAX_BYTES. Objects no entry refers to go
+    first; those in `keep` (just added) stay. A data/ file hardlinked to an
+    evicted object keeps its data, the store just stops sharing it.
+    """
+    total = db.execute("SELECT COALESCE(SUM(size), 0) FROM objects").fetchone()[0]
+    if total <= SHARED_STORE_MAX_BYTES:
+        return
+    candidates = db.execute("SELECT sha256, size FROM objects "
+                            "ORDER BY sha256 IN (SELECT sha256 FROM files), last_used").fetchall()
+    for sha256, size in candidates:
+        if total <= SHARED_STORE_MAX_BYTES:
+            break
+        if sha256 in keep:
+            continue
+        keys = [k for (k,) in db.execute("SELECT DISTINCT key FROM files WHERE sha256 = ?", (sha256,))]
+        for k in keys:
+            db.execute("DELETE FROM entries WHERE key = ?", (k,))
+            db.execute("DELETE FROM files WHERE key = ?", (k,))
+        db.execute("DELETE FROM objects WHERE sha256 = ?", (sha256,))
+        if os.path.exists(_object(sha256)):
+            os.remove(_object(sha256))
+        total -= size
+        print(f"🧹 Evicted {sha256[:12]} ({size / 1e6:,.1f} MB) from the shared store")
+
+def save(url, validator, outputs, base, variant="", digests=None):
+    """
+    File `outputs` (paths under `base`, named relative to it) in the shared
+    store as the version `validator` (ETag / Last-Modified) of `url`. Files
+    derived from the download (gunzipped, extracted, re-blocked) get their
+    own `variant`. `digests` maps paths to SHA-256s already computed while
+    downloading; the rest are hashed here. Returns True if stored.
+    """
+    if not STORE_DIR or not validator:
+        return False
+    key = _key(url, validator, variant)
+    staged = []
+    try:
+        files = {}
+        for path in outputs:
+            sha256 = (digests or {}).get(path) or _sha256(path)
+            files[os.path.relpath(path, base or ".")] = sha256
+            if not os.path.exists(_object(sha256)):
+                # linked (or copied) in outside the lock, moved into place inside it
+                os.makedirs(os.path.dirname(_object(sha256)), exist_ok=True)
+                tmp = f"{_object(sha256)}.{uuid.uuid4().hex[:8]}.new"
+                _link(path, tmp)
+                os.chmod(tmp, 0o444)  # a write through a hardlinked data/ file would change the shared copy
+                staged.append((tmp, sha256))
+        now = time.time()
+        with _transaction() as db:
+            for tmp, sha256 in staged:
+                if not os.path.exists(_object(sha256)):
+                    os.replace(tmp, _object(sha256))
+            for sha256 in set(files.values()):
+                db.execute("INSERT OR REPLACE INTO objects VALUES (?, ?, ?)",
+                           (sha256, os.path.getsize(_object(sha256)), now))
+            db.execute("DELETE FROM files WHERE key = ?", (key,))
+            db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)", (key, url.split("?")[0], validator, variant, now))
+            db.executemany("INSERT INTO files VALUES (?, ?, ?)", [(key, name, sha256) for name, sha256 in files.items()])
+            _evict(db, set(files.values()))
+        print(f"🗄️ Added {len(files)} file(s) from {url.split('?')[0].rsplit('/', 1)[-1]} to the shared store")
+        return True
+    except (OSError, sqlite3.Error) as e:
+        print(f"⚠️ Could not add {url.split('?')[0]} to the shared store: {e}")
+        return False
+    finally:
+        for tmp, _ in staged:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+def _probe(url, verify=None):
+    """Response headers of `url` (the body is not read), or {} if the source can't be reached."""
+    try:
+        with phase("connect"), get(url, stream=True, headers={"Accept-Encoding": "identity"}, verify=verify, retries=2) as r:
+            r.raise_for_status()
+            return r.headers
+    except Exception as e:
+        print(f"⚠️ Could not check {url} against the shared store: {e}")
+        return {}
+
+def restore(url, base, variant="", outputs=None, headers=None, verify=None):
+    """
+    Link the files the shared store holds for the current version of `url`
+    into `base` (reflink, hardlink or copy; see SHARED_STORE_LINK), and record
+    them like a download (http_cache validators, checksum manifest).
+    `headers` are the source's response headers when the caller already has
+    them; otherwise the source is asked once. With `outputs`, only an entry
+    holding exactly those paths counts (a single file may have been saved
+    under another name). Returns the paths, or None on a miss.
+    """
+    if not STORE_DIR:
+        return None
+    if headers is None:
+        headers = _probe(url, verify)
+    validator = _validator(headers)
+    if not validator:
+        return None
+    try:
+        with _transaction() as db:
+            key = _key(url, validator, variant)
+            if not db.execute("SELECT 1 FROM entries WHERE key = ?", (key,)).fetchone():
+                return None
+            rows = db.execute("SELECT name, sha256 FROM files WHERE key = ?", (key,)).fetchall()
+            targets = {os.path.normpath(os.path.join(base or ".", name)): sha256 for name, sha256 in rows}
+            if outputs is not None and len(outputs) == len(rows) == 1:
+                targets = {os.path.normpath(outputs[0]): rows[0][1]}
+            elif outputs is not None and set(targets) != {os.path.normpath(p) for p in outputs}:
+                return None
+            # now the most recently used, so a concurrent eviction won't pick them while we link
+            db.executemany("UPDATE objects SET last_used = ? WHERE sha256 = ?", [(time.time(), s) for s in targets.values()])
+        methods = set()
+        for path, sha256 in targets.items():
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            methods.add(_link(_object(sha256), path))
+    except (OSError, sqlite3.Error) as e:
+        print(f"⚠️ Could not restore {url.split('?')[0]} from the shared store: {e}")
+        return None
+    remember(url, headers, outputs=list(targets))
+    adopt(url, validator, {path: None if variant else sha256 for path, sha256 in targets.items()})
+    print(f"🗄️ {len(targets)} file(s) for {url.split('?')[0].rsplit('/', 1)[-1]} from the shared store ({', '.join(sorted(methods)) or 'empty'})")
+    return list(targets)
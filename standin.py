@@ -0,0 +1,192 @@
+import os, re, socket, socketserver, threading, time
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    """Static file handler that understands single `Range`/`If-Range` and `If-None-Match` requests."""
+
+    accept_ranges = True
+
+    def log_message(self, *args):
+        pass
+
+    def send_head(self):
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            self.send_error(404, "File not found")
+            return None
+
+        st = os.stat(path)
+        total = st.st_size
+        etag = f'"{st.st_mtime_ns:x}-{total:x}"'
+        start, end, status = 0, total - 1, 200
+
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return None
+
+        match = re.match(r"bytes=(\d+)-(\d*)$", self.headers.get("Range", ""))
+        if_range = self.headers.get("If-Range")
+        if self.accept_ranges and match and (if_range is None or if_range == etag):
+            start = int(match.group(1))
+            end = min(int(match.group(2)), total - 1) if match.group(2) else total - 1
+            if start >= total:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{total}")
+                self.end_headers()
+                return None
+            status = 206
+
+        f = open(path, "rb")
+        f.seek(start)
+        self.send_response(status)
+        self.send_header("Content-Type", self.guess_type(path))
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", self.date_time_string(st.st_mtime))
+        self.send_header("Accept-Ranges", "bytes" if self.accept_ranges else "none")
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{total}")
+        self.end_headers()
+        self._remaining = end - start + 1
+        return f
+
+    def copyfile(self, source, outputfile):
+        try:
+            while self._remaining > 0:
+                buf = source.read(min(self._remaining, 1 << 20))
+                if not buf:
+                    break
+                outputfile.write(buf)
+                self._remaining -= len(buf)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # client hung up early (e.g. after probing a non-ranged response)
+
+def serve_http(root, port=0, accept_ranges=True):
+    """
+    Serve `root` over HTTP on localhost from a background thread.
+
+    Stand-in for the real download servers (Ensembl, COSMIC, ...) so downloads
+    can be exercised offline. Returns (server, base_url); call
+    `server.shutdown()` when done.
+    """
+    handler = type("Handler", (RangeRequestHandler,), {"accept_ranges": accept_ranges})
+    server = ThreadingHTTPServer(("127.0.0.1", port), partial(handler, directory=root))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/"
+
+class FtpHandler(socketserver.StreamRequestHandler):
+    """
+    Minimal anonymous, read-only FTP server: USER/PASS, TYPE, PWD/CWD, PASV/EPSV,
+    SIZE, MDTM, REST, RETR, NLST, NOOP, QUIT. Enough for ftplib clients.
+
+    `drop_after` (bytes) aborts every RETR after that much data, to exercise
+    resuming; `connections` counts control connections (session reuse).
+    """
+
+    root = "."
+    drop_after = None
+    connections = 0
+
+    def reply(self, line):
+        self.wfile.write((line + "\r\n").encode())
+
+    def path(self, arg):
+        path = os.path.normpath(os.path.join(self.cwd, arg)) if arg else self.cwd
+        return path if path.startswith("/") else "/" + path
+
+    def local(self, arg):
+        return os.path.join(self.root, self.path(arg).lstrip("/"))
+
+    def handle(self):
+        type(self).connections += 1
+        self.cwd, self.rest, self.passive = "/", 0, None
+        self.reply("220 stand-in FTP ready")
+        for raw in self.rfile:
+            cmd, _, arg = raw.decode().strip().partition(" ")
+            cmd = cmd.upper()
+            if cmd == "USER": self.reply("331 Password required")
+            elif cmd == "PASS": self.reply("230 Logged in")
+            elif cmd == "TYPE": self.reply("200 Type set")
+            elif cmd in ("NOOP", "FEAT"): self.reply("200 OK")
+            elif cmd == "PWD": self.reply(f'257 "{self.cwd}"')
+            elif cmd == "CWD":
+                if os.path.isdir(self.local(arg)):
+                    self.cwd = self.path(arg)
+                    self.reply("250 OK")
+                else:
+                    self.reply("550 No such directory")
+            elif cmd in ("PASV", "EPSV"):
+                self.passive = socket.socket()
+                self.passive.bind(("127.0.0.1", 0))
+                self.passive.listen(1)
+                port = self.passive.getsockname()[1]
+                if cmd == "EPSV":
+                    self.reply(f"229 Entering Extended Passive Mode (|||{port}|)")
+                else:
+                    self.reply(f"227 Entering Passive Mode (127,0,0,1,{port >> 8},{port & 255})")
+            elif cmd == "SIZE":
+                path = self.local(arg)
+                self.reply(f"213 {os.path.getsize(path)}" if os.path.isfile(path) else "550 No such file")
+            elif cmd == "MDTM":
+                path = self.local(arg)
+                if os.path.isfile(path):
+                    self.reply("213 " + time.strftime("%Y%m%d%H%M%S", time.gmtime(os.path.getmtime(path))))
+                else:
+                    self.reply("550 No such file")
+            elif cmd == "REST":
+                self.rest = int(arg)
+                self.reply(f"350 Restarting at {self.rest}")
+            elif cmd in ("RETR", "NLST"):
+                self.transfer(cmd, arg)
+            elif cmd == "QUIT":
+                self.reply("221 Bye")
+                break
+            else:
+                self.reply("502 Command not implemented")
+
+    def transfer(self, cmd, arg):
+        path = self.local(arg)
+        if self.passive is None or (cmd == "RETR" and not os.path.isfile(path)):
+            self.reply("550 Cannot transfer")
+            return
+        self.reply("150 Opening data connection")
+        conn, _ = self.passive.accept()
+        self.passive.close()
+        self.passive = None
+        dropped = False
+        with conn:
+            if cmd == "NLST":
+                conn.sendall("".join(n + "\r\n" for n in sorted(os.listdir(path))).encode())
+            else:
+                with open(path, "rb") as f:
+                    f.seek(self.rest)
+                    limit = self.drop_after
+                    while True:
+                        buf = f.read(1 << 16 if limit is None else min(1 << 16, limit))
+                        if not buf:
+                            break
+                        conn.sendall(buf)
+                        if limit is not None:
+                            limit -= len(buf)
+                            if limit <= 0:
+                                dropped = True
+                                break
+        self.rest = 0
+        self.reply("426 Connection closed; transfer aborted" if dropped else "226 Transfer complete")
+
+def serve_ftp(root, port=0, drop_after=None):
+    """
+    Serve `root` over anonymous FTP on localhost from a background thread
+    (stand-in for hgdownload.soe.ucsc.edu). Returns (server, host, port); the
+    handler class is `server.handler`, for its `connections` counter and
+    `drop_after` setting.
+    """
+    handler = type("Handler", (FtpHandler,), {"root": root, "drop_after": drop_after, "connections": 0})
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    server.handler = handler
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, "127.0.0.1", server.server_address[1]
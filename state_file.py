@@ -0,0 +1,49 @@
+import json, os, tempfile
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the callers' thread locks apply
+    fcntl = None
+
+@contextmanager
+def locked(path):
+    """
+    Exclusive lock on `path` + ".lock" for a read-modify-write of `path`, so
+    concurrent runs (two checkouts sharing data/, cron overlapping a manual
+    run) take turns instead of dropping each other's entries.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path + ".lock", "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+def load_json(path):
+    """The JSON object in `path`, or {} if it is missing or unreadable."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_json(path, data):
+    """Write `data` to a temp file of its own next to `path`, then rename it over `path`."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        mode = os.stat(path).st_mode & 0o777
+    except OSError:
+        mode = 0o644
+    try:
+        os.chmod(tmp, mode)  # mkstemp makes it owner-only
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
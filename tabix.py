@@ -0,0 +1,369 @@
+import heapq, mmap, os, struct, tempfile
+from itertools import islice
+import numpy as np
+from config.settings import SORT_CHUNK_LINES
+from utils.bgzf import BLOCK_DATA_SIZE, BgzfWriter, read_block
+from utils.intervals import BED_COLUMNS
+
+# Tabix (.tbi) index over a coordinate-sorted BGZF file, as written by `tabix`:
+# a UCSC binning index (16 KiB smallest bins, 5 levels) plus a linear index of
+# the first record overlapping each 16 KiB window. All coordinates are 0-based
+# half-open (tabix -p bed / TBX_UCSC).
+MIN_SHIFT = 14
+DEPTH = 5
+MAX_POS = 1 << (MIN_SHIFT + 3 * DEPTH)  # 512 Mb
+TBX_UCSC = 0x10000
+META_CHAR = "#"
+
+def reg2bin(beg, end):
+    """Smallest bin that holds all of [beg, end)."""
+    end -= 1
+    for level in range(DEPTH, 0, -1):
+        shift = MIN_SHIFT + 3 * (DEPTH - level)
+        if beg >> shift == end >> shift:
+            return ((1 << 3 * level) - 1) // 7 + (beg >> shift)
+    return 0
+
+def reg2bins(beg, end):
+    """Every bin that may hold records overlapping [beg, end)."""
+    end -= 1
+    bins = [0]
+    for level in range(1, DEPTH + 1):
+        shift = MIN_SHIFT + 3 * (DEPTH - level)
+        first = ((1 << 3 * level) - 1) // 7
+        bins.extend(range(first + (beg >> shift), first + (end >> shift) + 1))
+    return bins
+
+# ---- sorting ----
+
+def _is_header(line):
+    return line.startswith((META_CHAR, "track", "browser")) or not line.strip()
+
+def _key(columns):
+    c, s, e = columns
+    width = max(columns) + 1
+
+    def key(line):
+        fields = line.split("\t", width)
+        return fields[c], int(fields[s]), int(fields[e])
+    return key
+
+def _sorted_records(path, columns=BED_COLUMNS, chunk_lines=SORT_CHUNK_LINES, tmp_dir=None):
+    """
+    Yield (chrom, start, end, line) for the lines of a BED-like file ordered by
+    (chromosome, start, end); header lines come first as (None, None, None,
+    line), with `track`/`browser` lines turned into # comments so tabix skips
+    them. Files of up to `chunk_lines` lines are sorted in memory; larger ones
+    are cut into sorted runs on disk and merged, so memory use does not grow
+    with the input.
+    """
+    key = _key(columns)
+    width = max(columns) + 1
+    headers, records, runs = [], [], []
+    with tempfile.TemporaryDirectory(dir=tmp_dir or os.path.dirname(os.path.abspath(path))) as tmp:
+        with open(path) as f:
+            while True:
+                chunk = list(islice(f, chunk_lines))
+                if not chunk:
+                    break
+                records = []
+                for line in chunk:
+                    if not line.endswith("\n"):
+                        line += "\n"
+                    if _is_header(line):
+                        if line.strip():
+                            headers.append(line if line.startswith(META_CHAR) else META_CHAR + line)
+                    elif line.count("\t") >= width - 1:
+                        records.append((*key(line), line))
+                records.sort()
+                if len(chunk) < chunk_lines and not runs:
+                    break  # the whole file fitted in one chunk
+                runs.append(os.path.join(tmp, f"run{len(runs)}"))
+                with open(runs[-1], "w") as out:
+                    out.writelines(r[3] for r in records)
+                records = []
+        for line in headers:
+            yield None, None, None, line
+        if not runs:
+            yield from records
+            return
+        files = [open(run) for run in runs]
+        try:
+            for line in heapq.merge(*files, key=key):
+                yield (*key(line), line)
+        finally:
+            for f in files:
+                f.close()
+
+def sorted_lines(path, columns=BED_COLUMNS, chunk_lines=SORT_CHUNK_LINES, tmp_dir=None):
+    """The lines of a BED-like file sorted by (chromosome, start, end), headers first (external sort for big inputs)."""
+    for *_, line in _sorted_records(path, columns, chunk_lines, tmp_dir):
+        yield line
+
+# ---- writing ----
+
+def _bins(begs, ends):
+    """reg2bin() for arrays of intervals (ends already at least begs + 1)."""
+    last = ends - 1
+    bins = np.zeros(len(begs), dtype=np.int64)
+    for level in range(1, DEPTH + 1):  # finer levels overwrite coarser ones
+        shift = MIN_SHIFT + 3 * (DEPTH - level)
+        same = (begs >> shift) == (last >> shift)
+        bins[same] = ((1 << 3 * level) - 1) // 7 + (begs[same] >> shift)
+    return bins
+
+class _IndexBuilder:
+    """
+    Collects bins and linear-index entries, in uncompressed offsets, for
+    batches of sorted records while the BGZF file is written.
+    """
+
+    def __init__(self):
+        self.names, self.refs = [], []
+        self._last = None  # [bin, chunk] of the latest record, to extend across batches
+
+    def _ref(self, chrom):
+        if not self.names or self.names[-1] != chrom:
+            if chrom in self.names:
+                raise ValueError(f"{chrom} appears in more than one block; the input is not sorted")
+            self.names.append(chrom)
+            self.refs.append(({}, np.zeros(0, dtype=np.int64)))
+            self._last = None
+        return self.refs[-1]
+
+    def add(self, chroms, begs, ends, u_begs, u_ends):
+        """Index one batch: `chroms` a list, the rest int64 arrays, all in file order."""
+        cuts = [0] + [i for i in range(1, len(chroms)) if chroms[i] != chroms[i - 1]] + [len(chroms)]
+        for a, b in zip(cuts, cuts[1:]):
+            self._add_ref(chroms[a], begs[a:b], ends[a:b], u_begs[a:b], u_ends[a:b])
+
+    def _add_ref(self, chrom, begs, ends, u_begs, u_ends):
+        bins, linear = self._ref(chrom)
+        if ends.max() > MAX_POS:
+            raise ValueError(f"{chrom}: coordinates beyond the {MAX_POS} bp a tabix index can address")
+        ends = np.maximum(ends, begs + 1)
+        rec_bins = _bins(begs, ends)
+
+        # one chunk per run of consecutive records in the same bin
+        new = np.ones(len(begs), dtype=bool)
+        new[1:] = (rec_bins[1:] != rec_bins[:-1]) | (u_begs[1:] != u_ends[:-1])
+        starts = np.flatnonzero(new)
+        stops = np.append(starts[1:], len(begs)) - 1
+        for first, last in zip(starts.tolist(), stops.tolist()):
+            bin_ = int(rec_bins[first])
+            if first == 0 and self._last and self._last[0] == bin_ and self._last[1][1] == int(u_begs[0]):
+                chunk = self._last[1]
+                chunk[1] = int(u_ends[last])
+            else:
+                chunk = [int(u_begs[first]), int(u_ends[last])]
+                bins.setdefault(bin_, []).append(chunk)
+            self._last = (bin_, chunk)
+
+        # linear index: smallest offset of a record touching each 16 KiB window
+        w0, w1 = begs >> MIN_SHIFT, (ends - 1) >> MIN_SHIFT
+        if w1.max() >= len(linear):
+            grown = np.full(int(w1.max()) + 1, np.iinfo(np.int64).max, dtype=np.int64)
+            grown[:len(linear)] = linear
+            linear = grown
+            self.refs[-1] = (bins, linear)
+        counts = w1 - w0 + 1
+        windows = np.repeat(w0 - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        np.minimum.at(linear, windows, np.repeat(u_begs, counts))
+
+    def write(self, path, blocks, eof, columns, skip):
+        """Write the .tbi, translating uncompressed offsets to BGZF virtual offsets."""
+        block_c = np.array([c for c, _ in blocks] or [0], dtype=np.uint64)
+        block_u = np.array([u for _, u in blocks] or [0], dtype=np.uint64)
+
+        def voffsets(u):
+            u = np.asarray(u, dtype=np.uint64)
+            i = (u // np.uint64(BLOCK_DATA_SIZE)).astype(np.int64)
+            past = i >= len(blocks)
+            i = np.minimum(i, max(len(blocks) - 1, 0))
+            v = block_c[i] << np.uint64(16) | (u - block_u[i])
+            return np.where(past, np.uint64(eof) << np.uint64(16), v)
+
+        names = b"".join(n.encode() + b"\0" for n in self.names)
+        out = [b"TBI\1", struct.pack("<8i", len(self.names), TBX_UCSC, columns[0] + 1, columns[1] + 1,
+                                     columns[2] + 1, ord(META_CHAR), skip, len(names)), names]
+        for bins, linear in self.refs:
+            out.append(struct.pack("<i", len(bins)))
+            order = sorted(bins)
+            flat = voffsets([u for b in order for chunk in bins[b] for u in chunk]).astype("<u8").tobytes()
+            pos = 0
+            for b in order:
+                n = len(bins[b])
+                out.append(struct.pack("<Ii", b, n) + flat[pos:pos + 16 * n])
+                pos += 16 * n
+            # windows nothing touches take the previous window's offset
+            missing = linear == np.iinfo(np.int64).max
+            filled = voffsets(np.where(missing, 0, linear))
+            filled[missing] = 0
+            filled = np.maximum.accumulate(filled) if len(filled) else filled
+            out.append(struct.pack("<i", len(filled)) + filled.astype("<u8").tobytes())
+        with open(path, "wb") as f:
+            writer = BgzfWriter(f, threads=1)
+            writer.write(b"".join(out))
+            writer.close()
+
+def write_indexed(records, dest, columns=BED_COLUMNS):
+    """
+    Write sorted (chrom, start, end, line) records to `dest` as BGZF and
+    build `dest + ".tbi"` (`columns` only go into the index header). Header
+    records (chrom None) must come first. Both files appear only when complete.
+    """
+    index = _IndexBuilder()
+    records = iter(records)
+    u = 0
+    with open(dest + ".part", "wb") as f:
+        writer = BgzfWriter(f)
+        while True:
+            batch = list(islice(records, 100000))
+            if not batch:
+                break
+            data = [line.encode() for *_, line in batch]
+            sizes = np.fromiter(map(len, data), dtype=np.int64, count=len(data))
+            u_ends = u + np.cumsum(sizes)
+            u_begs = u_ends - sizes
+            keep = [i for i, r in enumerate(batch) if r[0] is not None]
+            if keep:
+                index.add([batch[i][0] for i in keep],
+                          np.array([batch[i][1] for i in keep], dtype=np.int64),
+                          np.array([batch[i][2] for i in keep], dtype=np.int64),
+                          u_begs[keep], u_ends[keep])
+            writer.write(b"".join(data))
+            u = int(u_ends[-1])
+        writer.close()
+    eof = writer.coffset  # where the EOF marker block starts
+    index.write(dest + ".tbi.part", writer.blocks, eof, columns, skip=0)
+    os.replace(dest + ".part", dest)
+    os.replace(dest + ".tbi.part", dest + ".tbi")
+    return dest
+
+def index_bed(path, columns=BED_COLUMNS, dest=None, chunk_lines=SORT_CHUNK_LINES):
+    """
+    Write a sorted, BGZF-compressed, tabix-indexed copy of a BED-like file
+    (`path + ".gz"` and `.gz.tbi` by default); `columns` are the 0-based
+    chromosome/start/end columns. Skipped when the copy is newer than `path`.
+    Returns the .gz path.
+    """
+    dest = dest or str(path) + ".gz"
+    if all(os.path.exists(p) and os.path.getmtime(p) >= os.path.getmtime(path) for p in (dest, dest + ".tbi")):
+        return dest
+    write_indexed(_sorted_records(path, columns, chunk_lines), dest, columns)
+    print(f"[INFO] Indexed {path} -> {dest} (+ .tbi)")
+    return dest
+
+# ---- reading ----
+
+class TabixFile:
+    """
+    Region queries over a BGZF file with a .tbi index (ours, or one made by
+    `tabix`). fetch(chrom, start, end) yields the lines overlapping the
+    0-based half-open region without reading the rest of the file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path + ".tbi", "rb") as f:
+            raw = _decompress(f.read())
+        if raw[:4] != b"TBI\1":
+            raise ValueError(f"{path}.tbi is not a tabix index")
+        n_ref, fmt, col_seq, col_beg, col_end, meta, skip, l_nm = struct.unpack_from("<8i", raw, 4)
+        self.columns = (col_seq - 1, col_beg - 1, (col_end or col_beg) - 1)
+        self.one_based = not fmt & TBX_UCSC
+        self.meta = chr(meta)
+        pos = 36
+        self.contigs = [n.decode() for n in raw[pos:pos + l_nm].split(b"\0")[:n_ref]]
+        pos += l_nm
+        self._refs = []
+        for _ in range(n_ref):
+            bins = {}
+            (n_bin,) = struct.unpack_from("<i", raw, pos)
+            pos += 4
+            for _ in range(n_bin):
+                b, n_chunk = struct.unpack_from("<Ii", raw, pos)
+                pos += 8
+                bins[b] = list(zip(*[iter(struct.unpack_from(f"<{2 * n_chunk}Q", raw, pos))] * 2))
+                pos += 16 * n_chunk
+            (n_intv,) = struct.unpack_from("<i", raw, pos)
+            linear = struct.unpack_from(f"<{n_intv}Q", raw, pos + 4)
+            pos += 4 + 8 * n_intv
+            self._refs.append((bins, linear))
+        self._tids = {name: i for i, name in enumerate(self.contigs)}
+        self._file = open(path, "rb")
+        self._buf = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self):
+        self._buf.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _chunks(self, tid, start, end):
+        bins, linear = self._refs[tid]
+        window = start >> MIN_SHIFT
+        min_off = linear[window] if window < len(linear) else (linear[-1] if linear else 0)
+        chunks = sorted((b, e) for bin_ in reg2bins(start, end) for b, e in bins.get(bin_, ()) if e > min_off)
+        merged = []
+        for b, e in chunks:
+            if merged and b <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], e)
+            else:
+                merged.append([max(b, min_off), e])
+        return merged
+
+    def _lines(self, beg, end):
+        """Lines that start at virtual offsets in [beg, end)."""
+        coff, pos = beg >> 16, beg & 0xffff
+        line_start, carry = beg, b""
+        while coff < len(self._buf):
+            data, bsize = read_block(self._buf, coff)
+            if not data:
+                return
+            while True:
+                nl = data.find(b"\n", pos)
+                if nl < 0:
+                    carry += data[pos:]
+                    break
+                if line_start >= end:
+                    return
+                yield carry + data[pos:nl]
+                carry, pos = b"", nl + 1
+                line_start = coff << 16 | pos if pos < len(data) else (coff + bsize) << 16
+            coff, pos = coff + bsize, 0
+
+    def fetch(self, chrom, start=0, end=MAX_POS):
+        """Yield the lines (without newline) overlapping [start, end) on `chrom`, in file order."""
+        tid = self._tids.get(chrom)
+        if tid is None or start >= end:
+            return
+        c, s, e = self.columns
+        width = max(self.columns) + 1
+        shift = 1 if self.one_based else 0
+        for beg_off, end_off in self._chunks(tid, start, end):
+            for raw in self._lines(beg_off, end_off):
+                line = raw.decode()
+                if line.startswith(self.meta):
+                    continue
+                fields = line.split("\t", width)
+                if fields[c] != chrom:
+                    continue
+                beg = int(fields[s]) - shift
+                if beg >= end:
+                    return  # sorted: nothing further can overlap
+                if max(int(fields[e]), beg + 1) > start:  # empty records count as 1 bp, as in tabix
+                    yield line
+
+def _decompress(buf):
+    """All the data of a BGZF file held in memory."""
+    out, offset = [], 0
+    while offset < len(buf):
+        data, bsize = read_block(buf, offset)
+        out.append(data)
+        offset += bsize
+    return b"".join(out)
@@ -0,0 +1,209 @@
+import random, time
+from email.utils import parsedate_to_datetime
+from threading import Lock
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from config.settings import (HTTP_STATUS_CODES, HTTP_RETRIES, HTTP_BACKOFF, HTTP_BACKOFF_MAX, HTTP_TIMEOUT,
+                             HTTP_MAX_PER_HOST, HTTP_CA_BUNDLES, MAX_BANDWIDTH, TRANSFER_BUFFER_MAX)
+
+# Retried: the 5xx codes we know about, plus 429 (rate limited)
+RETRY_STATUSES = frozenset(code for code in HTTP_STATUS_CODES if code >= 500) | {429}
+BUFFER_MIN = 64 * 1024  # smallest block iter_into() shrinks to on a slow link
+
+_session = None
+_lock = Lock()
+
+def session():
+    """
+    The process-wide requests.Session every downloader goes through.
+
+    Connections are pooled and kept alive per host. Each host gets at most
+    HTTP_MAX_PER_HOST connections; further requests to it wait for a free one
+    (pool_block), which also bounds how many transfers hit one server at a time.
+    """
+    global _session
+    with _lock:
+        if _session is None:
+            s = requests.Session()
+            adapter = HTTPAdapter(pool_connections=16, pool_maxsize=HTTP_MAX_PER_HOST, pool_block=True)
+            s.mount("https://", adapter)
+            s.mount("http://", adapter)
+            _session = s
+        return _session
+
+def backoff(attempt, retry_after=None):
+    """
+    Seconds to wait before retry number `attempt` (1-based): exponential with
+    full jitter, capped at HTTP_BACKOFF_MAX, but never less than a server's
+    Retry-After.
+    """
+    delay = random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF * 2 ** attempt))
+    return max(delay, retry_after or 0)
+
+def _retry_after(response):
+    """Retry-After header in seconds (delta-seconds or HTTP-date), or None."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def _verify(url, verify):
+    """Certificate check for `url`: the caller's choice, else the host's entry in HTTP_CA_BUNDLES."""
+    if verify is not None:
+        return verify
+    return HTTP_CA_BUNDLES.get(urlsplit(url).hostname, True)
+
+def request(method, url, retries=HTTP_RETRIES, **kwargs):
+    """
+    requests.request() through the shared session, retrying connection errors,
+    timeouts and RETRY_STATUSES with backoff(). The last response is returned
+    even if its status is still an error, so callers keep checking the status
+    as before. `timeout` defaults to HTTP_TIMEOUT and `verify` to the host's
+    HTTP_CA_BUNDLES entry.
+    """
+    kwargs.setdefault("timeout", HTTP_TIMEOUT)
+    kwargs["verify"] = _verify(url, kwargs.get("verify"))
+    host = urlsplit(url).hostname
+    for attempt in range(1, retries + 1):
+        try:
+            r = session().request(method, url, **kwargs)
+        except requests.exceptions.SSLError as e:
+            raise requests.exceptions.SSLError(
+                f"{e} (if {host} serves an incomplete certificate chain, add its CA bundle to HTTP_CA_BUNDLES)")
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt == retries:
+                raise
+            wait = backoff(attempt)
+            print(f"⚠️ {host}: {e.__class__.__name__}, retrying in {wait:.1f}s ({attempt}/{retries})")
+            time.sleep(wait)
+            continue
+        if r.status_code not in RETRY_STATUSES or attempt == retries:
+            return r
+        wait = backoff(attempt, _retry_after(r))
+        print(f"⚠️ {host}: HTTP {r.status_code}, retrying in {wait:.1f}s ({attempt}/{retries})")
+        r.close()
+        time.sleep(wait)
+
+class RateLimiter:
+    """Lets callers (from any thread) start at most one request every `interval` seconds."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._next = 0.0
+        self._lock = Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+class Bandwidth:
+    """
+    Token bucket shared by every transfer in the process. Each call to
+    consume() books its bytes in arrival order, so concurrent streams get equal
+    turns: a genome download can't starve a small file, and the total rate stays
+    under `rate` bytes/s (None = unlimited).
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or (rate or 0)  # up to one second's worth may go out at once
+        self._next = time.monotonic()
+        self._lock = Lock()
+
+    def consume(self, n):
+        if not self.rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(self._next, now)
+            self._next = start + n / self.rate
+            wait = self._next - now - self.burst / self.rate
+        if wait > 0:
+            time.sleep(wait)
+
+bandwidth = Bandwidth(MAX_BANDWIDTH)
+
+def throttle(n):
+    """Account `n` transferred bytes against the global MAX_BANDWIDTH budget (may sleep)."""
+    bandwidth.consume(n)
+
+class Body:
+    """
+    File-like reader over a streamed (stream=True) response body. When the
+    body needs no decoding (no Content-Encoding, which we ask for with
+    Accept-Encoding: identity), readinto() goes straight from the socket into
+    the caller's buffer through the http.client response under urllib3,
+    skipping urllib3's per-read copy; otherwise reads go through urllib3.
+    Once the body is read to the end the connection goes back to the pool.
+    """
+
+    def __init__(self, response):
+        self.response = response
+        fp = getattr(response.raw, "_fp", None)
+        encoding = response.headers.get("Content-Encoding", "identity").lower()
+        self._fp = fp if encoding in ("", "identity") and hasattr(fp, "readinto") else None
+
+    def _done(self):
+        if self._fp is not None:
+            self.response.raw.release_conn()
+
+    def readinto(self, b):
+        if self._fp is None:
+            data = self.response.raw.read(len(b), decode_content=True)
+            b[:len(data)] = data
+            n = len(data)
+        else:
+            n = self._fp.readinto(b)
+        if not n:
+            self._done()
+        return n
+
+    def read(self, n=-1):
+        amt = None if n < 0 else n
+        data = self.response.raw.read(amt, decode_content=True) if self._fp is None else self._fp.read(amt)
+        if not data or n < 0:
+            self._done()
+        return data
+
+def iter_into(response, max_size=TRANSFER_BUFFER_MAX):
+    """
+    Iterate over a streamed response body in large blocks: memoryviews of one
+    preallocated buffer, each valid until the next iteration (write, hash or
+    decompress it, don't keep it). Blocks are read with Body.readinto(). The
+    block size adapts between BUFFER_MIN and `max_size`: it doubles while
+    full blocks arrive in under 50 ms and halves when one takes over 0.5 s,
+    so a fast link costs a few Python iterations per GB and a slow one still
+    reports progress.
+    """
+    body = Body(response)
+    buf = memoryview(bytearray(max_size))
+    size = min(4 * BUFFER_MIN, max_size)
+    while True:
+        started = time.monotonic()
+        n = body.readinto(buf[:size])
+        if not n:
+            return
+        elapsed = time.monotonic() - started
+        yield buf[:n]
+        if n == size and elapsed < 0.05:
+            size = min(size * 2, max_size)
+        elif elapsed > 0.5:
+            size = max(size // 2, BUFFER_MIN)
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
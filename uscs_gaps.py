@@ -1,12 +1,159 @@
 import os
-import requests
+import re
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
-from config.settings import DATA_DIR
+from config.settings import DATA_DIR, UCSC_SHARDED, UCSC_SHARD_WORKERS, UCSC_SHARD_INTERVAL, DOWNLOAD_RETRIES
+from utils.logger import log_download_task, phase, add_bytes
+from utils.transport import RateLimiter, backoff, post, throttle
 
-def download_ucsc(filename="ucsc_refseq.tsv"):
+HGTABLES_URL = "https://genome.ucsc.edu/cgi-bin/hgTables"
+CHROMINFO_ZG11 = os.path.join(DATA_DIR, "ucsc_chrominfo", "chromInfo_zg11.txt")
+ERROR_MARKER = b"HGERROR-START"
+MAIN_CHROM = re.compile(r"chr([0-9]+|M)$")  # queried one by one; scaffolds go in one query
+
+def _query(db, track, table, output_type, region=None):
+    """hgTables form fields for one export (whole genome, or one chromosome range)."""
+    return {
+        "clade": "vertebrate",
+        "org": "Zebrafish",
+        "db": db,
+        "hgta_group": "genes",
+        "hgta_track": track,
+        "hgta_table": table,
+        "hgta_regionType": "range" if region else "genome",
+        "position": region or "",
+        "hgta_outputType": output_type,
+        "hgta_outFileName": "",
+        "boolshad.doNotRedirect": "1",
+        "boolshad.sendToGalaxy": "0",
+        "boolshad.sendToGreat": "0",
+        "hgta_doPrint": "get output",      # for actual output
+        "hgta_doTopSubmit": "get output"
+    }
+
+def _export(data, dest, bar=None):
+    """
+    POST one Table Browser query and stream the result into `dest` (via .part).
+    Raises if the response carries an HGERROR-START error page, checking across
+    chunk boundaries, so an error is never saved as data. Returns bytes received.
+    """
+    part = dest + ".part"
+    received, tail = 0, b""
+    with post(HGTABLES_URL, data=data, stream=True) as r:
+        r.raise_for_status()
+        with open(part, "wb") as f:
+            for chunk in r.iter_content(chunk_size=1 << 16):
+                if ERROR_MARKER in tail + chunk:
+                    raise Exception(f"UCSC Table Browser returned an error page for {data['position'] or 'genome'}")
+                tail = chunk[-len(ERROR_MARKER):]
+                f.write(chunk)
+                received += len(chunk)
+                throttle(len(chunk))
+                if bar is not None:
+                    bar.update(len(chunk))
+    os.replace(part, dest)
+    return received
+
+def _read_chrom_sizes(path):
+    with open(path) as f:
+        rows = [line.split("\t")[:2] for line in f if line.strip()]
+    return {chrom: int(size) for chrom, size in rows}
+
+def _sort_columns(header):
+    """Indexes of the chromosome and start columns in a Table Browser header line."""
+    names = header.lstrip("#").rstrip("\n").split("\t")
+    chrom = next((names.index(n) for n in ("chrom", "tName", "genoName") if n in names), 0)
+    start = next((names.index(n) for n in ("txStart", "chromStart", "tStart", "genoStart", "start") if n in names), 1)
+    return chrom, start
+
+def _merge_shards(shards, dest):
+    """
+    Concatenate exports into one table sorted by chromosome and start.
+    `shards` are (path, chromosomes whose rows are dropped) pairs.
+    """
+    header, parts = None, []
+    for path, drop in shards:
+        rows = []
+        with open(path) as f:
+            for line in f:
+                if line.startswith("#"):
+                    if header is None and "\t" in line:  # column names; an empty shard only has "# No results ..."
+                        header = line
+                elif line.strip():
+                    rows.append(line)
+        parts.append((rows, drop))
+    chrom, start = _sort_columns(header) if header else (0, 1)
+    rows = [line for part, drop in parts for line in part if not drop or line.split("\t")[chrom] not in drop]
+
+    def key(line):
+        fields = line.split("\t")
+        return fields[chrom], int(fields[start]) if fields[start].isdigit() else 0
+
+    rows.sort(key=key)
+    with open(dest + ".part", "w") as out:
+        if header:
+            out.write(header)
+        out.writelines(rows)
+    os.replace(dest + ".part", dest)
+    return len(rows)
+
+def download_sharded(filepath, db="danRer11", track="ncbiRefSeq", table="ncbiRefSeq", output_type="allFields",
+                     workers=UCSC_SHARD_WORKERS, interval=UCSC_SHARD_INTERVAL, retries=DOWNLOAD_RETRIES):
+    """
+    Export a table one main chromosome at a time (`position` = chrN:1-size,
+    for the MAIN_CHROM names in chromInfo_zg11.txt) plus a single genome-wide
+    query for the small scaffolds, whose rows on the main chromosomes are
+    dropped when merging. Up to `workers` queries are in flight and at most
+    one starts every `interval` seconds. Failed shards (HTTP errors,
+    HGERROR-START pages) are retried on their own; finished shards are kept in
+    `<filepath>.shards/` so a rerun only asks for the missing ones.
+    """
+    if not os.path.exists(CHROMINFO_ZG11):
+        raise Exception(f"{CHROMINFO_ZG11} not found; run the WGET step first")
+    sizes = _read_chrom_sizes(CHROMINFO_ZG11)
+    shard_dir = filepath + ".shards"
+    os.makedirs(shard_dir, exist_ok=True)
+    limiter = RateLimiter(interval)
+
+    # largest chromosomes first, so the long queries don't end up last
+    main = sorted((c for c in sizes if MAIN_CHROM.match(c)), key=sizes.get, reverse=True)
+    shards = [(chrom, f"{chrom}:1-{sizes[chrom]}", ()) for chrom in main]
+    if len(main) < len(sizes):
+        shards.append(("_scaffolds", None, set(main)))
+
+    def fetch_shard(shard):
+        name, region, drop = shard
+        dest = os.path.join(shard_dir, name + ".tsv")
+        if os.path.exists(dest):
+            return dest, drop, 0
+        for attempt in range(1, retries + 1):
+            limiter.wait()
+            try:
+                return dest, drop, _export(_query(db, track, table, output_type, region), dest, bar)
+            except Exception as e:
+                print(f"⚠️ Shard {name}, attempt {attempt}/{retries} failed: {e}")
+                if attempt < retries:
+                    time.sleep(backoff(attempt))
+        raise Exception(f"shard {name} failed after {retries} attempts")
+
+    print(f"⏳ Exporting {table} from {db} as {len(shards)} shards ({workers} in flight, {interval:g}s apart)...")
+    with phase("transfer"), tqdm(unit="B", unit_scale=True, desc=table) as bar, \
+         ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(fetch_shard, shards))
+    add_bytes(sum(n for *_, n in results))
+
+    with phase("post_process"):
+        n_rows = _merge_shards([(path, drop) for path, drop, _ in results], filepath)
+    shutil.rmtree(shard_dir)
+    return n_rows
+
+@log_download_task(script_name="uscs_gaps.py")
+def download_ucsc(filename="ucsc_refseq.tsv", track="ncbiRefSeq", table="ncbiRefSeq", output_type="allFields",
+                  sharded=UCSC_SHARDED):
     """Downloads NCBI RefSeq All table for Zebrafish from UCSC Table Browser."""
 
-    url = "https://genome.ucsc.edu/cgi-bin/hgTables"
     target_dir = os.path.join(DATA_DIR, "ucsc")
     os.makedirs(target_dir, exist_ok=True)
     filepath = os.path.join(target_dir, filename)
@@ -15,34 +162,14 @@ def download_ucsc(filename="ucsc_refseq.tsv"):
         print(f"✅ UCSC RefSeq data already exists at {filepath}")
         return filepath
 
-    data = {
-    "clade": "vertebrate",
-    "org": "Zebrafish",
-    "db": "danRer11",
-    "hgta_group": "genes",
-    "hgta_track": "ncbiRefSeq",
-    "hgta_table": "ncbiRefSeq",
-    "hgta_regionType": "genome",
-    "position": "",
-    "hgta_outputType": "allFields",
-    "hgta_outFileName": filename,
-    "boolshad.doNotRedirect": "1",
-    "boolshad.sendToGalaxy": "0",
-    "boolshad.sendToGreat": "0",
-    "hgta_doPrint": "get output",      # for actual output
-    "hgta_doTopSubmit": "get output"
-}
-
+    if sharded:
+        n_rows = download_sharded(filepath, track=track, table=table, output_type=output_type)
+        print(f"✅ UCSC {table} ({n_rows} rows, sorted) downloaded to {filepath}")
+        return filepath
 
     print("⏳ Downloading UCSC NCBI RefSeq table for Zebrafish...")
-    r = requests.post(url, data=data, stream=True)
-    r.raise_for_status()
-
-    total = int(r.headers.get("content-length", 0))
-    with open(filepath, "wb") as f, tqdm(total=total, unit="B", unit_scale=True) as bar:
-        for chunk in r.iter_content(chunk_size=8192):
-            f.write(chunk)
-            bar.update(len(chunk))
+    with phase("transfer"), tqdm(unit="B", unit_scale=True) as bar:
+        add_bytes(_export(_query("danRer11", track, table, output_type), filepath, bar))
 
     print(f"✅ UCSC RefSeq data downloaded to {filepath}")
     return filepath
@@ -1,46 +1,86 @@
+import shutil
 from pathlib import Path
-import urllib.request
-import pandas as pd
+from config.settings import SPECIES, DEFAULT_SPECIES, ENABLED_SPECIES, TABIX_OUTPUTS
+from utils.build_state import record, up_to_date
+from utils.dwnld import fetch
+from utils.http_cache import is_fresh
+from utils.logger import log_download_task, phase
+from utils.matrix import url
 
 # Constants
-URL = "https://hgdownload.soe.ucsc.edu/goldenPath/danRer11/bigZips/danRer11.chrom.sizes"
 TARGET_DIR = Path("data/ucsc_chrominfo")
-TARGET_DIR.mkdir(parents=True, exist_ok=True)
 
-ORIG_FILE = TARGET_DIR / "danRer11.chrom.sizes"
-CHROMINFO_TXT = TARGET_DIR / "chromInfo.txt"
-CHROMINFO_ZG11 = TARGET_DIR / "chromInfo_zg11.txt"
-ADD_CHROM_BED = TARGET_DIR / "add_chrom.bed"
+def chrominfo_paths(species=DEFAULT_SPECIES):
+    """
+    Files for one species. The default species keeps the original layout
+    directly in TARGET_DIR; others get a subdirectory named after their UCSC assembly.
+    """
+    info = SPECIES[species]
+    target = TARGET_DIR if species == DEFAULT_SPECIES else TARGET_DIR / info["ucsc"]
+    return {
+        "url": url(species, "chrom_sizes"),
+        "dir": target,
+        "orig": target / f"{info['ucsc']}.chrom.sizes",
+        "txt": target / "chromInfo.txt",
+        "labeled": target / f"chromInfo_{info['label']}.txt",
+        "add_chrom": target / "add_chrom.bed",
+    }
 
-def download_chrominfo():
-    if all(f.exists() for f in [CHROMINFO_TXT, CHROMINFO_ZG11, ADD_CHROM_BED]):
-        print("[✔] All files already exist.")
-        return
+_default = chrominfo_paths()
+URL = _default["url"]
+ORIG_FILE = _default["orig"]
+CHROMINFO_TXT = _default["txt"]
+CHROMINFO_ZG11 = _default["labeled"]
+ADD_CHROM_BED = _default["add_chrom"]
 
-    if not ORIG_FILE.exists():
-        print("Downloading danRer11.chrom.sizes...")
-        urllib.request.urlretrieve(URL, ORIG_FILE)
-    else:
-        print("[✔] danRer11.chrom.sizes already exists/downloaded.")
+def _index(add_chrom):
+    """Sorted, bgzipped + .tbi copy of add_chrom.bed (skipped while it is newer than the .bed)."""
+    if TABIX_OUTPUTS:
+        from utils.tabix import index_bed  # pulls in numpy; keep importing this module cheap
+        index_bed(add_chrom)
 
-    # Rename/move to chromInfo.txt and chromInfo_zg11.txt
-    if not CHROMINFO_TXT.exists():
-        ORIG_FILE.rename(CHROMINFO_TXT)
-        print("Renamed to chromInfo.txt")
+@log_download_task(script_name="wget.py")
+def download_chrominfo(species=DEFAULT_SPECIES):
+    """
+    Download chrom.sizes and derive chromInfo.txt, chromInfo_<label>.txt and
+    add_chrom.bed from it. The download is kept, so the derived files are only
+    rewritten when UCSC publishes a changed chrom.sizes.
+    """
+    p = chrominfo_paths(species)
+    orig, txt, labeled, add_chrom = p["orig"], p["txt"], p["labeled"], p["add_chrom"]
+    p["dir"].mkdir(parents=True, exist_ok=True)
+    if is_fresh(p["url"], [str(orig)]):
+        print(f"[✔] {orig.name} already exists/downloaded.")
     else:
-        print("chromInfo.txt already exists.")
+        print(f"Downloading {orig.name}...")
+        if not fetch(p["url"], str(orig)):
+            raise Exception(f"Failed to download {p['url']}")
 
-    if not CHROMINFO_ZG11.exists():
-        CHROMINFO_TXT.rename(CHROMINFO_ZG11)
-        print("Renamed to chromInfo_zg11.txt")
-    else:
-        print("file chromInfo_zg11.txt already exists.")
+    step, outputs = f"chrominfo {species}", [str(txt), str(labeled), str(add_chrom)]
+    if up_to_date(step, [str(orig)], outputs=outputs):
+        print("[✔] All files already exist.")
+        _index(add_chrom)
+        return
 
+    # Copy to chromInfo.txt and chromInfo_<label>.txt
+    shutil.copyfile(orig, txt)
+    shutil.copyfile(orig, labeled)
+    print(f"Copied to {txt.name} and {labeled.name}")
 
     print("Creating add_chrom.bed...")
-    df = pd.read_csv(CHROMINFO_ZG11, sep="\t", header=None, names=["chrom", "end"])
+    with phase("post_process"):
+        import pandas as pd  # only needed here; keeps importing this module cheap
+        df = pd.read_csv(labeled, sep="\t", header=None, names=["chrom", "end"])
+
+        # insertingg start column at index 1
+        df.insert(1, "start", 0)  
+        df.to_csv(add_chrom, sep="\t", index=False, header=False)
+        _index(add_chrom)
+    record(step, [str(orig)], outputs=outputs)
+    print(f"Created file {add_chrom} under data dir")
 
-    # insertingg start column at index 1
-    df.insert(1, "start", 0)  
-    df.to_csv(ADD_CHROM_BED, sep="\t", index=False, header=False)
-    print("Created file add_chrom.bed under data dir")
+@log_download_task(script_name="wget.py")
+def download_all():
+    """chrom.sizes / chromInfo / add_chrom.bed for every species in ENABLED_SPECIES."""
+    for species in ENABLED_SPECIES:
+        download_chrominfo(species)